@@ -1,27 +1,39 @@
-import requests  # 导入requests库，用于发送HTTP请求获取加密货币数据
+import time  # 导入time库，用于计时
+_STARTUP_T0 = time.perf_counter()  # 模块开始导入的时间，启动时间线的起点
+import importlib  # 按需导入较重的模块
+import functools  # 装饰器 (界面刷新计时)
 import json  # 导入json库，用于处理JSON格式数据
 import sys  # 导入sys库，用于访问Python解释器相关的变量和函数
 import os  # 导入os库，用于与操作系统交互，如文件路径操作
 import ctypes  # 导入ctypes库，用于调用底层C语言库函数
 import logging  # 导入logging库，用于记录程序运行日志
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener  # 日志轮转和后台写入
+import atexit  # 退出时写完队列中的日志
 from datetime import datetime, timedelta  # 从datetime模块导入datetime类和timedelta类，用于日期和时间处理
-from threading import Thread, Lock  # 从threading模块导入Thread和Lock，用于多线程编程
-from dotenv import load_dotenv  # 从dotenv导入load_dotenv函数，用于加载环境变量
-from dateutil import parser  # 导入dateutil的parser模块，用于更强大的日期解析功能
-import winreg as reg
+from threading import Thread, Lock, Condition, Event, active_count as threading_active_count  # 从threading模块导入Thread和Lock，用于多线程编程
 import copy # <--- 添加导入
 from PySide6.QtGui import QCloseEvent # Import QCloseEvent for closeEvent override
 import traceback # Ensure traceback is imported
 import re # 导入正则表达式库
-from bs4 import BeautifulSoup # 导入 BeautifulSoup
-from queue import Queue # 添加 Queue 用于线程间通信
+from concurrent.futures import ThreadPoolExecutor, wait # 用于并发发送请求
+from array import array # 紧凑的数值数组 (搜索索引倒排表)
+from bisect import bisect_left # 有序表二分查找
 import argparse # 导入 argparse
+import mmap # 内存映射紧凑代币目录
+import struct # 紧凑代币目录的二进制头部
+import math # 校验守护进程的数值参数
+import hashlib # 紧凑代币目录记录源列表的内容摘要
+import sqlite3 # 本地价格时间序列存储
+import random # 退避抖动
+from queue import Queue, Empty # 价格存储写入线程的队列
+from urllib.parse import urlsplit, parse_qs # 用于解析 URL 的源站 (预连接) 和守护进程的查询参数
 
 # 导入PySide6库中的Qt组件，用于创建图形用户界面
 from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
-                             QHBoxLayout, QLabel, QPushButton, QCheckBox, QToolTip, QMessageBox)
-from PySide6.QtCore import Qt, QTimer, Signal, Slot  # 导入Qt核心组件
-from PySide6.QtGui import QColor, QFont, QMouseEvent, QIcon  # 导入Qt图形界面组件
+                             QHBoxLayout, QLabel, QPushButton, QCheckBox, QToolTip, QMessageBox,
+                             QDialog, QLineEdit, QListView, QListWidget, QListWidgetItem, QMenu)
+from PySide6.QtCore import Qt, QTimer, Signal, Slot, QAbstractListModel, QModelIndex  # 导入Qt核心组件
+from PySide6.QtGui import QColor, QFont, QMouseEvent, QIcon, QPainter, QPainterPath, QPen, QPalette, QShortcut, QKeySequence  # 导入Qt图形界面组件
 
 # 如果是Windows，导入win32gui用于直接操作窗口
 if sys.platform == 'win32':
@@ -35,6 +47,62 @@ if sys.platform == 'win32':
 else:
     HAS_WIN32API = False
 
+# 注册表只在 Windows 上存在 (开机自启动)，其他平台上不导入
+if sys.platform == 'win32':
+    import winreg as reg
+else:
+    reg = None
+
+
+class _LazyModule:
+    """模块的延迟导入代理：第一次访问属性时才真正导入，避免较重的模块拖慢窗口首次绘制"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            module = self._module = importlib.import_module(self._name)
+        return getattr(module, attr)
+
+
+# 首次请求时才导入 (通常发生在抓取线程中)；无界面模式用到的 http.server/socketserver 在 PriceDaemon 中导入
+# 注意：通过 importlib 导入的模块 PyInstaller 无法静态识别，打包时需要 --hidden-import (见 build_exe.bat)
+requests = _LazyModule('requests')  # HTTP 请求
+asyncio = _LazyModule('asyncio')  # 抓取引擎的事件循环 (在引擎线程中导入)
+
+
+class StartupTimeline:
+    """启动时间线：记录各启动阶段 (导入、配置、UI、首次绘制、首次数据) 距模块开始导入的毫秒数"""
+
+    def __init__(self, origin):
+        self.origin = origin
+        self.marks = []  # [(阶段名, 距起点的毫秒数)]
+
+    def mark(self, name):
+        """记录一个阶段的完成时间；同名阶段只记录第一次"""
+        if any(mark_name == name for mark_name, _ in self.marks):
+            return None
+        elapsed = (time.perf_counter() - self.origin) * 1000
+        self.marks.append((name, elapsed))
+        logging.debug('Startup timeline: %s at %.0f ms', name, elapsed)
+        return elapsed
+
+    def summary(self):
+        """返回 "阶段 累计ms (+本阶段ms)" 形式的一行摘要"""
+        parts = []
+        previous = 0.0
+        for name, elapsed in self.marks:
+            parts.append(f"{name} {elapsed:.0f} ms (+{elapsed - previous:.0f})")
+            previous = elapsed
+        return ", ".join(parts)
+
+
+STARTUP_TIMELINE = StartupTimeline(_STARTUP_T0)
+STARTUP_TIMELINE.mark('imports')
+
 """
 加密货币价格监控器
 主要功能:
@@ -48,8 +116,110 @@ else:
 # 日志配置
 # ===================================
 
-def setup_logger(log_level_str='INFO'): # 添加参数并设置默认值
-    """配置日志记录器，用于记录程序运行过程中的信息"""
+LOG_DIR = None  # 日志目录 (由 setup_logger 确定；性能剖析结果也写在这里)
+_LOG_LISTENER = None  # 后台写日志的 QueueListener (由 setup_logger 创建)
+
+
+class RotatingLogFileHandler(RotatingFileHandler):
+    """按大小或时间轮转的日志文件：超过 max_bytes 或写满 rotate_interval 秒后改名为 .1、.2 …
+
+    最多保留 backup_count 个旧文件；修改时间超过 retention_days 天的旧文件，以及旧版本每次启动
+    生成的 bera_helper_<时间>.log (只保留最新的 backup_count 个)，在启动和每次轮转时删除。
+    与 TimedRotatingFileHandler 一样，以已有日志文件的修改时间作为时间轮转的起点。
+    """
+
+    LEGACY_PATTERN = re.compile(r'^bera_helper_\d{8}_\d{6}\.log$')
+
+    def __init__(self, filename, max_bytes=0, rotate_interval=0, backup_count=7, retention_days=0):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=max(1, backup_count), encoding='utf-8')
+        self.rotate_interval = rotate_interval
+        self.retention_days = retention_days
+        self.rollover_at = None
+        if rotate_interval > 0:
+            start = os.path.getmtime(filename) if os.path.getsize(filename) > 0 else time.time()
+            self.rollover_at = start + rotate_interval
+        self.prune()
+
+    def shouldRollover(self, record):
+        if self.rollover_at is not None and time.time() >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        if self.rollover_at is not None:
+            self.rollover_at = time.time() + self.rotate_interval
+        self.prune()
+
+    def prune(self):
+        """删除过期的旧日志文件和旧版本的逐次启动日志"""
+        log_dir, base_name = os.path.split(self.baseFilename)
+        cutoff = time.time() - self.retention_days * 86400 if self.retention_days > 0 else None
+        legacy = []
+        try:
+            for entry in os.scandir(log_dir):
+                if self.LEGACY_PATTERN.match(entry.name):
+                    legacy.append((entry.stat().st_mtime, entry.path))
+                elif cutoff is not None and entry.name.startswith(base_name + '.') and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            legacy.sort(reverse=True)
+            for index, (mtime, path) in enumerate(legacy):
+                if index >= self.backupCount or (cutoff is not None and mtime < cutoff):
+                    os.remove(path)
+        except OSError as e:
+            # 在日志处理器内部不能再写日志 (会重入)；窗口版没有控制台，sys.stderr 为 None
+            if sys.stderr is not None:
+                sys.stderr.write(f"Failed to prune old log files in {log_dir}: {e}\n")
+
+
+class JsonLineFormatter(logging.Formatter):
+    """紧凑的结构化日志格式：每条记录一行 JSON (ts、level、thread、msg，有异常时附带 exc)"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+        }
+        if record.name != 'root':
+            entry['logger'] = record.name
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, separators=(',', ':'))
+
+
+class _LogQueueHandler(QueueHandler):
+    """只在调用线程中合并日志参数 (参数对象之后可能被修改)，格式化和写文件都交给后台线程"""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _read_logging_config():
+    """读取配置文件中的 logging 部分 (日志系统在其他配置之前初始化)；读取失败时返回空字典"""
+    try:
+        with open(resource_path('bera_helper_config.json'), 'r', encoding='utf-8') as f:
+            return json.load(f).get('logging', {})
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+
+def setup_logger(log_level_str='INFO', log_format=None): # 添加参数并设置默认值
+    """配置日志记录器，用于记录程序运行过程中的信息
+
+    日志记录只在调用线程中放入队列，由 QueueListener 的后台线程格式化并写入轮转日志文件和控制台。
+    log_format 为 'text' 或 'jsonl' (默认取配置中的 logging.format)。
+    """
+    global LOG_DIR, _LOG_LISTENER
 
     # 将字符串级别转换为 logging 级别常量
     log_level_str_upper = log_level_str.upper()
@@ -89,30 +259,41 @@ def setup_logger(log_level_str='INFO'): # 添加参数并设置默认值
             if not os.path.exists(log_dir_base):
                 os.makedirs(log_dir_base, exist_ok=True) # exist_ok=True 避免目录已存在时报错
                 logging.info(f"Created log directory: {log_dir_base}") # Changed to English
+            LOG_DIR = log_dir_base
+
+            # 固定文件名的轮转日志 (不再每次启动新建一个带时间戳的文件)
+            log_config = _read_logging_config()
+            log_format = log_format or log_config.get('format', 'text')
+            log_file = os.path.join(log_dir_base, 'bera_helper.jsonl' if log_format == 'jsonl' else 'bera_helper.log') # 确保使用绝对路径
+            file_handler = RotatingLogFileHandler(
+                log_file,
+                max_bytes=int(log_config.get('max_bytes', 5 * 1024 * 1024)),
+                rotate_interval=float(log_config.get('rotate_hours', 24)) * 3600,
+                backup_count=int(log_config.get('backup_count', 7)),
+                retention_days=float(log_config.get('retention_days', 14)),
+            )
 
-            # 获取当前时间作为日志文件名
-            current_time = datetime.now().strftime('%Y%m%d_%H%M%S')
-            log_file = os.path.join(log_dir_base, f'bera_helper_{current_time}.log') # 确保使用绝对路径
-
-            # 配置日志格式
-            log_format = '%(asctime)s [%(levelname)s] %(message)s'
-            date_format = '%Y-%m-%d %H:%M:%S'
+            # 配置日志格式 (控制台始终为文本)
+            text_formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s', '%Y-%m-%d %H:%M:%S')
+            file_handler.setFormatter(JsonLineFormatter() if log_format == 'jsonl' else text_formatter)
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(text_formatter)
 
             # --- 保留: 重置日志系统 ---
             root_logger = logging.getLogger()
             for handler in root_logger.handlers[:]:
                 root_logger.removeHandler(handler)
-
-            # 配置根日志记录器
-            logging.basicConfig(
-                level=log_level, # <-- 使用传入的日志级别
-                format=log_format,
-                datefmt=date_format,
-                handlers=[
-                    logging.FileHandler(log_file, encoding='utf-8'),
-                    logging.StreamHandler()
-                ]
-            )
+            if _LOG_LISTENER is not None:
+                _LOG_LISTENER.stop()
+                atexit.unregister(_LOG_LISTENER.stop)
+
+            # 根日志记录器只把记录放入队列，由后台线程写文件和控制台
+            log_queue = Queue()
+            _LOG_LISTENER = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+            _LOG_LISTENER.start()
+            atexit.register(_LOG_LISTENER.stop)  # 退出前写完队列中剩余的日志
+            root_logger.addHandler(_LogQueueHandler(log_queue))
+            root_logger.setLevel(log_level) # <-- 使用传入的日志级别
 
             # 设置第三方库的日志级别为WARNING，以减少日志输出量
             # 可选择的日志级别包括：
@@ -152,7 +333,7 @@ def resource_path(relative_path):
     try:
         # PyInstaller创建临时文件夹，将路径存储在_MEIPASS中
         base_path = sys._MEIPASS  # 尝试获取PyInstaller打包后的临时文件夹路径
-        logging.debug(f"Using PyInstaller path: {base_path}") # Changed to English
+        logging.debug('Using PyInstaller path: %s', base_path) # Changed to English
     except Exception:
         # 如果不是打包环境，尝试多种可能的路径
         # 1. 当前文件所在目录
@@ -164,20 +345,2747 @@ def resource_path(relative_path):
                 # 3. 可执行文件所在目录
                 base_path = os.path.dirname(os.path.abspath(sys.argv[0]))
                 
-        logging.debug(f"Using non-packaged environment path: {base_path}") # Changed to English
+        logging.debug('Using non-packaged environment path: %s', base_path) # Changed to English
     
     result_path = os.path.join(base_path, relative_path)
-    logging.debug(f"Resource path resolved: {relative_path} -> {result_path}") # Changed to English
+    logging.debug('Resource path resolved: %s -> %s', relative_path, result_path) # Changed to English
     return result_path  # 返回资源的绝对路径
 
+def format_age(seconds):
+    """把秒数格式化为简短的时长文本 (如 45s、12m、3h、2d)"""
+    seconds = max(0, int(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m"
+    if seconds < 86400:
+        return f"{seconds // 3600}h"
+    return f"{seconds // 86400}d"
+
+# ===================================
+# 运行指标
+# ===================================
+
+class MetricsRegistry:
+    """进程内的运行指标：计数器、瞬时值和直方图 (固定桶)，以及抓取时才计算的采集函数
+
+    标签以关键字参数传入；所有方法都可在任意线程中调用。可导出为 Prometheus 文本格式，
+    也可生成供统计浮层和 /stats 使用的字典。
+    """
+
+    DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)  # 秒
+
+    def __init__(self):
+        self._lock = Lock()
+        self._meta = {}  # 指标名 -> (类型, 说明)
+        self._buckets = {}  # 直方图指标名 -> 桶上界
+        self._values = {}  # (指标名, 标签) -> 计数器/瞬时值
+        self._histograms = {}  # (指标名, 标签) -> [各桶计数..., 总和, 总数]
+        self._collectors = []  # 抓取时调用，返回 [(指标名, 标签字典, 值)]
+
+    def counter(self, name, help_text):
+        self._meta[name] = ('counter', help_text)
+
+    def gauge(self, name, help_text):
+        self._meta[name] = ('gauge', help_text)
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self._meta[name] = ('histogram', help_text)
+        self._buckets[name] = tuple(buckets)
+
+    def inc(self, name, value=1, **labels):
+        """计数器加 value (瞬时值也可用负数增减)"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._values[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        """把一次观测值 (通常是秒) 记入直方图"""
+        bounds = self._buckets[name]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(bounds) + 1) + [0.0, 0]
+            histogram[bisect_left(bounds, value)] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def add_collector(self, collector):
+        """注册采集函数：每次导出时调用，返回 [(指标名, 标签字典, 值)]，用于数据年龄、并发数等按需计算的值"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def remove_collector(self, collector):
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+
+    def _collect(self):
+        """返回 (计数器/瞬时值, 直方图) 的副本，采集函数的结果并入前者"""
+        with self._lock:
+            values = dict(self._values)
+            histograms = {key: list(histogram) for key, histogram in self._histograms.items()}
+            collectors = list(self._collectors)
+        for collector in collectors:
+            try:
+                for name, labels, value in collector():
+                    values[(name, tuple(sorted(labels.items())))] = value
+            except Exception as e:
+                logging.debug('Metrics collector %s failed: %s', collector, e)
+        return values, histograms
+
+    def quantile(self, histogram, q, bounds):
+        """按桶线性插值估算分位数 (与 Prometheus histogram_quantile 相同)；没有观测值时返回 None"""
+        total = histogram[-1]
+        if not total:
+            return None
+        rank = q * total
+        cumulative = 0
+        for index, count in enumerate(histogram[:-2]):
+            if cumulative + count >= rank and count:
+                lower = bounds[index - 1] if index > 0 else 0.0
+                if index == len(bounds):
+                    return lower  # 落在 +Inf 桶中：只能给出最后一个有限上界
+                return lower + (bounds[index] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return bounds[-1]
+
+    def snapshot(self):
+        """返回所有指标的字典 {指标名: [{'labels': {...}, 'value': 值}]}；直方图给出次数、平均值、p50 和 p95"""
+        values, histograms = self._collect()
+        result = {}
+        for (name, labels), value in sorted(values.items()):
+            result.setdefault(name, []).append({'labels': dict(labels), 'value': value})
+        for (name, labels), histogram in sorted(histograms.items()):
+            bounds = self._buckets[name]
+            result.setdefault(name, []).append({
+                'labels': dict(labels),
+                'count': histogram[-1],
+                'mean': histogram[-2] / histogram[-1] if histogram[-1] else None,
+                'p50': self.quantile(histogram, 0.5, bounds),
+                'p95': self.quantile(histogram, 0.95, bounds),
+            })
+        return result
+
+    @staticmethod
+    def _format_labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+        return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+    def render_prometheus(self):
+        """导出为 Prometheus 文本格式 (text/plain; version=0.0.4)"""
+        values, histograms = self._collect()
+        by_name = {}
+        for (name, labels), value in values.items():
+            by_name.setdefault(name, []).append((labels, value))
+        for (name, labels), histogram in histograms.items():
+            by_name.setdefault(name, []).append((labels, histogram))
+
+        lines = []
+        for name in sorted(by_name):
+            metric_type, help_text = self._meta.get(name, ('untyped', ''))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in sorted(by_name[name], key=lambda item: item[0]):
+                if metric_type != 'histogram':
+                    lines.append(f"{name}{self._format_labels(labels)} {float(value):g}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(self._buckets[name] + ('+Inf',), value[:-2]):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else f"{bound:g}"
+                    lines.append(f"{name}_bucket{self._format_labels(labels, [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{self._format_labels(labels)} {value[-2]:g}")
+                lines.append(f"{name}_count{self._format_labels(labels)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+METRICS.histogram('bera_http_request_duration_seconds', 'Time until response headers, by endpoint')
+METRICS.counter('bera_http_requests_total', 'HTTP requests by endpoint and result (success, http_error, rate_limited, network_error, throttled, offline)')
+METRICS.counter('bera_http_response_bytes_total', 'Response body bytes read, by endpoint')
+METRICS.gauge('bera_http_requests_in_flight', 'HTTP requests currently waiting for a response')
+METRICS.histogram('bera_fetch_job_duration_seconds', 'Fetch engine job duration, by job')
+METRICS.histogram('bera_ui_update_duration_seconds', 'Main-thread UI refresh duration, by section',
+                  buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
+METRICS.counter('bera_ui_widget_updates_total', 'Widget properties changed by price refreshes')
+METRICS.gauge('bera_price_data_age_seconds', 'Seconds since the displayed prices were fetched')
+METRICS.gauge('bera_fear_greed_age_seconds', 'Seconds since the cached Fear & Greed value was scraped')
+METRICS.gauge('bera_offline', '1 while in offline mode')
+METRICS.counter('bera_fetch_jobs_total', 'Fetch engine jobs by outcome')
+METRICS.gauge('bera_fetch_jobs_active', 'Fetch engine jobs currently running')
+METRICS.gauge('bera_threads', 'Live Python threads')
+METRICS.gauge('bera_rate_limit_blocked_seconds', 'Seconds until the rate limiter allows requests to a host again')
+METRICS.gauge('bera_rate_limit_factor', 'Effective request rate relative to the configured rate, by host')
+METRICS.gauge('bera_startup_phase_milliseconds', 'Startup timeline: milliseconds from module import to each phase')
+METRICS.add_collector(lambda: [('bera_threads', {}, threading_active_count())] +
+                      [('bera_startup_phase_milliseconds', {'phase': name}, elapsed) for name, elapsed in STARTUP_TIMELINE.marks])
+
+
+def timed_ui_update(section):
+    """装饰器：把主线程界面刷新的耗时记入 bera_ui_update_duration_seconds 直方图"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                METRICS.observe('bera_ui_update_duration_seconds', time.perf_counter() - start, section=section)
+        return wrapper
+    return decorator
+
+# ===================================
+# 性能剖析
+# ===================================
+
+class ProfileSession:
+    """按需性能剖析：在一段时间内同时采集 cProfile 统计和 tracemalloc 快照，结束时写入日志目录
+
+    cProfile 只剖析调用 start 的线程 (窗口模式下即界面线程，包括代币管理器的对话框循环)；
+    后台请求的耗时见运行指标。tracemalloc 覆盖所有线程，结束时输出内存占用最多的分配位置，
+    以及与开始时快照相比增长最多的分配位置。cProfile/pstats/tracemalloc 只在首次剖析时导入。
+    """
+
+    def __init__(self, output_dir, top=30, frames=1):
+        self.output_dir = output_dir
+        self.top = top  # 报告中列出的函数和分配位置数
+        self.frames = frames  # tracemalloc 每次分配保存的调用栈深度
+        self.profiler = None
+        self.baseline = None  # 开始时的 tracemalloc 快照
+        self.started_at = None
+        self._owns_tracemalloc = False  # tracemalloc 是否由本次剖析启动 (结束时只停止自己启动的)
+
+    @property
+    def running(self):
+        return self.profiler is not None
+
+    def start(self):
+        import cProfile
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._owns_tracemalloc = True
+        self.baseline = self._take_snapshot()
+        self.started_at = time.time()
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+        logging.info(f"Profiling started (cProfile + tracemalloc, {self.frames} frame(s) per allocation)")
+
+    def stop(self):
+        """停止剖析并写入 .pstats (可用 snakeviz 等工具打开) 和文本报告，返回报告路径"""
+        import tracemalloc
+        self.profiler.disable()
+        profiler, self.profiler = self.profiler, None
+        elapsed = time.time() - self.started_at
+        snapshot = self._take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+            self._owns_tracemalloc = False
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        prefix = os.path.join(self.output_dir, f"profile_{datetime.fromtimestamp(self.started_at).strftime('%Y%m%d_%H%M%S')}")
+        profiler.dump_stats(f"{prefix}.pstats")
+        report_path = f"{prefix}.txt"
+        with open(report_path, 'w', encoding='utf-8') as f:
+            f.write(f"Profile window: {datetime.fromtimestamp(self.started_at):%Y-%m-%d %H:%M:%S} "
+                    f"+ {elapsed:.1f}s\n")
+            f.write(f"Traced memory: current {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB\n\n")
+            self._write_cpu_report(f, profiler)
+            self._write_memory_report(f, snapshot)
+        self.baseline = None
+        logging.info(f"Profile written to {report_path} (raw stats: {prefix}.pstats)")
+        return report_path
+
+    def _take_snapshot(self):
+        import tracemalloc
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+        ))
+
+    def _write_cpu_report(self, f, profiler):
+        import pstats
+        f.write(f"=== CPU: top {self.top} functions by cumulative time ===\n")
+        stats = pstats.Stats(profiler, stream=f)
+        stats.sort_stats('cumulative').print_stats(self.top)
+        f.write(f"=== CPU: top {self.top} functions by own time ===\n")
+        stats.sort_stats('tottime').print_stats(self.top)
+
+    def _write_memory_report(self, f, snapshot):
+        f.write(f"=== Memory: top {self.top} allocation sites at the end of the window ===\n")
+        for stat in snapshot.statistics('lineno')[:self.top]:
+            f.write(f"{stat}\n")
+        f.write(f"\n=== Memory: top {self.top} allocation sites by change during the window ===\n")
+        for stat in snapshot.compare_to(self.baseline, 'lineno')[:self.top]:
+            if stat.size_diff == 0 and stat.count_diff == 0:
+                break
+            f.write(f"{stat}\n")
+
+
+# ===================================
+# 网络客户端
+# ===================================
+
+class _HttpxResponse:
+    """把 httpx.Response 包装成与 requests.Response 相同的接口，调用方无需区分后端"""
+
+    def __init__(self, response):
+        self._response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.url = str(response.url)
+
+    @property
+    def text(self):
+        return self._response.text
+
+    @property
+    def content(self):
+        return self._response.content
+
+    def json(self):
+        return self._response.json()
+
+    def iter_content(self, chunk_size=8192):
+        return self._response.iter_bytes(chunk_size)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+    def close(self):
+        self._response.close()
+
+
+class RateLimitedError(IOError):
+    """请求因限流被拒绝 (服务器返回 429，或本地限流器在允许的等待时间内拿不到令牌)
+
+    与 requests.RequestException 一样继承 IOError，但不依赖 requests，使其可以延迟导入；
+    需要同时处理两者的调用方应显式捕获 RateLimitedError。
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class OfflineError(RateLimitedError):
+    """处于离线模式，请求在本地被拒绝 (未发出)
+
+    处理方式与被限流相同：不代表代币 ID 失效，不拆分也不隔离，留到恢复在线后再请求。
+    """
+
+
+class RateLimiter:
+    """按源站共享的令牌桶限流器：所有经过 HttpClient 的请求先取令牌
+
+    根据 429/503 的 Retry-After 和 RateLimit 响应头暂停该源站的请求；没有提示时按指数退避 (带抖动)。
+    被限流时有效速率减半，之后每次成功响应逐步恢复。
+    """
+
+    BASE_BACKOFF = 2.0  # 首次退避(秒)
+    MAX_BACKOFF = 600.0  # 最长退避(秒)
+    MIN_RATE_FACTOR = 0.1  # 被限流后有效速率的下限 (相对配置速率)
+    RATE_RECOVERY = 0.1  # 每次成功响应恢复的速率比例
+
+    def __init__(self, per_minute=30, burst=5):
+        self.rate = max(per_minute, 1) / 60.0
+        self.burst = max(1, int(burst))
+        self._lock = Lock()
+        self._hosts = {}  # host -> 令牌桶状态
+
+    def _budget(self, host, now):
+        budget = self._hosts.get(host)
+        if budget is None:
+            budget = self._hosts[host] = {'tokens': float(self.burst), 'updated': now, 'blocked_until': 0.0,
+                                          'failures': 0, 'factor': 1.0}
+        return budget
+
+    def acquire(self, host, max_wait):
+        """取一个令牌，最多等待 max_wait 秒；等不到时抛出 RateLimitedError"""
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                budget = self._budget(host, now)
+                if now < budget['blocked_until']:
+                    delay = budget['blocked_until'] - now
+                else:
+                    rate = self.rate * budget['factor']
+                    budget['tokens'] = min(self.burst, budget['tokens'] + (now - budget['updated']) * rate)
+                    budget['updated'] = now
+                    if budget['tokens'] >= 1:
+                        budget['tokens'] -= 1
+                        return
+                    delay = (1 - budget['tokens']) / rate
+            if now + delay > deadline:
+                raise RateLimitedError(f"Rate limited by {host}, next request allowed in {delay:.1f}s", retry_after=delay)
+            time.sleep(delay)
+
+    def _backoff(self, failures):
+        # 指数退避 + 抖动 (一半固定、一半随机)，多个实例不会同时恢复请求
+        delay = min(self.BASE_BACKOFF * 2 ** (failures - 1), self.MAX_BACKOFF)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    @staticmethod
+    def _parse_retry_after(value):
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            from email.utils import parsedate_to_datetime  # HTTP 日期格式很少见，用到时才导入
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def on_response(self, host, status_code, headers):
+        """根据响应更新源站的限流状态；返回需要暂停的秒数 (未限流时为 0)"""
+        with self._lock:
+            now = time.monotonic()
+            budget = self._budget(host, now)
+            if status_code == 429 or status_code == 503 and 'Retry-After' in headers:
+                budget['failures'] += 1
+                budget['factor'] = max(self.MIN_RATE_FACTOR, budget['factor'] / 2)
+                delay = self._parse_retry_after(headers.get('Retry-After'))
+                if delay is None:
+                    delay = self._backoff(budget['failures'])
+            elif status_code >= 500:
+                budget['failures'] += 1
+                delay = self._backoff(budget['failures'])
+            else:
+                budget['failures'] = 0
+                budget['factor'] = min(1.0, budget['factor'] + self.RATE_RECOVERY)
+                delay = 0.0
+                # 服务器告知本窗口配额已用完时，暂停到窗口重置
+                remaining = headers.get('X-RateLimit-Remaining', headers.get('RateLimit-Remaining'))
+                reset = headers.get('X-RateLimit-Reset', headers.get('RateLimit-Reset'))
+                try:
+                    if remaining is not None and reset is not None and int(float(remaining)) <= 0:
+                        reset = float(reset)
+                        # 既有秒数也有 Unix 时间戳两种写法
+                        delay = min(max(0.0, reset - time.time() if reset > 1e9 else reset), self.MAX_BACKOFF)
+                except ValueError:
+                    pass
+            if delay > 0:
+                budget['blocked_until'] = max(budget['blocked_until'], now + delay)
+                budget['tokens'] = 0.0
+        if delay > 0 and status_code < 400:
+            logging.warning(f"Rate limit quota for {host} is used up, pausing requests to it for {delay:.1f}s")
+        elif delay > 0:
+            logging.warning(f"{host} responded HTTP {status_code}, pausing requests to it for {delay:.1f}s")
+        return delay
+
+    def on_error(self, host):
+        """连接失败、超时等网络错误：按指数退避暂停该源站"""
+        with self._lock:
+            now = time.monotonic()
+            budget = self._budget(host, now)
+            budget['failures'] += 1
+            delay = self._backoff(budget['failures'])
+            budget['blocked_until'] = max(budget['blocked_until'], now + delay)
+        logging.debug('Request to %s failed, backing off for %.1fs', host, delay)
+
+    def snapshot(self):
+        """返回各源站当前的限流状态 (用于日志和统计)"""
+        with self._lock:
+            now = time.monotonic()
+            return {host: {'tokens': round(b['tokens'], 2), 'blocked_for': round(max(0.0, b['blocked_until'] - now), 1),
+                           'failures': b['failures'], 'rate_factor': round(b['factor'], 2)}
+                    for host, b in self._hosts.items()}
+
+
+class ConnectivityMonitor:
+    """网络连通性判断：连续多次网络错误 (连接失败、超时，不含 HTTP 错误状态码) 后进入离线模式
+
+    离线期间 HttpClient 在本地直接拒绝请求，只按指数退避放行单个探测请求；任何源站有响应即恢复在线。
+    """
+
+    BASE_PROBE_INTERVAL = 15.0  # 进入离线后首次探测的间隔(秒)
+
+    def __init__(self, offline_after=2, max_probe_interval=300):
+        self.offline_after = max(1, int(offline_after))
+        self.max_probe_interval = max(self.BASE_PROBE_INTERVAL, float(max_probe_interval))
+        self.offline = False
+        self.offline_since = None  # 进入离线模式的时间 (Unix 时间戳)
+        self._failures = 0  # 连续网络错误次数
+        self._probes = 0  # 离线期间失败的探测次数
+        self._next_probe = 0.0  # 下次允许探测的 monotonic 时间
+        self._probing = False  # 是否有探测请求正在进行
+        self._lock = Lock()
+
+    def seconds_until_probe(self):
+        """离线时距下次探测的秒数 (在线时为 0)"""
+        with self._lock:
+            return max(0.0, self._next_probe - time.monotonic()) if self.offline else 0.0
+
+    def probe_due(self):
+        """在线，或离线但已到探测时间且没有正在进行的探测"""
+        with self._lock:
+            return not self.offline or (not self._probing and time.monotonic() >= self._next_probe)
+
+    def allow_request(self):
+        """是否放行一个请求，返回 (放行, 是否为探测请求)；离线时放行的请求即为探测请求，
+        结果须通过 on_success/on_network_error 告知，没有结果时 (未发出或其他异常) 必须调用 abort_probe"""
+        with self._lock:
+            if not self.offline:
+                return True, False
+            if self._probing or time.monotonic() < self._next_probe:
+                return False, False
+            self._probing = True
+            return True, True
+
+    def abort_probe(self):
+        """探测请求没有得到结果 (例如被限流器拒绝或发生非网络异常)，允许下一个请求重新探测"""
+        with self._lock:
+            self._probing = False
+
+    def on_success(self):
+        """收到任意 HTTP 响应：网络可达"""
+        with self._lock:
+            self._failures = 0
+            if not self.offline:
+                return
+            offline_for = time.time() - self.offline_since
+            self.offline = False
+            self.offline_since = None
+            self._probing = False
+            self._probes = 0
+        logging.info(f"Network connectivity restored after {offline_for:.0f}s offline")
+
+    def on_network_error(self):
+        """网络错误；返回是否处于离线模式"""
+        with self._lock:
+            self._failures += 1
+            now = time.monotonic()
+            if self.offline:
+                # 探测失败：推迟下次探测
+                self._probing = False
+                self._probes += 1
+                delay = min(self.BASE_PROBE_INTERVAL * 2 ** self._probes, self.max_probe_interval)
+                self._next_probe = now + delay
+                logging.debug('Connectivity probe failed, next probe in %.0fs', delay)
+                return True
+            if self._failures < self.offline_after:
+                return False
+            self.offline = True
+            self.offline_since = time.time()
+            self._probes = 0
+            self._next_probe = now + self.BASE_PROBE_INTERVAL
+        logging.warning(f"{self._failures} consecutive network errors, entering offline mode "
+                        f"(next connectivity probe in {self.BASE_PROBE_INTERVAL:.0f}s)")
+        return True
+
+    def snapshot(self):
+        """返回当前连通性状态 (用于日志和统计)"""
+        with self._lock:
+            return {'offline': self.offline, 'offline_since': self.offline_since,
+                    'consecutive_errors': self._failures, 'failed_probes': self._probes,
+                    'next_probe_in': round(max(0.0, self._next_probe - time.monotonic()), 1) if self.offline else 0.0}
+
+
+class HttpClient:
+    """所有网络请求共用的 HTTP 客户端 (keep-alive 连接池，可选 HTTP/2，支持预连接，共享限流预算和离线判断)"""
+
+    def __init__(self, pool_size=10, http2=False, rate_limiter=None, connectivity=None):
+        self.pool_size = max(1, int(pool_size))
+        self.rate_limiter = rate_limiter
+        self.connectivity = connectivity  # ConnectivityMonitor，None 表示不判断离线
+        self.http2 = False
+        self._session = None
+        self._session_lock = Lock()
+        self._httpx_client = None
+
+        if http2:
+            # HTTP/2 需要可选依赖 httpx[http2]，缺失时回退到 requests 连接池
+            try:
+                import httpx  # type: ignore
+                import h2  # type: ignore # noqa: F401
+                self._httpx = httpx
+                self._httpx_client = httpx.Client(
+                    http2=True,
+                    follow_redirects=True,
+                    limits=httpx.Limits(max_connections=self.pool_size,
+                                        max_keepalive_connections=self.pool_size)
+                )
+                self.http2 = True
+            except ImportError:
+                logging.warning("httpx[http2] is not installed, falling back to HTTP/1.1 keep-alive pool")
+
+        logging.info(f"HTTP client initialized: pool_size={self.pool_size}, http2={self.http2}")
+
+    def _requests_session(self):
+        """首次请求时才导入 requests 并创建连接池 (通常在抓取线程中)，不拖慢窗口首次绘制"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = requests.adapters.HTTPAdapter(pool_connections=self.pool_size,
+                                                            pool_maxsize=self.pool_size,
+                                                            max_retries=0)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+        return self._session
+
+    def get(self, url, params=None, headers=None, timeout=10, stream=False, max_wait=None):
+        """发送 GET 请求，复用连接池中的连接；网络错误统一抛出 requests.RequestException
+
+        启用限流时先从源站的令牌桶取令牌，最多等待 max_wait 秒 (默认等于 timeout)；
+        被限流 (包括服务器返回 429) 时抛出 RateLimitedError；离线模式下除探测请求外直接抛出 OfflineError。
+        """
+        parts = urlsplit(url)
+        host = parts.netloc
+        endpoint = host + parts.path  # 指标标签
+        connectivity = self.connectivity
+        probe = False
+        if connectivity is not None:
+            allowed, probe = connectivity.allow_request()
+            if not allowed:
+                METRICS.inc('bera_http_requests_total', endpoint=endpoint, result='offline')
+                raise OfflineError(f"Offline, request to {host} not sent (next connectivity probe in "
+                                   f"{connectivity.seconds_until_probe():.0f}s)",
+                                   retry_after=connectivity.seconds_until_probe())
+        try:
+            return self._send(url, params, headers, timeout, stream, max_wait, host, endpoint)
+        finally:
+            # 探测请求以任何方式结束 (包括非网络异常) 都要清除探测标记；已报告结果时标记已被清除，这里不产生影响
+            if probe:
+                connectivity.abort_probe()
+
+    def _send(self, url, params, headers, timeout, stream, max_wait, host, endpoint):
+        connectivity = self.connectivity
+        if self.rate_limiter is not None:
+            try:
+                self.rate_limiter.acquire(host, timeout if max_wait is None else max_wait)
+            except RateLimitedError:
+                METRICS.inc('bera_http_requests_total', endpoint=endpoint, result='throttled')
+                raise
+
+        METRICS.inc('bera_http_requests_in_flight')
+        start = time.perf_counter()
+        try:
+            if self._httpx_client is None:
+                response = self._requests_session().get(url, params=params, headers=headers, timeout=timeout, stream=stream)
+            else:
+                try:
+                    request = self._httpx_client.build_request('GET', url, params=params, headers=headers, timeout=timeout)
+                    response = _HttpxResponse(self._httpx_client.send(request, stream=stream))
+                except self._httpx.HTTPError as e:
+                    raise requests.RequestException(str(e)) from e
+        except requests.RequestException:
+            METRICS.inc('bera_http_requests_total', endpoint=endpoint, result='network_error')
+            # 离线期间由探测间隔控制重试，不再叠加该源站的退避
+            offline = connectivity is not None and connectivity.on_network_error()
+            if self.rate_limiter is not None and not offline:
+                self.rate_limiter.on_error(host)
+            raise
+        finally:
+            METRICS.inc('bera_http_requests_in_flight', -1)
+
+        METRICS.observe('bera_http_request_duration_seconds', time.perf_counter() - start, endpoint=endpoint)
+        status = response.status_code
+        METRICS.inc('bera_http_requests_total', endpoint=endpoint,
+                    result='rate_limited' if status == 429 else 'http_error' if status >= 400 else 'success')
+        if stream:
+            self._count_streamed_bytes(response, endpoint)
+        else:
+            METRICS.inc('bera_http_response_bytes_total', len(response.content), endpoint=endpoint)
+
+        if connectivity is not None:
+            connectivity.on_success()
+        if self.rate_limiter is not None:
+            delay = self.rate_limiter.on_response(host, response.status_code, response.headers)
+            if response.status_code == 429:
+                response.close()
+                raise RateLimitedError(f"HTTP 429 Too Many Requests from {host}, retrying after {delay:.1f}s",
+                                       retry_after=delay)
+        return response
+
+    @staticmethod
+    def _count_streamed_bytes(response, endpoint):
+        """流式响应：在调用方读取时累计字节数 (提前停止读取时只计入实际读取的部分)"""
+        iter_content = response.iter_content
+
+        def counting_iter_content(chunk_size=8192):
+            for chunk in iter_content(chunk_size):
+                METRICS.inc('bera_http_response_bytes_total', len(chunk), endpoint=endpoint)
+                yield chunk
+
+        response.iter_content = counting_iter_content
+
+    def warm_up(self, urls, timeout=5):
+        """对给定 URL 的源站预先建立连接 (DNS + TCP + TLS)，在后台线程中并行执行"""
+        origins = []
+        for url in urls:
+            parts = urlsplit(url)
+            origin = f"{parts.scheme}://{parts.netloc}/"
+            if parts.netloc and origin not in origins:
+                origins.append(origin)
+
+        def _connect(origin):
+            start = time.perf_counter()
+            try:
+                if self._httpx_client is not None:
+                    self._httpx_client.head(origin, timeout=timeout).close()
+                else:
+                    self._requests_session().head(origin, timeout=timeout).close()
+                logging.debug('Pre-connected to %s in %.1f ms', origin, (time.perf_counter() - start) * 1000)
+            except Exception as e:
+                logging.debug('Pre-connect to %s failed: %s', origin, e)
+
+        for origin in origins:
+            Thread(target=_connect, args=(origin,), daemon=True, name=f"warmup-{urlsplit(origin).netloc}").start()
+
+    def close(self):
+        """关闭连接池"""
+        try:
+            if self._httpx_client is not None:
+                self._httpx_client.close()
+            if self._session is not None:
+                self._session.close()
+        except Exception as e:
+            logging.debug('Error closing HTTP client: %s', e)
+
+# ===================================
+# 抓取引擎
+# ===================================
+
+class FetchEngine:
+    """长期运行的抓取引擎：一个 asyncio 事件循环线程调度所有数据源任务
+
+    阻塞的数据源请求在有界线程池中执行，每个任务带超时；任务结束后调用 on_result(name, result)
+    (由调用方通过 Qt 信号转发到主线程)。不再为每次定时器触发新建线程。
+
+    同一个 key 的任务同时最多运行一个 (single-flight)：运行期间的新触发合并为一次后续运行，
+    后续运行已在等待时的触发直接丢弃，分别计入 coalesced 和 skipped。
+    """
+
+    def __init__(self, on_result, max_workers=4):
+        self.on_result = on_result
+        self.max_workers = max_workers
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'timed_out': 0, 'coalesced': 0, 'skipped': 0}
+        self.active = {}  # 任务名 -> 开始时间 (perf_counter)
+        self._lock = Lock()  # stats/active 在事件循环线程中修改，其他线程通过 snapshot() 读取
+        self._in_flight = set()  # 正在运行的任务 key (只在事件循环线程中访问)
+        self._follow_up = {}  # key -> 运行结束后需要再执行一次的 (name, func, timeout)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bera-fetch')
+        self._loop = None
+        self._loop_ready = Event()
+        self._thread = Thread(target=self._run_loop, daemon=True, name='fetch-engine')
+        self._thread.start()
+
+    def _run_loop(self):
+        # 事件循环在引擎线程中创建，asyncio 的导入也随之离开主线程
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._loop_ready.set()
+        self._loop.run_forever()
+
+    def _call_soon(self, callback, *args):
+        self._loop_ready.wait()
+        self._loop.call_soon_threadsafe(callback, *args)
+
+    def submit(self, name, func, timeout, key=None):
+        """从任意线程提交任务；key 相同的任务不会并发运行 (默认使用任务名)"""
+        self._call_soon(self._schedule, name, func, timeout, key or name)
+
+    def submit_every(self, name, func, timeout, interval, key=None):
+        """从任意线程注册周期任务：立即提交一次，之后每 interval 秒提交一次 (无界面模式下代替 QTimer)"""
+        def tick():
+            self._schedule(name, func, timeout, key or name)
+            self._loop.call_later(interval, tick)
+        self._call_soon(tick)
+
+    def _schedule(self, name, func, timeout, key):
+        if key in self._in_flight:
+            if key in self._follow_up:
+                self._count('skipped')
+                logging.debug("Fetch job '%s' skipped: '%s' is running and a follow-up run is already queued", name, key)
+            else:
+                self._count('coalesced')
+                logging.debug("Fetch job '%s' coalesced into a follow-up run of '%s'", name, key)
+            # 后续运行总是使用最近一次触发的任务
+            self._follow_up[key] = (name, func, timeout)
+            return
+        self._in_flight.add(key)
+        self._count('submitted')
+        self._loop.create_task(self._run_job(name, func, timeout, key))
+
+    async def _run_job(self, name, func, timeout, key):
+        start = time.perf_counter()
+        with self._lock:
+            self.active[name] = start
+        result = None
+        future = self._loop.run_in_executor(self._executor, func)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), timeout)
+            self._count('completed')
+        except asyncio.TimeoutError:
+            self._count('timed_out')
+            logging.warning(f"Fetch job '{name}' timed out after {timeout}s")
+        except Exception as e:
+            self._count('failed')
+            logging.error(f"Fetch job '{name}' failed: {e}")
+            logging.error(traceback.format_exc())
+        finally:
+            with self._lock:
+                self.active.pop(name, None)
+            METRICS.observe('bera_fetch_job_duration_seconds', time.perf_counter() - start, job=name)
+            logging.debug("Fetch job '%s' finished in %.0f ms", name, (time.perf_counter() - start) * 1000)
+        try:
+            self.on_result(name, result)
+        except Exception as e:
+            logging.error(f"Error delivering result of fetch job '{name}': {e}")
+
+        # 超时的请求仍在工作线程中运行：等它真正结束后才允许同 key 的下一次运行，保证同时最多一个请求
+        if not future.done():
+            try:
+                await future
+            except Exception:
+                pass
+        self._in_flight.discard(key)
+        follow_up = self._follow_up.pop(key, None)
+        if follow_up is not None:
+            self._schedule(*follow_up, key)
+        return result
+
+    def _count(self, outcome):
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def snapshot(self):
+        """返回任务计数和正在运行的任务名 (可在任意线程调用)"""
+        with self._lock:
+            return dict(self.stats, active=list(self.active))
+
+    def shutdown(self):
+        """停止事件循环并取消尚未开始的任务"""
+        self._loop_ready.wait()  # 引擎刚创建就关闭时，事件循环可能还没建好
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+# ===================================
+# 价格获取辅助
+# ===================================
+
+class MissingTokenResolver:
+    """处理批量价格响应中缺失的代币：按本地目录校验 ID、以指数退避隔离失效 ID、在截止时间内并发二分重取"""
+
+    BASE_BACKOFF = 120  # 首次隔离时长(秒)
+    MAX_BACKOFF = 6 * 3600  # 最长隔离时长(秒)
+    DEADLINE = 8  # 单次补取的总时限(秒)
+
+    def __init__(self, executor):
+        self.executor = executor  # 共享的请求线程池
+        self.known_ids = None  # 本地 coingecko.list 中的全部 ID，None 表示目录不可用、跳过校验
+        self._quarantine = {}  # token_id -> (连续失败次数, 下次允许重试的 monotonic 时间)
+        self._lock = Lock()
+
+    def set_catalog(self, tokens):
+        """用本地代币目录更新可校验的 ID 集合"""
+        if isinstance(tokens, CompactCoinCatalog):
+            ids = tokens.ids  # 紧凑目录直接按 ID 二分查找，无需构建集合
+        else:
+            ids = {token["id"] for token in tokens if isinstance(token, dict) and "id" in token}
+        with self._lock:
+            self.known_ids = ids or None
+            # 因不在目录中而被隔离的 ID，如果新目录里出现了就解除隔离
+            released = [t for t, (fail_count, _) in self._quarantine.items() if fail_count == 0 and t in ids]
+            for token_id in released:
+                del self._quarantine[token_id]
+
+    def is_quarantined(self, token_id):
+        with self._lock:
+            entry = self._quarantine.get(token_id)
+            return entry is not None and time.monotonic() < entry[1]
+
+    def mark_failed(self, token_id, unknown=False):
+        """记录一次失败并按指数退避延长隔离期；unknown 表示目录中不存在该 ID"""
+        with self._lock:
+            fail_count = self._quarantine.get(token_id, (0, 0))[0] + 1
+            backoff = self.MAX_BACKOFF if unknown else min(self.BASE_BACKOFF * 2 ** (fail_count - 1), self.MAX_BACKOFF)
+            # 目录缺失的 ID 记为 0 次失败，目录更新时可被 set_catalog 解除隔离
+            self._quarantine[token_id] = (0 if unknown else fail_count, time.monotonic() + backoff)
+        logging.info(f"Quarantined token '{token_id}' for {backoff} seconds{' (not in local catalog)' if unknown else ''}")
+
+    def mark_resolved(self, token_id):
+        with self._lock:
+            if self._quarantine.pop(token_id, None) is not None:
+                logging.info(f"Token '{token_id}' is available again, released from quarantine")
+
+    def resolve(self, missing_ids, fetch_batch, deadline=None):
+        """在截止时间内补取缺失代币的价格 (DEADLINE 秒，调用方给出更早的 deadline 时以其为准)
+
+        fetch_batch(ids) 在请求失败时返回 None，成功时返回 {id: price_data}，被限流时抛出 RateLimitedError。
+        整批失败时把批次一分为二并发重试，直到单个 ID；响应成功但仍缺失的 ID 进入隔离。
+        """
+        to_fetch = []
+        for token_id in missing_ids:
+            if self.is_quarantined(token_id):
+                logging.debug("Skipping quarantined token '%s'", token_id)
+            elif self.known_ids is not None and token_id not in self.known_ids:
+                self.mark_failed(token_id, unknown=True)
+            else:
+                to_fetch.append(token_id)
+
+        results = {}
+        if not to_fetch:
+            return results
+
+        deadline = min(time.monotonic() + self.DEADLINE, deadline if deadline is not None else float('inf'))
+        pending = [to_fetch]
+        rate_limited = False
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logging.warning(f"Missing token refetch hit its deadline, {sum(map(len, pending))} tokens left unresolved")
+                break
+
+            futures = {self.executor.submit(fetch_batch, batch): batch for batch in pending}
+            done, not_done = wait(futures, timeout=remaining)
+            pending = []
+            for future in done:
+                batch = futures[future]
+                try:
+                    data = future.result()
+                except RateLimitedError as e:
+                    # 被限流不代表 ID 失效：不拆分也不隔离，本周期停止补取
+                    logging.info(f"Missing token refetch stopped while rate limited: {e}")
+                    rate_limited = True
+                    continue
+                except Exception as e:
+                    logging.debug('Refetch of %s tokens raised: %s', len(batch), e)
+                    data = None
+
+                if data is None:
+                    if len(batch) > 1:
+                        middle = len(batch) // 2
+                        pending.extend([batch[:middle], batch[middle:]])
+                    else:
+                        self.mark_failed(batch[0])
+                    continue
+
+                for token_id in batch:
+                    if token_id in data:
+                        results[token_id] = data[token_id]
+                        self.mark_resolved(token_id)
+                    else:
+                        self.mark_failed(token_id)
+
+            for future in not_done:
+                future.cancel()  # 超时的请求结果不再等待，这些 ID 下个周期再试
+            if rate_limited:
+                break
+        return results
+
+# ===================================
+# 代币目录同步
+# ===================================
+
+def diff_coin_lists(old_tokens, new_tokens):
+    """按 id 比较新旧代币列表，返回新增、移除和改名 (symbol/name 变化) 的代币"""
+    old_map = {token["id"]: token for token in old_tokens}
+    new_map = {token["id"]: token for token in new_tokens}
+    added = [token for token_id, token in new_map.items() if token_id not in old_map]
+    removed = [token_id for token_id in old_map if token_id not in new_map]
+    renamed = [token for token_id, token in new_map.items()
+               if token_id in old_map
+               and (old_map[token_id].get("symbol"), old_map[token_id].get("name")) != (token.get("symbol"), token.get("name"))]
+    return {"added": added, "removed": removed, "renamed": renamed}
+
+def apply_coin_list_diff(tokens, diff):
+    """把 diff_coin_lists 的结果应用到现有列表上 (保持原有顺序，新增代币追加在末尾)"""
+    removed = set(diff["removed"])
+    renamed = {token["id"]: token for token in diff["renamed"]}
+    merged = [renamed.get(token["id"], token) for token in tokens if token["id"] not in removed]
+    merged.extend(diff["added"])
+    return merged
+
+
+class _CatalogIdView:
+    """CompactCoinCatalog 的 ID 集合视图，支持 `in` 和 len()，按 ID 二分查找而不生成集合"""
+
+    def __init__(self, catalog):
+        self._catalog = catalog
+
+    def __contains__(self, token_id):
+        return self._catalog.index_of(token_id) is not None
+
+    def __len__(self):
+        return len(self._catalog)
+
+
+class CompactCoinCatalog:
+    """内存映射的紧凑代币目录 (coingecko.catalog)
+
+    文件布局 (小端)：
+        头部      magic, 代币数 N, 保留字段, 源 JSON 文件大小, 源 JSON 修改时间(ns), 源 JSON 的 SHA-1
+        偏移表    uint32 × (3N + 1)，第 i 个代币的 id/symbol/name 依次为第 3i、3i+1、3i+2 个字符串
+        ID 排序表 uint32 × N，按 id 的 UTF-8 字节序排列的代币下标，用于按 ID 二分查找
+        字符串区  所有字符串的 UTF-8 编码首尾相接
+    读取时只映射文件，按需解码单个代币，不会一次性创建 1.7 万个字典。
+    单文件打包版每次启动都会重新解压 coingecko.list，修改时间随之变化，因此修改时间不一致时再比较内容摘要。
+    """
+
+    MAGIC = b'BHCAT\x00\x02\x00'
+    HEADER = struct.Struct('<8sIIqq20s')
+    FIELDS = ("id", "symbol", "name")
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            (magic, count, _, self.source_size, self.source_mtime_ns,
+             self.source_digest) = self.HEADER.unpack_from(self._mm, 0)
+            if magic != self.MAGIC:
+                raise ValueError(f"Not a compact catalog file: {path}")
+            self._count = count
+            view = memoryview(self._mm)
+            offsets_start = self.HEADER.size
+            order_start = offsets_start + (3 * count + 1) * 4
+            blob_start = order_start + count * 4
+            self._offsets = view[offsets_start:order_start].cast('I')
+            self._order = view[order_start:blob_start].cast('I')
+            self._blob = view[blob_start:]
+            if len(self._blob) != self._offsets[3 * count]:
+                raise ValueError(f"Compact catalog is truncated: {path}")
+        except Exception:
+            self.close()
+            raise
+        self.ids = _CatalogIdView(self)
+
+    @classmethod
+    def open(cls, path, source_path):
+        """打开与源 JSON 对应的紧凑目录；文件缺失、损坏或已过期时返回 None"""
+        if sys.byteorder != 'little' or not os.path.exists(path):
+            return None
+        try:
+            catalog = cls(path)
+        except Exception as e:
+            logging.warning(f"Failed to open compact token catalog {path}: {e}")
+            return None
+        source_stat = os.stat(source_path)
+        if catalog.source_size != source_stat.st_size or (
+                catalog.source_mtime_ns != source_stat.st_mtime_ns
+                and catalog.source_digest != cls._source_digest(source_path)):
+            logging.info("Compact token catalog is out of date with coingecko.list")
+            catalog.close()
+            return None
+        return catalog
+
+    @staticmethod
+    def _source_digest(source_path):
+        with open(source_path, 'rb') as f:
+            return hashlib.sha1(f.read()).digest()
+
+    @classmethod
+    def write(cls, tokens, path, source_path):
+        """由代币列表生成紧凑目录文件 (先写临时文件，调用方负责替换)，返回临时文件路径"""
+        blob = bytearray()
+        offsets = array('I')
+        encoded_ids = []
+        for token in tokens:
+            for key in cls.FIELDS:
+                offsets.append(len(blob))
+                encoded = str(token.get(key, "")).encode('utf-8')
+                if key == "id":
+                    encoded_ids.append(encoded)
+                blob += encoded
+        offsets.append(len(blob))
+        order = array('I', sorted(range(len(encoded_ids)), key=encoded_ids.__getitem__))
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+            order.byteswap()
+
+        source_stat = os.stat(source_path)
+        digest = cls._source_digest(source_path)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, len(encoded_ids), 0, source_stat.st_size, source_stat.st_mtime_ns,
+                                    digest))
+            f.write(offsets.tobytes())
+            f.write(order.tobytes())
+            f.write(blob)
+        return tmp_path
+
+    @classmethod
+    def rebuild(cls, tokens, path, source_path, previous=None):
+        """重新生成紧凑目录文件并打开；previous 为当前已映射的旧目录，会在替换文件前关闭"""
+        tmp_path = cls.write(tokens, path, source_path)
+        if previous is not None:
+            previous.close()
+        os.replace(tmp_path, path)
+        return cls(path)
+
+    def close(self):
+        """释放内存映射 (替换文件前必须先关闭，Windows 不允许替换已映射的文件)"""
+        for name in ('_offsets', '_order', '_blob'):
+            view = getattr(self, name, None)
+            if view is not None:
+                view.release()
+                setattr(self, name, None)
+        if getattr(self, '_mm', None) is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __len__(self):
+        return self._count
+
+    def _string(self, slot):
+        return str(self._blob[self._offsets[slot]:self._offsets[slot + 1]], 'utf-8')
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("catalog index out of range")
+        base = 3 * index
+        return {"id": self._string(base), "symbol": self._string(base + 1), "name": self._string(base + 2)}
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self[index]
+
+    def id_at(self, index):
+        return self._string(3 * index)
+
+    def index_of(self, token_id):
+        """按 ID 二分查找代币下标，不存在时返回 None"""
+        target = token_id.encode('utf-8')
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            index = self._order[middle]
+            slot = 3 * index
+            current = self._blob[self._offsets[slot]:self._offsets[slot + 1]].tobytes()
+            if current < target:
+                low = middle + 1
+            elif current > target:
+                high = middle
+            else:
+                return index
+        return None
+
+    def get(self, token_id):
+        """按 ID 读取代币，不存在时返回 None"""
+        index = self.index_of(token_id)
+        return None if index is None else self[index]
+
+# ===================================
+# 代币搜索索引
+# ===================================
+
+class TokenSearchIndex:
+    """代币目录的搜索索引：有序前缀表 + 三元组倒排表，结果按匹配程度排序
+
+    3 个字符及以上的查询走三元组倒排表 (子串匹配)；更短的查询走前缀表
+    (匹配 id、symbol、name 以及 name 中各单词的前缀)。
+    """
+
+    # 排名：数值越小越靠前
+    RANK_SYMBOL_EXACT = 0
+    RANK_ID_OR_NAME_EXACT = 1
+    RANK_SYMBOL_PREFIX = 2
+    RANK_ID_OR_NAME_PREFIX = 3
+    RANK_WORD_PREFIX = 4
+    RANK_SUBSTRING = 5
+
+    def __init__(self, tokens, version=None):
+        start = time.perf_counter()
+        self.tokens = tokens
+        self.version = version
+        self._ids = []
+        self._positions = {}  # 代币 id -> 目录下标
+        self._symbols = []
+        self._names = []
+        self._trigrams = {}  # 三元组 -> array('I') 代币下标 (升序)
+        prefix_entries = []  # (小写键, 代币下标)
+
+        for index, token in enumerate(tokens):
+            token_id = str(token.get("id", "")).lower()
+            symbol = str(token.get("symbol", "")).lower()
+            name = str(token.get("name", "")).lower()
+            self._ids.append(token_id)
+            self._positions.setdefault(str(token.get("id", "")), index)
+            self._symbols.append(symbol)
+            self._names.append(name)
+
+            grams = set()
+            for field in (token_id, symbol, name):
+                for i in range(len(field) - 2):
+                    grams.add(field[i:i + 3])
+            for gram in grams:
+                postings = self._trigrams.get(gram)
+                if postings is None:
+                    postings = self._trigrams[gram] = array('I')
+                postings.append(index)
+
+            keys = {token_id, symbol, name}
+            keys.update(word for word in re.split(r'[^0-9a-z]+', name) if word)
+            prefix_entries.extend((key, index) for key in keys if key)
+
+        prefix_entries.sort()
+        self._prefix_keys = [key for key, _ in prefix_entries]
+        self._prefix_indexes = array('I', (index for _, index in prefix_entries))
+
+        self._last_query = None
+        self._last_matches = None
+        logging.info(f"Token search index built: {len(tokens)} tokens, {len(self._trigrams)} trigrams "
+                     f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def position_of(self, token_id):
+        """代币 id 在目录中的下标，不存在时返回 None"""
+        return self._positions.get(token_id)
+
+    def _rank(self, index, query):
+        symbol = self._symbols[index]
+        if symbol == query:
+            return self.RANK_SYMBOL_EXACT
+        name = self._names[index]
+        token_id = self._ids[index]
+        if token_id == query or name == query:
+            return self.RANK_ID_OR_NAME_EXACT
+        if symbol.startswith(query):
+            return self.RANK_SYMBOL_PREFIX
+        if token_id.startswith(query) or name.startswith(query):
+            return self.RANK_ID_OR_NAME_PREFIX
+        if (' ' + query) in name or ('-' + query) in name:
+            return self.RANK_WORD_PREFIX
+        return self.RANK_SUBSTRING
+
+    def _match_prefix(self, query):
+        """前缀表中以 query 开头的所有代币下标"""
+        start = bisect_left(self._prefix_keys, query)
+        end = bisect_left(self._prefix_keys, query + '\uffff', start)
+        return set(self._prefix_indexes[start:end])
+
+    def _match_substring(self, query, candidates=None):
+        """id/symbol/name 中包含 query 子串的代币下标"""
+        if candidates is None:
+            # 从最稀有的三元组倒排表中取候选，再逐个验证
+            smallest = None
+            for i in range(len(query) - 2):
+                postings = self._trigrams.get(query[i:i + 3])
+                if postings is None:
+                    return set()
+                if smallest is None or len(postings) < len(smallest):
+                    smallest = postings
+            candidates = smallest
+        return {index for index in candidates
+                if query in self._symbols[index] or query in self._ids[index] or query in self._names[index]}
+
+    def search(self, query):
+        """返回按相关度排序的代币下标列表；空查询返回全部代币 (原顺序)"""
+        query = query.strip().lower()
+        if not query:
+            return list(range(len(self.tokens)))
+
+        if len(query) < 3:
+            matches = self._match_prefix(query)
+        elif self._last_matches is not None and len(self._last_query) >= 3 and query.startswith(self._last_query):
+            # 连续输入时只需在上一次结果中继续筛选
+            matches = self._match_substring(query, self._last_matches)
+        else:
+            matches = self._match_substring(query)
+
+        self._last_query = query
+        self._last_matches = matches
+        return sorted(matches, key=lambda index: (self._rank(index, query), len(self._symbols[index]), index))
+
+# ===================================
+# 恐惧贪婪指数提取
+# ===================================
+
+def classify_fear_greed(value):
+    """根据数值范围划分恐惧贪婪指数的分类"""
+    if 0 <= value <= 24:
+        return "Extreme Fear"
+    if 25 <= value <= 49:
+        return "Fear"
+    if 50 <= value <= 54:
+        return "Neutral"
+    if 55 <= value <= 74:
+        return "Greed"
+    if 75 <= value <= 100:
+        return "Extreme Greed"
+    logging.warning(f"Scraped index value {value} is outside the expected 0-100 range.")
+    return "Unknown"
+
+
+class FearGreedExtractor:
+    """增量扫描恐惧贪婪指数页面的字节流，按选择器级联匹配指数值，命中首选选择器即停止读取"""
+
+    CHUNK_SIZE = 16 * 1024
+    MAX_BYTES = 4 * 1024 * 1024  # 扫描上限，防止异常页面无限读取
+    OVERLAP = 4096  # 块之间保留的重叠字节，避免匹配被块边界截断
+
+    # 按优先级排列的 (名称, 正则)；第一个对应原 BeautifulSoup 选择器，命中后立即停止
+    SELECTORS = (
+        ("span[data-test='fear-greed-index-num']",
+         re.compile(rb'data-test\s*=\s*["\']fear-greed-index-num["\'][^>]*>\s*(?:<[^>]+>\s*)*?(\d{1,3})\b')),
+        ("[data-test*='fear-greed']",
+         re.compile(rb'data-test\s*=\s*["\'][^"\']*fear-greed[^"\']*["\'][^>]*>\s*(?:<[^>]+>\s*)*?(\d{1,3})\b')),
+        # 回退：页面内嵌的 JSON 数据 (__NEXT_DATA__ 等)
+        ("json:fearGreedIndex",
+         re.compile(rb'"(?:fearGreedIndex|fearAndGreed|fear_greed)\w*"\s*:\s*\{\s*(?:"\w+"\s*:\s*\{)?[^{}]{0,400}?"(?:score|value)"\s*:\s*"?(\d{1,3})\b')),
+        ("json:historicalValues.now",
+         re.compile(rb'"historicalValues"\s*:\s*\{\s*"now"\s*:\s*\{[^{}]{0,200}?"score"\s*:\s*"?(\d{1,3})\b')),
+    )
+
+    def __init__(self):
+        self._tail = b''
+        self.bytes_scanned = 0
+        self.value = None
+        self.selector = None
+        self._rank = len(self.SELECTORS)
+
+    def feed(self, chunk):
+        """扫描一个数据块；返回 True 表示已命中首选选择器，无需继续读取"""
+        self.bytes_scanned += len(chunk)
+        buffer = self._tail + chunk
+        for rank, (name, pattern) in enumerate(self.SELECTORS[:self._rank]):
+            match = pattern.search(buffer)
+            if match:
+                # 较低优先级的匹配先记下，继续读取以寻找更高优先级的匹配
+                self.value, self.selector, self._rank = int(match.group(1)), name, rank
+                break
+        self._tail = buffer[-self.OVERLAP:]
+        return self._rank == 0
+
+    @classmethod
+    def extract(cls, chunks, max_bytes=None):
+        """从字节块迭代器中提取指数，返回 (value, selector) 或 None"""
+        max_bytes = cls.MAX_BYTES if max_bytes is None else max_bytes
+        extractor = cls()
+        for chunk in chunks:
+            if extractor.feed(chunk) or extractor.bytes_scanned >= max_bytes:
+                break
+        logging.debug('Fear & Greed extractor scanned %s bytes, selector=%s', extractor.bytes_scanned, extractor.selector)
+        if extractor.value is None:
+            return None
+        return extractor.value, extractor.selector
+
+
+class SnapshotCache:
+    """最后一次成功获取的数据的磁盘缓存 (JSON)：保存数据及获取时间，原子写回，启动时可立即显示"""
+
+    def __init__(self, path, description):
+        self.path = path
+        self.description = description  # 日志中的名称
+        self.data = None
+        self.fetched_at = 0.0
+        self._lock = Lock()
+
+    def load(self):
+        """读取缓存文件；文件缺失或损坏时视为没有缓存"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if isinstance(cached, dict) and isinstance(cached.get('data'), dict):
+                self.data = cached['data']
+                self.fetched_at = float(cached.get('fetched_at', 0))
+                logging.info(f"Loaded cached {self.description}: {self.summary()} (age {self.age():.0f}s)")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.warning(f'Failed to read {self.description} cache: {e}')
+        return self.data
+
+    def summary(self):
+        """日志中显示的缓存内容摘要"""
+        return f"{len(self.data)} entries"
+
+    def age(self):
+        return time.time() - self.fetched_at
+
+    def store(self, data):
+        """更新缓存并原子写回磁盘"""
+        with self._lock:
+            self.data = data
+            self.fetched_at = time.time()
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = self.path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'data': data, 'fetched_at': self.fetched_at}, f)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                logging.error(f'Failed to save {self.description} cache: {e}')
+
+
+class FearGreedCache(SnapshotCache):
+    """恐惧贪婪指数的磁盘缓存：保存最后一次成功抓取的数据及抓取时间，按 TTL 判断是否需要重新抓取"""
+
+    def __init__(self, path, ttl):
+        super().__init__(path, 'Fear & Greed index')
+        self.ttl = ttl
+
+    def summary(self):
+        return str(self.data.get('value'))
+
+    def is_fresh(self, slack=0):
+        """缓存是否仍在 TTL 内；slack 用于容忍定时器误差，避免恰好在 TTL 边界上触发的定时器每次都判为过期"""
+        return self.data is not None and self.age() + slack < self.ttl
+
+# ===================================
+# 价格历史
+# ===================================
+
+class TokenHistory:
+    """单个代币的定长环形缓冲区：时间戳、价格、24h 涨跌幅分别存放在预分配的 array('d') 中"""
+
+    __slots__ = ('capacity', 'times', 'prices', 'changes', '_next', '_count')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        # 预分配后不再改变大小，因此导出的 memoryview 不会阻塞后续写入
+        self.times = array('d', bytes(8 * capacity))
+        self.prices = array('d', bytes(8 * capacity))
+        self.changes = array('d', bytes(8 * capacity))
+        self._next = 0  # 下一次写入的位置
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def nbytes(self):
+        return 3 * 8 * self.capacity
+
+    def append(self, timestamp, price, change=None):
+        """追加一个数据点 (O(1))，缓冲区满时覆盖最旧的数据点；缺失的涨跌幅记为 NaN"""
+        i = self._next
+        self.times[i] = timestamp
+        self.prices[i] = price
+        self.changes[i] = float('nan') if change is None else change
+        self._next = (i + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+
+    def latest(self):
+        """返回最新的 (timestamp, price, change)，没有数据时返回 None"""
+        if not self._count:
+            return None
+        i = self._next - 1
+        return self.times[i], self.prices[i], self.changes[i]
+
+    def segments(self, column='prices'):
+        """按时间顺序返回某一列的零拷贝视图 (最多两个 memoryview 片段，缓冲区回绕时分为两段)"""
+        view = memoryview(getattr(self, column))
+        if self._count < self.capacity:
+            return (view[:self._count],)
+        return (view[self._next:], view[:self._next])
+
+    def values(self, column='prices', last=None):
+        """按时间顺序复制出某一列 (可只取最近 last 个点)，供需要连续数组的调用方使用"""
+        result = array('d')
+        for segment in self.segments(column):
+            result.frombytes(segment.cast('B'))
+        if last is not None and last < len(result):
+            return result[len(result) - last:]
+        return result
+
+
+class PriceHistoryStore:
+    """按代币 ID 保存最近的价格历史；写入在后台线程，读取在 UI 线程，需要一致视图时持有 lock"""
+
+    def __init__(self, capacity=1440):
+        self.capacity = max(2, int(capacity))
+        self.lock = Lock()
+        self._histories = {}
+
+    def __contains__(self, token_id):
+        return token_id in self._histories
+
+    def get(self, token_id):
+        return self._histories.get(token_id)
+
+    def record(self, price_data, timestamp=None):
+        """把一次价格响应追加到各代币的历史中"""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self.lock:
+            for token_id, quote in price_data.items():
+                price = quote.get('usd') if isinstance(quote, dict) else None
+                if price is None:
+                    continue
+                history = self._histories.get(token_id)
+                if history is None:
+                    history = self._histories[token_id] = TokenHistory(self.capacity)
+                history.append(timestamp, price, quote.get('usd_24h_change'))
+
+    def discard(self, keep_ids):
+        """丢弃不再监控的代币的历史"""
+        with self.lock:
+            for token_id in [t for t in self._histories if t not in keep_ids]:
+                del self._histories[token_id]
+
+    @property
+    def nbytes(self):
+        return sum(history.nbytes for history in self._histories.values())
+
+
+class PriceTickStore:
+    """基于 SQLite (WAL) 的本地价格时间序列存储：写入由专用线程批量提交，旧数据在后台降采样为 5 分钟/1 小时桶"""
+
+    BATCH_SIZE = 500  # 单个事务最多写入的数据点
+    COMPACT_INTERVAL = 3600  # 秒，两次降采样之间的间隔
+    # (表名, 桶宽度秒数)，按分辨率从细到粗排列
+    TIERS = (('ticks', 0), ('ticks_5m', 300), ('ticks_1h', 3600))
+
+    def __init__(self, path, flush_interval=10, raw_retention=48 * 3600,
+                 five_minute_retention=30 * 86400, hourly_retention=365 * 86400):
+        self.path = path
+        self.flush_interval = flush_interval
+        # 每个分辨率的保留时长：超出后降采样到下一级 (最后一级直接删除)
+        self.retention = {'ticks': raw_retention, 'ticks_5m': five_minute_retention, 'ticks_1h': hourly_retention}
+        self._queue = Queue()
+        self._reader = None  # 共用的读取连接 (守护进程的每个请求都在新线程中处理，按线程建连接会每次重新打开)
+        self._reader_lock = Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._writer = Thread(target=self._writer_loop, daemon=True, name='price-store')
+        self._writer.start()
+
+    def _connect(self, check_same_thread=True):
+        connection = sqlite3.connect(self.path, timeout=10, check_same_thread=check_same_thread)
+        # auto_vacuum 只对新建的数据库生效，必须在切换到 WAL 之前设置
+        connection.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        connection.execute('PRAGMA journal_mode=WAL')
+        # WAL + NORMAL：提交时不 fsync，只在检查点时 fsync，写入成本有上界
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute('PRAGMA journal_size_limit=4194304')
+        return connection
+
+    def _create_schema(self, connection):
+        connection.execute('CREATE TABLE IF NOT EXISTS ticks ('
+                           'token_id TEXT NOT NULL, ts INTEGER NOT NULL, price REAL NOT NULL, change REAL, '
+                           'PRIMARY KEY (token_id, ts)) WITHOUT ROWID')
+        for table, _ in self.TIERS[1:]:
+            connection.execute(f'CREATE TABLE IF NOT EXISTS {table} ('
+                               'token_id TEXT NOT NULL, ts INTEGER NOT NULL, price REAL NOT NULL, '
+                               'low REAL NOT NULL, high REAL NOT NULL, count INTEGER NOT NULL, '
+                               'PRIMARY KEY (token_id, ts)) WITHOUT ROWID')
+        connection.commit()
+
+    def record(self, price_data, timestamp=None):
+        """把一次价格响应放入写入队列 (不阻塞调用线程)"""
+        ts = int(time.time() if timestamp is None else timestamp)
+        rows = [(token_id, ts, quote['usd'], quote.get('usd_24h_change'))
+                for token_id, quote in price_data.items()
+                if isinstance(quote, dict) and quote.get('usd') is not None]
+        if rows:
+            self._queue.put(rows)
+
+    def _writer_loop(self):
+        """写入线程：攒批后在单个事务中提交，空闲时按间隔执行降采样"""
+        try:
+            connection = self._connect()
+            self._create_schema(connection)
+        except sqlite3.Error as e:
+            logging.error(f'Failed to open price store {self.path}: {e}')
+            return
+
+        pending = []
+        last_flush = time.monotonic()
+        next_compact = time.monotonic() + 60  # 启动一分钟后做第一次降采样，避开启动高峰
+        running = True
+        while running:
+            try:
+                item = self._queue.get(timeout=1)
+                if item is None:
+                    running = False
+                else:
+                    pending.extend(item)
+            except Empty:
+                pass
+
+            now = time.monotonic()
+            if pending and (not running or len(pending) >= self.BATCH_SIZE or now - last_flush >= self.flush_interval):
+                self._flush(connection, pending)
+                pending = []
+                last_flush = now
+            if running and now >= next_compact:
+                self.compact(connection)
+                next_compact = now + self.COMPACT_INTERVAL
+        connection.close()
+
+    def _flush(self, connection, rows):
+        try:
+            with connection:
+                connection.executemany('INSERT OR REPLACE INTO ticks (token_id, ts, price, change) VALUES (?, ?, ?, ?)', rows)
+            logging.debug('Price store: committed %s ticks', len(rows))
+        except sqlite3.Error as e:
+            logging.error(f'Failed to write {len(rows)} ticks to price store: {e}')
+
+    def compact(self, connection, now=None):
+        """把超出保留时长的数据降采样到下一级分辨率，并删除最粗一级中过期的数据"""
+        now = int(time.time() if now is None else now)
+        try:
+            with connection:
+                for (table, _), (target, width) in zip(self.TIERS, self.TIERS[1:]):
+                    # 截止时间对齐到目标桶边界，只合并完整的桶
+                    cutoff = (now - self.retention[table]) // width * width
+                    if table == 'ticks':
+                        source = 'price, price AS low, price AS high, 1 AS count'
+                    else:
+                        source = 'price, low, high, count'
+                    connection.execute(
+                        f'INSERT INTO {target} (token_id, ts, price, low, high, count) '
+                        f'SELECT token_id, ts / {width} * {width} AS bucket, SUM(price * count) / SUM(count), MIN(low), MAX(high), SUM(count) '
+                        f'FROM (SELECT token_id, ts, {source} FROM {table} WHERE ts < ?) '
+                        f'GROUP BY token_id, bucket '
+                        f'ON CONFLICT (token_id, ts) DO UPDATE SET '
+                        f'price = (price * count + excluded.price * excluded.count) / (count + excluded.count), '
+                        f'low = MIN(low, excluded.low), high = MAX(high, excluded.high), count = count + excluded.count',
+                        (cutoff,))
+                    connection.execute(f'DELETE FROM {table} WHERE ts < ?', (cutoff,))
+                last = self.TIERS[-1][0]
+                connection.execute(f'DELETE FROM {last} WHERE ts < ?', (now - self.retention[last],))
+            # 归还删除后空出的页面，使数据库文件大小保持有界
+            connection.executescript('PRAGMA incremental_vacuum;')  # execute() 只执行一步 (释放一页)，executescript 会执行到底
+            connection.execute('PRAGMA optimize')
+            logging.debug('Price store: compaction finished')
+        except sqlite3.Error as e:
+            logging.error(f'Price store compaction failed: {e}')
+
+    def query(self, token_id, start, end=None):
+        """返回 [start, end] 区间内按时间排序的 (ts, price)；跨越多个分辨率时自动拼接"""
+        end = int(time.time()) if end is None else end
+        union = ' UNION ALL '.join(f'SELECT ts, price FROM {table} WHERE token_id = ? AND ts BETWEEN ? AND ?'
+                                   for table, _ in self.TIERS)
+        with self._reader_lock:
+            try:
+                if self._reader is None:
+                    # 所有读取线程共用一个连接 (由锁串行化)；WAL 模式下读取不会被写入线程阻塞
+                    self._reader = self._connect(check_same_thread=False)
+                return self._reader.execute(f'{union} ORDER BY ts', (token_id, start, end) * len(self.TIERS)).fetchall()
+            except sqlite3.Error as e:
+                logging.error(f'Price store query failed: {e}')
+                return []
+
+    def close(self, timeout=5):
+        """提交队列中剩余的数据点，停止写入线程并关闭读取连接"""
+        self._queue.put(None)
+        self._writer.join(timeout)
+        with self._reader_lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+
+# ===================================
+# 交叉汇率
+# ===================================
+
+def quote_base_of(token, default_base):
+    """返回代币的计价基准代币 ID；按美元显示时返回 None (旧的 display_as_bera_ratio 以默认基准 BERA 计价)"""
+    if not token.get("display_as_bera_ratio", False):
+        return None
+    return token.get("quote_base") or default_base
+
+
+def _usd_price(quote, default):
+    """从单个代币的价格响应中取出美元价格，缺失或无效时返回 default"""
+    if not isinstance(quote, dict):
+        return default
+    price = quote.get("usd")
+    return price if isinstance(price, (int, float)) and price > 0 else default
+
+
+class CrossRateEngine:
+    """观察列表的交叉汇率引擎
+
+    观察列表 (含隐式加入的基准代币) 按固定下标排列，每个代币的基准代币下标预先存放在 array('i') 中；
+    每次价格更新只做一次线性遍历得到全部代币的美元价格和对基准代币的比率，与代币之间的组合数无关。
+    完整的 N×N 报价矩阵只在需要时由同一份美元价格数组生成。
+    """
+
+    def __init__(self):
+        self.ids = []  # 下标 -> 代币 ID (观察列表在前，隐式基准代币在后)
+        self._index = {}  # 代币 ID -> 下标
+        self._base_index = array('i')  # 下标 -> 基准代币下标，-1 表示按美元显示
+        self.implicit_ids = []  # 不在观察列表中、只为计算比率而获取的基准代币
+        self.usd = array('d')
+        self.ratios = array('d')
+        self._matrix = None
+
+    def set_watchlist(self, pairs):
+        """设置观察列表：pairs 为 (token_id, base_id 或 None) 序列"""
+        pairs = list(pairs)
+        ids = list(dict.fromkeys(token_id for token_id, _ in pairs))
+        index = {token_id: i for i, token_id in enumerate(ids)}
+        implicit_ids = []
+        for _, base_id in pairs:
+            if base_id is not None and base_id not in index:
+                index[base_id] = len(ids)
+                ids.append(base_id)
+                implicit_ids.append(base_id)
+        base_index = array('i', [-1]) * len(ids)
+        for token_id, base_id in pairs:
+            if base_id is not None:
+                base_index[index[token_id]] = index[base_id]
+        self.ids, self._index, self._base_index, self.implicit_ids = ids, index, base_index, implicit_ids
+        self.usd = array('d', [float('nan')]) * len(ids)
+        self.ratios = array('d', [float('nan')]) * len(ids)
+        self._matrix = None
+
+    def required_ids(self):
+        """返回需要获取价格的全部代币 ID (包括隐式基准代币)"""
+        return list(self.ids)
+
+    def update(self, price_data):
+        """用一次价格响应重算全部比率；缺失或无效的价格记为 NaN"""
+        nan = float('nan')
+        usd = array('d', [_usd_price(price_data.get(token_id), nan) for token_id in self.ids])
+        # 基准价格非正或为 NaN 时比较为假，比率记为 NaN
+        self.ratios = array('d', [usd[i] / usd[b] if b >= 0 and usd[b] > 0 else nan
+                                  for i, b in enumerate(self._base_index)])
+        self.usd = usd
+        self._matrix = None
+
+    def base_of(self, token_id):
+        """返回代币的基准代币 ID，按美元显示时返回 None"""
+        i = self._index.get(token_id)
+        if i is None or self._base_index[i] < 0:
+            return None
+        return self.ids[self._base_index[i]]
+
+    def base_available(self, token_id):
+        """基准代币当前是否有有效的美元价格"""
+        i = self._index.get(token_id)
+        if i is None or self._base_index[i] < 0:
+            return False
+        return self.usd[self._base_index[i]] > 0
+
+    def ratio(self, token_id):
+        """返回代币对其基准代币的比率，无法计算时返回 None"""
+        i = self._index.get(token_id)
+        if i is None:
+            return None
+        value = self.ratios[i]
+        return None if value != value else value
+
+    def quote_matrix(self):
+        """返回完整报价矩阵：matrix[i][j] 为 ids[i] 以 ids[j] 计价的价格 (按需生成并缓存到下一次 update)"""
+        if self._matrix is None:
+            nan = float('nan')
+            inverse = array('d', [1.0 / price if price > 0 else nan for price in self.usd])
+            self._matrix = [array('d', [price * inv for inv in inverse]) for price in self.usd]
+        return self._matrix
+
+# ===================================
+# 行情核心
+# ===================================
+
+class PriceFeedCore:
+    """价格和恐惧贪婪指数的获取、缓存与历史记录，不依赖 Qt
+
+    由 BeraHelperApp 和无界面守护进程 (PriceDaemon) 共用：先调用 init_feed_state，再用
+    load_feed_config 读取配置；抓取引擎的任务结果交给 setup_network 传入的 on_result 回调。
+    """
+
+    PRICE_API_URL = "https://api.coingecko.com/api/v3/simple/price"  # CoinGecko 价格接口
+    MAX_IDS_QUERY_LENGTH = 1800  # 单个价格请求中 ids 参数的最大长度 (避免 URL 过长)
+    FEAR_GREED_TTL_SLACK = 30  # 秒，容忍 F&G 定时器与缓存 TTL 之间的误差
+    PRICE_FETCH_TIMEOUT = 25  # 秒，单次价格获取任务的总超时
+    PRICE_FETCH_MARGIN = 2  # 秒，价格任务中请求和补取的截止时间提前于总超时的余量 (留给合并、记录和写快照)
+    FEAR_GREED_FETCH_TIMEOUT = 30  # 秒，单次恐惧贪婪指数抓取任务的总超时
+
+    def init_feed_state(self):
+        """初始化行情核心的状态"""
+        self.fear_greed_cache = None  # 恐惧贪婪指数磁盘缓存 (FearGreedCache，在 load_feed_config 中创建)
+        self.fear_greed_lock = Lock()  # 创建线程锁，用于保护恐惧贪婪指数抓取过程
+        self.price_snapshot = None  # 最后一次成功获取的价格 (SnapshotCache，在 load_feed_config 中创建)
+        self.price_history = PriceHistoryStore()  # 每个代币最近的价格历史 (环形缓冲区)
+        self.price_store = None  # 本地价格时间序列存储 (PriceTickStore，history.persist 关闭时为 None)
+        self.cross_rates = CrossRateEngine()  # 观察列表的交叉汇率 (每个代币可选任意基准代币)
+        self.quote_base_symbols = {}  # 比率模式代币 ID -> 基准代币符号
+        self.http_client = None  # 共享 HTTP 客户端 (在 setup_network 中根据配置创建)
+        self.connectivity = None  # 网络连通性判断 (ConnectivityMonitor，离线时停止发出请求)
+        self.prices_updated_at = None  # 当前价格的获取时间 (Unix 时间戳)
+        self.metrics_host = '127.0.0.1'  # Prometheus 指标导出的监听地址
+        self.metrics_server = None  # Prometheus 指标导出服务器 (未启用时为 None)
+        self.request_executor = None  # 共享的并发请求线程池
+        self.fetch_engine = None  # 长期运行的抓取引擎 (FetchEngine，在 setup_network 中创建)
+        self.missing_token_resolver = None  # 缺失代币补取器
+        self.network_warm_up = True  # 启动时是否预连接 API 源站
+        self.user_tokens = []  # 用户选择显示的代币列表
+
+    def read_config_file(self):
+        """读取 bera_helper_config.json；文件不存在时写出并返回基础默认配置"""
+        config_path = resource_path('bera_helper_config.json')
+        logging.info(f'Loading configuration file: {config_path}') # Changed to English
+        config = {} # 初始化为空字典
+        if not os.path.exists(config_path):
+             logging.warning(f"Configuration file not found: {config_path}. Will use and create default configuration.") # Changed to English
+             # 定义基础的默认配置结构
+             config = {
+                 # tokens部分会在后面填充默认值
+                 "tokens": {},
+                 
+                 # 样式配置
+                 "styles": {
+                     "FONT_NORMAL": ["Arial", 11],
+                     "UP_COLOR": "#00FF7F",      # 上涨颜色
+                     "DOWN_COLOR": "#FF4500",    # 下跌颜色
+                     "TEXT_COLOR": "#FFD700",    # 文本颜色
+                     "EXTREME_FEAR_COLOR": "#FF0000",  # 极度恐惧颜色
+                     "FEAR_COLOR": "#FF7F00",         # 恐惧颜色
+                     "NEUTRAL_COLOR": "#FFFF00",      # 中性颜色
+                     "GREED_COLOR": "#7FFF00",        # 贪婪颜色
+                     "EXTREME_GREED_COLOR": "#00FF00" # 极度贪婪颜色
+                 },
+                 
+                 # 窗口配置
+                 "window": {
+                     "update_interval": 60  # 更新间隔(秒)
+                 },
+
+                 # 网络配置
+                 "network": {
+                     "pool_size": 10,   # 每个源站的 keep-alive 连接数
+                     "http2": False,    # 是否使用 HTTP/2 (需要安装 httpx[http2])
+                     "warm_up": True,   # 启动时预连接 API 源站
+                     "price_chunk_size": 100  # 每个价格请求最多包含的代币数
+                 },
+                 
+                 # API配置
+                 "api": {
+                     "coinmarketcap": {
+                         "enabled": True,
+                         "base_url": "https://pro-api.coinmarketcap.com/v3",
+                         "endpoints": {
+                             "fear_greed": "/fear-and-greed/historical"
+                         },
+                         "params": {
+                             "fear_greed": {
+                                 "start": 1,
+                                 "limit": 1
+                             }
+                         },
+                         "update_interval": 3600  # API更新间隔(秒)
+                     }
+                 }
+             }
+             # 尝试保存一次初始配置，但不强制要求成功
+             try:
+                 with open(config_path, 'w', encoding='utf-8') as f_default:
+                     json.dump(config, f_default, indent=2)
+                 logging.info(f"Created basic configuration file: {config_path}") # Changed to English
+             except Exception as create_err:
+                 logging.error(f"Failed to create default configuration file: {create_err}, will continue using default configuration in memory.") # Changed to English
+        else:
+             # 文件存在，正常加载
+             try:
+                 with open(config_path, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+             except json.JSONDecodeError as e:
+                 logging.error(f"Configuration file {config_path} format error: {e}. Will use default configuration.") # Changed to English
+                 # 保留上面定义的默认 config 结构
+             except Exception as load_err:
+                 logging.error(f"Error loading configuration file: {load_err}. Will use default configuration.") # Changed to English
+                 # 保留上面定义的默认 config 结构
+
+        return config
+
+    def load_feed_config(self, config, on_result):
+        """按配置设置代币 ID、更新间隔、恐惧贪婪指数缓存、价格历史和网络，并加载用户代币列表"""
+        # --- 代币ID配置 (从配置文件加载，提供默认值) --- 
+        tokens_config = config.get('tokens', {})
+        self.BERA_ID = tokens_config.get('BERA_ID', "berachain-bera")
+        self.IBGT_ID = tokens_config.get('IBGT_ID', "infrafred-bgt")
+        self.BTC_ID = tokens_config.get('BTC_ID', "bitcoin")
+        self.ETH_ID = tokens_config.get('ETH_ID', "ethereum")
+        # XBERA_ID, XBGT_ID 不再是特殊变量，用户需要在 user_tokens.json 中添加它们
+
+        # --- 更新间隔和 F&G 数据源 --- 
+        self.update_interval = config.get('window', {}).get('update_interval', 60)
+        fg_config = config.get('fear_greed_source', {})
+        self.fear_greed_url = fg_config.get('url', "https://coinmarketcap.com/charts/fear-and-greed-index/")
+        self.fear_greed_update_interval = fg_config.get('update_interval', 900)
+        logging.info(f"Price update interval: {self.update_interval} seconds")
+        logging.info(f"Fear & Greed source URL: {self.fear_greed_url}")
+        logging.info(f"Fear & Greed update interval: {self.fear_greed_update_interval} seconds")
+        self.setup_fear_greed_cache(fg_config.get('cache_ttl', 3600))
+        self.setup_price_snapshot()
+        self.setup_price_history(config.get('history', {}))
+
+        # --- 网络配置：创建共享 HTTP 客户端 ---
+        self.setup_network(config.get('network', {}), on_result)
+
+        # --- 运行指标：可选的 Prometheus 导出端口 ---
+        metrics_config = config.get('metrics', {})
+        self.metrics_host = metrics_config.get('exporter_host', '127.0.0.1')
+        if metrics_config.get('exporter_port'):
+            self.start_metrics_exporter(port=metrics_config['exporter_port'])
+
+        # --- 准备基础的默认代币列表 (无特殊标志) ---
+        # 这些是程序首次运行时或者加载用户配置失败时使用的
+        base_default_tokens = [
+            {"id": self.BTC_ID, "symbol": "BTC", "name": "Bitcoin"},
+            {"id": self.ETH_ID, "symbol": "ETH", "name": "Ethereum"},
+            {"id": self.BERA_ID, "symbol": "BERA", "name": "Berachain"},
+            {"id": self.IBGT_ID, "symbol": "IBGT", "name": "Infrafred"},
+        ]
+        # 为默认列表添加 display_as_bera_ratio=False 标志
+        default_tokens_with_flags = []
+        for token in base_default_tokens:
+             token["display_as_bera_ratio"] = False # 所有代币默认显示价格
+             default_tokens_with_flags.append(token)
+
+        # --- 加载用户代币设置 ---
+        user_tokens_loaded = False
+        user_tokens_path = ""
+        try:
+            user_data_dir = self.get_user_data_dir()
+            user_tokens_path = os.path.join(user_data_dir, 'user_tokens.json')
+            logging.info(f'Attempting to load user token settings: {user_tokens_path}')
+
+            if os.path.exists(user_tokens_path):
+                with open(user_tokens_path, 'r', encoding='utf-8') as f:
+                    loaded_data = json.load(f)
+
+                loaded_tokens = []
+                if isinstance(loaded_data, dict) and "tokens" in loaded_data:
+                    if isinstance(loaded_data["tokens"], list): loaded_tokens = loaded_data["tokens"]
+                    else: logging.warning("user_tokens.json 'tokens' key is not a list.")
+                elif isinstance(loaded_data, list): # 兼容旧格式
+                    loaded_tokens = loaded_data
+                else: logging.error(f"Invalid format in user_tokens.json: {type(loaded_data)}.")
+
+                if loaded_tokens:
+                    self.user_tokens = []
+                    processed_ids = set()
+                    for token_data in loaded_tokens:
+                        if isinstance(token_data, dict) and "id" in token_data and token_data["id"] not in processed_ids:
+                            # **确保所有加载的代币都有标志，默认为 False**
+                            if "display_as_bera_ratio" not in token_data:
+                                token_data["display_as_bera_ratio"] = False
+                            self.user_tokens.append(token_data)
+                            processed_ids.add(token_data["id"])
+                        else: logging.warning(f"Skipping invalid/duplicate token data: {token_data}") # Changed to English
+
+                    if self.user_tokens:
+                         logging.info(f'Loaded user token settings: {len(self.user_tokens)} tokens') # Changed to English
+                         user_tokens_loaded = True
+                         for token in self.user_tokens: logging.debug('  Loaded: %s (%s), Ratio: %s', token.get("symbol", "?"), token.get("id", "?ID"), token.get("display_as_bera_ratio")) # Changed to English
+                    else: logging.warning("User token list is empty after processing.") # Changed to English
+            else:
+                logging.warning(f'User token configuration file not found: {user_tokens_path}. Will use default tokens for the first time.') # Changed to English
+
+        except json.JSONDecodeError as e: logging.error(f'Failed to parse user_tokens.json: {e}.') # Changed to English
+        except Exception as e:
+            logging.error(f'Error loading user token settings: {e}.') # Changed to English
+            import traceback; logging.error(traceback.format_exc())
+
+        if not user_tokens_loaded:
+            logging.info('Using default token list.') # Changed to English
+            self.user_tokens = default_tokens_with_flags # 使用带 False 标志的默认列表
+            if user_tokens_path and not os.path.exists(user_tokens_path):
+                try: self.save_user_tokens()
+                except Exception as save_e: logging.error(f"Failed to save default token list for the first time: {save_e}") # Changed to English
+
+    def setup_network(self, network_config, on_result):
+        """根据 network 配置创建共享 HTTP 客户端、请求线程池、缺失代币补取器和抓取引擎 (任务结果交给 on_result)"""
+        self.network_warm_up = network_config.get('warm_up', True)
+        self.price_chunk_size = max(1, int(network_config.get('price_chunk_size', 100)))
+        rate_limiter = None
+        if network_config.get('rate_limit_per_minute', 30):
+            rate_limiter = RateLimiter(per_minute=network_config.get('rate_limit_per_minute', 30),
+                                       burst=network_config.get('rate_limit_burst', 5))
+        self.connectivity = ConnectivityMonitor(offline_after=network_config.get('offline_after_failures', 2),
+                                                max_probe_interval=network_config.get('offline_max_probe_interval', 300))
+        self.http_client = HttpClient(pool_size=network_config.get('pool_size', 10),
+                                      http2=network_config.get('http2', False),
+                                      rate_limiter=rate_limiter,
+                                      connectivity=self.connectivity)
+        self.request_executor = ThreadPoolExecutor(max_workers=self.http_client.pool_size,
+                                                   thread_name_prefix='bera-request')
+        self.missing_token_resolver = MissingTokenResolver(self.request_executor)
+        self.fetch_engine = FetchEngine(on_result)
+        METRICS.add_collector(self.collect_feed_metrics)
+
+    def setup_price_history(self, history_config):
+        """根据 history 配置创建内存价格历史和本地价格存储"""
+        self.price_history = PriceHistoryStore(history_config.get('capacity', 1440))
+        if history_config.get('persist', True):
+            store_path = os.path.join(self.get_user_data_dir(), 'price_history.sqlite3')
+            self.price_store = PriceTickStore(
+                store_path,
+                flush_interval=history_config.get('flush_interval', 10),
+                raw_retention=history_config.get('raw_retention_hours', 48) * 3600,
+                five_minute_retention=history_config.get('five_minute_retention_days', 30) * 86400,
+                hourly_retention=history_config.get('hourly_retention_days', 365) * 86400)
+            logging.info(f"Price store: {store_path}")
+
+    def setup_fear_greed_cache(self, ttl):
+        """创建并读取恐惧贪婪指数磁盘缓存"""
+        cache_path = os.path.join(self.get_user_data_dir(), 'fear_greed_cache.json')
+        self.fear_greed_cache = FearGreedCache(cache_path, ttl)
+        self.fear_greed_cache.load()
+        logging.info(f"Fear & Greed cache TTL: {ttl} seconds")
+
+    def setup_price_snapshot(self):
+        """创建并读取最后一次成功获取的价格快照 (启动时先显示，标记为过期)"""
+        snapshot_path = os.path.join(self.get_user_data_dir(), 'price_snapshot.json')
+        self.price_snapshot = SnapshotCache(snapshot_path, 'price snapshot')
+        self.price_snapshot.load()
+
+    def get_user_data_dir(self):
+        """获取用户数据目录，确保所有相关函数使用相同的路径"""
+        if sys.platform == 'win32':
+            # Windows: 使用 %APPDATA%\BeraHelper
+            appdata = os.getenv('APPDATA')
+            if appdata:
+                return os.path.join(appdata, 'BeraHelper')
+        
+        # 其他系统或未找到 APPDATA: 使用程序所在目录
+        return os.path.dirname(os.path.abspath(sys.argv[0]))
+
+    def save_user_tokens(self):
+        """保存用户的代币设置"""
+        try:
+            # 获取用户数据目录
+            user_data_dir = self.get_user_data_dir()
+            
+            # 确保目录存在
+            if not os.path.exists(user_data_dir):
+                os.makedirs(user_data_dir)
+            
+            # 设置代币配置文件路径
+            user_tokens_path = os.path.join(user_data_dir, 'user_tokens.json')
+            
+            # 保存代币设置
+            with open(user_tokens_path, 'w', encoding='utf-8') as f:
+                json.dump(self.user_tokens, f, ensure_ascii=False, indent=2)
+            
+            logging.info(f'Saved user token settings to: {user_tokens_path}') # Changed to English
+            logging.debug('Number of tokens saved: %s', len(self.user_tokens)) # Changed to English
+            
+            # 验证保存结果
+            if os.path.exists(user_tokens_path):
+                try:
+                    with open(user_tokens_path, 'r', encoding='utf-8') as f:
+                        saved_data = json.load(f)
+                    logging.debug('Verification: Number of tokens in file %s', len(saved_data)) # Changed to English
+                except Exception as e:
+                    logging.error(f'Verification failed: {e}') # Changed to English
+            else:
+                logging.error(f'Save failed: File does not exist {user_tokens_path}') # Changed to English
+                
+        except Exception as e:
+            logging.error(f'Failed to save user token settings: {e}') # Changed to English
+
+    def update_cross_rate_watchlist(self):
+        """按用户代币列表重建交叉汇率引擎的观察列表 (不在列表中的基准代币会被隐式获取)，并缓存各代币的基准代币符号"""
+        self.cross_rates.set_watchlist((token["id"], quote_base_of(token, self.BERA_ID)) for token in self.user_tokens)
+        if self.cross_rates.implicit_ids:
+            logging.info('Fetching quote base tokens not in the watchlist: %s', ", ".join(self.cross_rates.implicit_ids))
+
+        symbols = {token["id"]: token["symbol"].upper() for token in self.user_tokens}
+        self.quote_base_symbols = {}
+        for token in self.user_tokens:
+            base_id = self.cross_rates.base_of(token["id"])
+            if base_id is None:
+                continue
+            # 优先使用观察列表中的符号，其次是代币自带的 quote_base_symbol
+            symbol = symbols.get(base_id) or token.get("quote_base_symbol", "").upper()
+            self.quote_base_symbols[token["id"]] = symbol or ("BERA" if base_id == self.BERA_ID else base_id.upper())
+
+    def get_prices(self, deadline=None):
+        """从 CoinGecko API 获取所有代币的价格数据
+
+        deadline (time.monotonic() 时间) 给定时，每个请求的限流等待和超时、缺失代币补取的时限都不超过剩余时间。
+        """
+        def budget(limit):
+            """返回 (请求超时, 限流等待上限)：两者之和不超过截止前的剩余时间"""
+            if deadline is None:
+                return limit, None
+            remaining = max(0.5, deadline - time.monotonic())
+            request_timeout = min(limit, remaining)
+            return request_timeout, max(0.0, min(request_timeout, remaining - request_timeout))
+
+        try:
+            # 检查代币列表是否为空
+            if not self.user_tokens:
+                logging.warning("User token list is empty") # Changed to English
+                return {}
+            
+            # 获取所有代币ID (去重并保持顺序，包括不在列表中的基准代币)，按数量和 URL 长度切分为有界的批次
+            token_ids = self.cross_rates.required_ids() or list(dict.fromkeys(token["id"] for token in self.user_tokens))
+            chunks = self._chunk_token_ids(token_ids)
+            logging.debug('Requesting price data for %s tokens in %s chunks: %s', len(token_ids), len(chunks), self.PRICE_API_URL) # Changed to English
+
+            rate_limited = []
+
+            def fetch_chunk(chunk):
+                try:
+                    return self._request_price_batch(chunk, *budget(10))
+                except RateLimitedError as e:
+                    rate_limited.append(chunk)
+                    logging.warning('Price request for %s tokens deferred: %s', len(chunk), e)
+                    return None
+
+            try:
+                # 各批次并行请求，单个慢响应不会拖住其他批次
+                if len(chunks) == 1:
+                    chunk_results = [fetch_chunk(chunks[0])]
+                elif self.connectivity is not None and self.connectivity.offline:
+                    # 离线时第一批单独作为探测请求，恢复在线后再并行请求其余批次
+                    chunk_results = [fetch_chunk(chunks[0])]
+                    chunk_results += self.request_executor.map(fetch_chunk, chunks[1:])
+                else:
+                    chunk_results = list(self.request_executor.map(fetch_chunk, chunks))
+
+                if all(result is None for result in chunk_results):
+                    logging.error('Price data request failed for all %s chunks', len(chunks)) # Changed to English
+                    return {}
+
+                # 合并为同一个 price_data 字典；失败批次中的代币会作为缺失代币交给补取器
+                data = {}
+                for result in chunk_results:
+                    if result:
+                        data.update(result)
+                logging.debug('Received price data: %s', data) # Changed to English (%s 延迟格式化，DEBUG 关闭时不序列化)
+                
+                # 记录哪些代币获取到了数据，哪些没有
+                missing_ids = []
+                symbols = {token["id"]: token["symbol"] for token in self.user_tokens}
+                for token_id in token_ids:
+                    if token_id in data:
+                        logging.debug('Successfully fetched %s price data', symbols.get(token_id, token_id)) # Changed to English
+                        self.missing_token_resolver.mark_resolved(token_id)
+                    else:
+                        missing_ids.append(token_id)
+                        if not self.missing_token_resolver.is_quarantined(token_id):
+                            logging.warning('Failed to get %s price data', symbols.get(token_id, token_id)) # Changed to English
+
+                # 补取缺失的代币 (跳过已隔离的 ID，其余并发二分重取，有总时限)；被限流时留到下个周期
+                if missing_ids and rate_limited:
+                    logging.info('Skipping refetch of %s missing tokens while rate limited', len(missing_ids))
+                elif missing_ids:
+                    logging.debug("Resolving %s missing tokens' prices", len(missing_ids))
+                    data.update(self.missing_token_resolver.resolve(
+                        missing_ids, lambda ids: self._request_price_batch(ids, *budget(5)), deadline=deadline))
+
+                return data
+                
+            except requests.RequestException as e:
+                logging.error('Network error while requesting price data: %s', e)
+                return {}
+                
+        except Exception as e:
+            logging.error('Error fetching price data: %s', e)
+            import traceback
+            logging.error(traceback.format_exc())
+            return {}
+
+    def _chunk_token_ids(self, token_ids):
+        """把代币 ID 切分为批次，每批不超过 price_chunk_size 个且 ids 查询串不超过 MAX_IDS_QUERY_LENGTH"""
+        chunks = []
+        current = []
+        query_length = 0
+        for token_id in token_ids:
+            extra = len(token_id) + 3  # 分隔逗号在 URL 中编码为 %2C
+            if current and (len(current) >= self.price_chunk_size or query_length + extra > self.MAX_IDS_QUERY_LENGTH):
+                chunks.append(current)
+                current = []
+                query_length = 0
+            current.append(token_id)
+            query_length += extra
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def _request_price_batch(self, token_ids, timeout=10, max_wait=None):
+        """请求一批代币的价格；请求失败返回 None，成功返回 {id: price_data}，被限流时抛出 RateLimitedError
+
+        max_wait 为等待限流令牌的上限 (默认等于 timeout)。
+        """
+        params = {
+            "ids": ",".join(token_ids),
+            "vs_currencies": "usd",
+            "include_24hr_change": "true"
+        }
+        try:
+            response = self.http_client.get(self.PRICE_API_URL, params=params, timeout=timeout, max_wait=max_wait)
+            if response.status_code != 200:
+                logging.warning('Price batch request for %s tokens failed: HTTP %s', len(token_ids), response.status_code)
+                return None
+            data = response.json()
+            return data if isinstance(data, dict) else None
+        except RateLimitedError:
+            raise
+        except (requests.RequestException, ValueError) as e:
+            logging.warning('Price batch request for %s tokens failed: %s', len(token_ids), e)
+            return None
+
+    def get_fear_greed_index(self): # 移除 force_update 参数
+        """从 CoinMarketCap 网页抓取恐惧和贪婪指数 (无缓存)，流式扫描响应，找到指数后立即停止读取"""
+        with self.fear_greed_lock: # 锁保护抓取过程
+            now = datetime.now()
+            logging.info('Attempting to fetch new Fear & Greed index data via scraping...') # Restored log message
+            headers = {
+                # 模拟浏览器访问，否则可能被阻止
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+            }
+
+            try:
+                # 限流等待 + 请求超时留在任务总超时 (FEAR_GREED_FETCH_TIMEOUT) 之内
+                response = self.http_client.get(self.fear_greed_url, headers=headers, timeout=15, stream=True, max_wait=10) # Increased timeout slightly
+                try:
+                    response.raise_for_status() # 如果请求失败则抛出异常
+                    # !!! 注意：网页结构可能会改变，选择器级联见 FearGreedExtractor.SELECTORS !!!
+                    result = FearGreedExtractor.extract(response.iter_content(chunk_size=FearGreedExtractor.CHUNK_SIZE))
+                finally:
+                    response.close() # 提前停止读取时释放连接
+
+                if result is None:
+                    logging.error("Scraping Error: Could not find fear & greed index in page using any selector or embedded JSON. Selectors might need update.") # Changed to English
+                    return None # 返回 None 表示失败
+
+                index_value, selector = result
+                classification_text = classify_fear_greed(index_value) # 手动根据数值划分分类
+                # 创建符合缓存格式的数据
+                new_data = {
+                    'value': index_value,
+                    'value_classification': classification_text, # 使用手动确定的分类
+                    'timestamp': now.isoformat() # 使用当前时间作为时间戳
+                }
+                logging.info('Fear & Greed index scraped successfully: %s (%s) via %s', index_value, classification_text, selector)
+                return new_data # 直接返回新数据
+
+            except (requests.exceptions.RequestException, RateLimitedError) as e:
+                 logging.error('Scraping Error: Request failed - %s', e)
+                 return None # 返回 None 表示失败
+            except Exception as e:
+                logging.error('Scraping Error: Parsing process failed - %s', e)
+                import traceback
+                logging.error(traceback.format_exc())
+                return None # 返回 None 表示失败
+
+    def record_price_tick(self, price_data):
+        """把一次成功的价格获取结果记入内存价格历史和本地价格存储"""
+        timestamp = time.time()
+        self.price_history.record(price_data, timestamp)
+        if self.price_store is not None:
+            self.price_store.record(price_data, timestamp)
+
+    def _fetch_prices_job(self):
+        """抓取引擎任务：获取价格数据，记入历史并保存为最后已知快照；失败或离线跳过时返回 None"""
+        if not self.connectivity.probe_due():
+            logging.debug('Offline, skipping price fetch (next connectivity probe in %.0fs)', self.connectivity.seconds_until_probe())
+            return None
+        logging.debug('Starting price data fetch...') # Changed log
+        # 限流等待、请求超时和缺失代币补取都按任务剩余时间分配，慢但成功的刷新不会被总超时丢弃
+        price_data = self.get_prices(deadline=time.monotonic() + self.PRICE_FETCH_TIMEOUT - self.PRICE_FETCH_MARGIN)
+        if price_data:
+            self.record_price_tick(price_data)
+            self.price_snapshot.store(price_data)
+        return price_data
+
+    def _fetch_fear_greed_job(self):
+        """抓取引擎任务：获取恐惧贪婪指数 (缓存未过期时跳过抓取)；返回需要显示的数据，无需更新时返回 None"""
+        if self.fear_greed_cache.is_fresh(slack=self.FEAR_GREED_TTL_SLACK):
+            logging.debug('Fear & Greed cache is fresh (age %.0fs), skipping scrape', self.fear_greed_cache.age())
+            return None
+        if not self.connectivity.probe_due():
+            logging.debug('Offline, skipping Fear & Greed scrape')
+            return dict(self.fear_greed_cache.data, stale=True) if self.fear_greed_cache.data is not None else None
+
+        logging.debug('Starting Fear & Greed data fetch...')
+        fear_greed_data = self.get_fear_greed_index()
+
+        if fear_greed_data is not None:
+            self.fear_greed_cache.store(fear_greed_data)
+            return fear_greed_data
+        if self.fear_greed_cache.data is not None:
+            # 抓取失败：继续显示最后一次成功的值，并标记为过期
+            logging.warning("Fear & Greed data fetch failed, showing cached value marked as stale.")
+            return dict(self.fear_greed_cache.data, stale=True)
+        logging.warning("Fear & Greed data fetch failed, UI will not be updated for F&G.")
+        return None
+
+    def collect_feed_metrics(self):
+        """指标采集函数：数据年龄、离线状态、抓取引擎和限流器状态 (导出或刷新统计浮层时调用)"""
+        samples = []
+        if self.prices_updated_at:
+            samples.append(('bera_price_data_age_seconds', {}, time.time() - self.prices_updated_at))
+        if self.fear_greed_cache is not None and self.fear_greed_cache.data is not None:
+            samples.append(('bera_fear_greed_age_seconds', {}, self.fear_greed_cache.age()))
+        if self.connectivity is not None:
+            samples.append(('bera_offline', {}, int(self.connectivity.offline)))
+        if self.fetch_engine is not None:
+            engine = self.fetch_engine.snapshot()
+            active = engine.pop('active')
+            samples.extend(('bera_fetch_jobs_total', {'outcome': outcome}, count) for outcome, count in engine.items())
+            samples.append(('bera_fetch_jobs_active', {}, len(active)))
+        if self.http_client is not None and self.http_client.rate_limiter is not None:
+            for host, budget in self.http_client.rate_limiter.snapshot().items():
+                samples.append(('bera_rate_limit_blocked_seconds', {'host': host}, budget['blocked_for']))
+                samples.append(('bera_rate_limit_factor', {'host': host}, budget['rate_factor']))
+        return samples
+
+    def start_metrics_exporter(self, host=None, port=9465):
+        """在后台线程中提供 Prometheus 指标 (GET /metrics)；端口被占用等错误只记录日志"""
+        self.stop_metrics_exporter()
+        host = host or self.metrics_host
+        try:
+            self.metrics_server = create_metrics_server(host, port)
+        except OSError as e:
+            logging.error(f"Failed to start metrics exporter on {host}:{port}: {e}")
+            return None
+        Thread(target=self.metrics_server.serve_forever, daemon=True, name='metrics-exporter').start()
+        logging.info(f"Prometheus metrics exporter serving on http://{host}:{self.metrics_server.server_address[1]}/metrics")
+        return self.metrics_server
+
+    def stop_metrics_exporter(self):
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+            self.metrics_server = None
+
+    def close_feed(self):
+        """提交尚未写入的价格数据，并关闭指标导出、抓取引擎、共享连接池和请求线程池"""
+        METRICS.remove_collector(self.collect_feed_metrics)
+        self.stop_metrics_exporter()
+        if self.price_store is not None:
+            self.price_store.close()
+        if self.fetch_engine is not None:
+            self.fetch_engine.shutdown()
+        if self.request_executor is not None:
+            self.request_executor.shutdown(wait=False, cancel_futures=True)
+        if self.http_client is not None:
+            self.http_client.close()
+
+# ===================================
+# 无界面守护进程
+# ===================================
+
+class _DaemonRequestHandler:
+    """守护进程的 HTTP 接口 (TCP 端口和 Unix 套接字共用)，与 BaseHTTPRequestHandler 组合使用"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        daemon = self.server.price_daemon
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            if url.path in ('/', '/snapshot'):
+                self._send_json(200, daemon.snapshot_bytes())
+            elif url.path == '/fear-greed':
+                self._send_json(200, json.dumps(daemon.fear_greed_data).encode('utf-8'))
+            elif url.path == '/history':
+                status, payload = daemon.history(query)
+                self._send_json(status, json.dumps(payload).encode('utf-8'))
+            elif url.path == '/poll':
+                since = int(query.get('since', -1))
+                timeout = daemon.poll_timeout(query.get('timeout'))
+                daemon.wait_for_change(since, timeout)
+                self._send_json(200, daemon.snapshot_bytes())
+            elif url.path == '/events':
+                self._stream_events(daemon, int(self.headers.get('Last-Event-ID') or query.get('since', -1)))
+            elif url.path == '/stats':
+                self._send_json(200, json.dumps(daemon.stats()).encode('utf-8'))
+            elif url.path == '/metrics':
+                self._send_body(200, METRICS.render_prometheus().encode('utf-8'), PROMETHEUS_CONTENT_TYPE)
+            else:
+                self._send_json(404, json.dumps({'error': f'Unknown path: {url.path}'}).encode('utf-8'))
+        except ValueError as e:
+            self._send_json(400, json.dumps({'error': str(e)}).encode('utf-8'))
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # 客户端已断开
+
+    def _send_json(self, status, body):
+        self._send_body(status, body, 'application/json')
+
+    def _send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream_events(self, daemon, since):
+        """SSE：版本号变化时推送 snapshot 事件，空闲时定期发送注释行保持连接"""
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        while not daemon.stopping:
+            version = daemon.wait_for_change(since, daemon.SSE_HEARTBEAT)
+            if version > since:
+                since = version
+                self.wfile.write(b'id: %d\nevent: snapshot\ndata: ' % version + daemon.snapshot_bytes() + b'\n\n')
+            else:
+                self.wfile.write(b': keep-alive\n\n')
+            self.wfile.flush()
+
+    def log_message(self, format, *args):
+        logging.debug('Daemon request: %s', format % args)
+
+
+class _DaemonServerMixin:
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        error = sys.exc_info()[1]
+        if isinstance(error, (ConnectionResetError, BrokenPipeError)):
+            return  # 客户端断开 keep-alive 连接
+        logging.error(f"Daemon request failed: {error}")
+
+
+def create_daemon_server(host=None, port=None, unix_socket=None):
+    """创建守护进程的 HTTP 服务器 (Unix 套接字或 TCP 端口)；http.server 只在无界面模式下才导入"""
+    import socketserver
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    if unix_socket:
+        if not hasattr(socketserver, 'UnixStreamServer'):
+            raise RuntimeError('Unix sockets are not supported on this platform')
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)  # 上次运行遗留的套接字文件
+
+        class DaemonUnixRequestHandler(_DaemonRequestHandler, BaseHTTPRequestHandler):
+            disable_nagle_algorithm = False  # Unix 套接字不支持 TCP_NODELAY
+
+        class DaemonUnixServer(_DaemonServerMixin, socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            pass
+
+        return DaemonUnixServer(unix_socket, DaemonUnixRequestHandler)
+
+    class DaemonRequestHandler(_DaemonRequestHandler, BaseHTTPRequestHandler):
+        pass
+
+    class DaemonHTTPServer(_DaemonServerMixin, ThreadingHTTPServer):
+        pass
+
+    return DaemonHTTPServer((host, port), DaemonRequestHandler)
+
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _MetricsRequestHandler:
+    """Prometheus 指标导出接口 (GET /metrics)，与 BaseHTTPRequestHandler 组合使用"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if urlsplit(self.path).path in ('/', '/metrics'):
+            status, body, content_type = 200, METRICS.render_prometheus().encode('utf-8'), PROMETHEUS_CONTENT_TYPE
+        else:
+            status, body, content_type = 404, b'Not found\n', 'text/plain; charset=utf-8'
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # 客户端已断开
+
+    def log_message(self, format, *args):
+        logging.debug('Metrics request: %s', format % args)
+
+
+def create_metrics_server(host, port):
+    """创建 Prometheus 指标导出服务器 (窗口模式和无界面模式共用)；http.server 只在启用导出时才导入"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsRequestHandler(_MetricsRequestHandler, BaseHTTPRequestHandler):
+        pass
+
+    class MetricsHTTPServer(_DaemonServerMixin, ThreadingHTTPServer):
+        pass
+
+    return MetricsHTTPServer((host, port), MetricsRequestHandler)
+
+
+class PriceDaemon(PriceFeedCore):
+    """无界面守护进程 (--headless)：只运行抓取与缓存核心，不创建任何 Qt 控件
+
+    通过本地 HTTP 端口或 Unix 套接字以 JSON 提供数据，多个看板和脚本可共用同一个轮询器:
+        GET /snapshot        最新快照 (价格、比率、恐惧贪婪指数和版本号)
+        GET /fear-greed      恐惧贪婪指数
+        GET /history?id=...  内存中的最近价格 (可选 points=N)；带 start/end (Unix 时间戳) 时查询本地价格存储
+        GET /poll?since=V    长轮询：版本号大于 V 时立即返回快照，否则最多等待 timeout 秒
+        GET /events          SSE：每次数据变化推送一条 snapshot 事件
+        GET /stats           抓取引擎、限流器和网络连通性状态，以及全部运行指标
+        GET /metrics         Prometheus 文本格式的运行指标
+    """
+
+    POLL_TIMEOUT = 30  # 秒，长轮询的默认等待时间
+    MAX_POLL_TIMEOUT = 300  # 秒，长轮询允许的最长等待时间
+    SSE_HEARTBEAT = 15  # 秒，SSE 空闲时发送保活注释的间隔
+
+    def __init__(self, host=None, port=None, unix_socket=None):
+        self.init_feed_state()
+        self.price_data = None
+        self.prices_stale = True  # 价格是否仍是上次运行保存的快照 (本次运行尚未成功获取)
+        self.fear_greed_data = None
+        self.version = 0  # 数据每变化一次加一，供长轮询和 SSE 判断是否有新数据
+        self.changed = Condition()
+        self.stopping = False
+        self._snapshot = (-1, b'')  # (版本号, 序列化后的快照)，同一版本只序列化一次
+
+        config = self.read_config_file()
+        self.load_feed_config(config, self.on_fetch_result)
+        self.update_cross_rate_watchlist()
+        STARTUP_TIMELINE.mark('config')
+        self.fear_greed_data = self.fear_greed_cache.data  # 先提供缓存值，过期时后台重新抓取
+        if self.price_snapshot.data:
+            # 先提供上次保存的价格 (prices_stale 为 true)，首次获取成功后替换
+            self.price_data = self.price_snapshot.data
+            self.prices_updated_at = self.price_snapshot.fetched_at
+            self.cross_rates.update(self.price_data)
+
+        daemon_config = config.get('daemon', {})
+        self.unix_socket = unix_socket or daemon_config.get('unix_socket')
+        if self.unix_socket:
+            self.server = create_daemon_server(unix_socket=self.unix_socket)
+            self.address = self.unix_socket
+        else:
+            host = host or daemon_config.get('host', '127.0.0.1')
+            port = daemon_config.get('port', 8765) if port is None else port
+            self.server = create_daemon_server(host, port)
+            self.address = f"http://{host}:{self.server.server_address[1]}"
+        self.server.price_daemon = self
+
+    def on_fetch_result(self, name, result):
+        """抓取引擎线程：更新数据并唤醒等待中的长轮询和 SSE 连接"""
+        if result is None or (name == 'prices' and not result):
+            return
+        with self.changed:
+            if name == 'prices':
+                self.price_data = result
+                self.prices_updated_at = time.time()
+                self.prices_stale = False
+                self.cross_rates.update(result)
+                if STARTUP_TIMELINE.mark('first_data') is not None:
+                    logging.info(f"Startup timeline: {STARTUP_TIMELINE.summary()}")
+            elif name == 'fear_greed':
+                self.fear_greed_data = result
+            self.version += 1
+            self.changed.notify_all()
+
+    @classmethod
+    def poll_timeout(cls, value):
+        """解析长轮询的 timeout 参数 (秒)，限制在 [0, MAX_POLL_TIMEOUT]；nan/inf 无法作为等待时间，抛出 ValueError"""
+        if value is None:
+            return float(cls.POLL_TIMEOUT)
+        timeout = float(value)
+        if not math.isfinite(timeout):
+            raise ValueError(f"Invalid timeout: {value}")
+        return max(0.0, min(timeout, float(cls.MAX_POLL_TIMEOUT)))
+
+    def wait_for_change(self, since, timeout):
+        """等待版本号超过 since (最多 timeout 秒)，返回当前版本号"""
+        with self.changed:
+            self.changed.wait_for(lambda: self.version > since or self.stopping, timeout)
+            return self.version
+
+    def snapshot_bytes(self):
+        """返回当前快照的 JSON (按版本号缓存)"""
+        with self.changed:
+            version, body = self._snapshot
+            if version == self.version:
+                return body
+            ratios = {}
+            for token in self.user_tokens:
+                base_id = self.cross_rates.base_of(token["id"])
+                if base_id is not None:
+                    ratios[token["id"]] = {'base': base_id, 'base_symbol': self.quote_base_symbols.get(token["id"]),
+                                           'ratio': self.cross_rates.ratio(token["id"])}
+            snapshot = {
+                'version': self.version,
+                'prices_updated_at': self.prices_updated_at,
+                'prices_stale': self.prices_stale and self.price_data is not None,
+                'tokens': [{'id': token["id"], 'symbol': token["symbol"].upper(), 'name': token.get("name")}
+                           for token in self.user_tokens],
+                'prices': self.price_data or {},
+                'ratios': ratios,
+                'fear_greed': self.fear_greed_data,
+            }
+            body = json.dumps(snapshot).encode('utf-8')
+            self._snapshot = (self.version, body)
+            return body
+
+    def history(self, query):
+        """按查询参数返回价格历史，返回 (HTTP 状态码, 数据)"""
+        token_id = query.get('id')
+        if not token_id:
+            raise ValueError("Missing required parameter 'id'")
+        if 'start' in query or 'end' in query:
+            if self.price_store is None:
+                return 404, {'error': 'Price store is disabled (history.persist is false)'}
+            end = int(query['end']) if 'end' in query else None
+            start = int(query['start']) if 'start' in query else int(time.time()) - 86400
+            return 200, {'id': token_id, 'points': self.price_store.query(token_id, start, end)}
+        points = int(query['points']) if 'points' in query else None
+        with self.price_history.lock:
+            history = self.price_history.get(token_id)
+            if history is None:
+                return 404, {'error': f'No history for {token_id}'}
+            columns = [history.values(column, points) for column in ('times', 'prices', 'changes')]
+        # NaN (缺失的涨跌幅) 不是合法的 JSON，转换为 null
+        return 200, {'id': token_id, 'points': [[t, p, None if c != c else c] for t, p, c in zip(*columns)]}
+
+    def stats(self):
+        """返回抓取引擎、限流器、网络连通性、价格历史的状态和全部运行指标"""
+        limiter = self.http_client.rate_limiter
+        return {
+            'fetch_engine': self.fetch_engine.snapshot(),
+            'rate_limiter': limiter.snapshot() if limiter is not None else None,
+            'connectivity': self.connectivity.snapshot(),
+            'history_bytes': self.price_history.nbytes,
+            'version': self.version,
+            'metrics': METRICS.snapshot(),
+        }
+
+    def run(self):
+        """启动周期抓取并在当前线程中提供服务，直到 shutdown 或 Ctrl+C"""
+        if self.network_warm_up:
+            self.http_client.warm_up([self.PRICE_API_URL, self.fear_greed_url])
+        self.fetch_engine.submit_every('prices', self._fetch_prices_job, self.PRICE_FETCH_TIMEOUT, self.update_interval)
+        self.fetch_engine.submit_every('fear_greed', self._fetch_fear_greed_job, self.FEAR_GREED_FETCH_TIMEOUT,
+                                       self.fear_greed_update_interval)
+        logging.info(f"Headless daemon serving on {self.address}")
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            logging.info("Headless daemon interrupted")
+        finally:
+            self.close()
+
+    def shutdown(self):
+        """从其他线程停止服务"""
+        self.server.shutdown()
+
+    def close(self):
+        with self.changed:
+            self.stopping = True
+            self.changed.notify_all()
+        self.server.server_close()
+        if self.unix_socket and os.path.exists(self.unix_socket):
+            os.remove(self.unix_socket)
+        self.close_feed()
+        logging.info("Headless daemon stopped")
+
 # ===================================
 # 主应用类
 # ===================================
 
+_text_palettes = {}  # 文字颜色 -> QPalette
+
+
+def text_palette(color):
+    """返回文字颜色为 color 的 QPalette (按颜色缓存；None 表示默认颜色)
+
+    用 setPalette 切换颜色不会像 setStyleSheet 那样触发整个控件的样式重算。
+    """
+    palette = _text_palettes.get(color)
+    if palette is None:
+        palette = QApplication.palette()
+        if color is not None:
+            palette.setColor(QPalette.WindowText, QColor(color))
+        _text_palettes[color] = palette
+    return palette
+
+
+class SparklineWidget(QWidget):
+    """价格走势迷你折线图：折线缓存为 QPainterPath，只在有新数据点或尺寸变化时重建，绘制时不再分配对象"""
+
+    WIDTH = 48
+
+    def __init__(self, height, parent=None):
+        super().__init__(parent)
+        self.setFixedSize(self.WIDTH, height)  # 固定尺寸，重绘不会触发窗口重新布局
+        self._values = array('d')
+        self._stamp = None  # (最新数据点时间, 数据点数)，用于判断是否有新数据
+        self._path = QPainterPath()
+        self._up_pen = QPen(QColor("#00FF7F"), 1)
+        self._down_pen = QPen(QColor("#FF4500"), 1)
+        self._flat_pen = QPen(QColor("#FFD700"), 1)
+        for pen in (self._up_pen, self._down_pen, self._flat_pen):
+            pen.setCosmetic(True)
+        self._pen = self._flat_pen
+
+    def set_history(self, history, points):
+        """从 TokenHistory 读取最近 points 个价格；没有新数据点时直接返回"""
+        latest = history.latest() if history is not None else None
+        stamp = (latest[0], len(history)) if latest is not None else None
+        if stamp == self._stamp:
+            return
+        self._stamp = stamp
+        self._values = history.values(last=points) if latest is not None else array('d')
+        self._rebuild_path()
+        self.update()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._rebuild_path()
+
+    def _rebuild_path(self):
+        path = QPainterPath()
+        values = self._values
+        if len(values) >= 2:
+            low, high = min(values), max(values)
+            span = high - low
+            width, height = self.width() - 2, self.height() - 2
+            step = width / (len(values) - 1)
+            for i, value in enumerate(values):
+                # 价格不变时画在中间
+                y = 1 + height * (0.5 if span == 0 else 1 - (value - low) / span)
+                if i == 0:
+                    path.moveTo(1, y)
+                else:
+                    path.lineTo(1 + i * step, y)
+            if values[-1] > values[0]:
+                self._pen = self._up_pen
+            elif values[-1] < values[0]:
+                self._pen = self._down_pen
+            else:
+                self._pen = self._flat_pen
+        self._path = path
+
+    def paintEvent(self, event):
+        if self._path.isEmpty():
+            return
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setPen(self._pen)
+        painter.drawPath(self._path)
+        painter.end()
+
+
 class CryptoPriceWidget(QWidget):
     """加密货币价格和变化显示组件，用于显示单个加密货币的价格和24小时变化率"""
     
-    def __init__(self, label_text, font, parent=None):
+    def __init__(self, label_text, font, parent=None, sparkline=False):
         super().__init__(parent)  # 调用父类的初始化方法
         self.setObjectName("priceWidget")  # 设置对象名称，便于样式表选择
         
@@ -199,41 +3107,312 @@ class CryptoPriceWidget(QWidget):
         # 变化百分比
         self.change = QLabel("--.--%")  # 创建变化率标签，初始显示为--.--%
         self.change.setFont(font)  # 设置变化率标签字体
+
+        # 当前显示的内容，用于跳过未变化的更新
+        self._price_text = self.price.text()
+        self._change_text = self.change.text()
+        self._change_color = None
         
+        # 可选的价格走势迷你图
+        self.sparkline = SparklineWidget(self.label.sizeHint().height()) if sparkline else None
+
         # 添加到布局
         layout.addWidget(self.label)  # 将加密货币名称标签添加到布局
         layout.addWidget(self.price)  # 将价格标签添加到布局
         layout.addWidget(self.change)  # 将变化率标签添加到布局
+        if self.sparkline is not None:
+            layout.addWidget(self.sparkline)
         
     def update_price(self, price, change):
-        """更新价格和变化率显示"""
-        if price is not None:
-            self.price.setText(price)  # 更新价格标签文本
-            
-            # 如果价格是"加载中..."或"获取失败"等特殊状态，则不显示变化率
-            if price in ["Loading...", "Fetch Failed", "$--.--"]: # Changed to English
-                self.change.setText("")
-                self.change.setStyleSheet("")
-            else:
-                self.change.setText(change)  # 更新变化率标签文本
-                
-                # 设置颜色
-                if change.startswith("+"):
-                    self.change.setStyleSheet("color: #00FF7F;")  # 上涨时设置为绿色
-                elif change.startswith("-"):
-                    self.change.setStyleSheet("color: #FF4500;")  # 下跌时设置为红色
-                else:
-                    self.change.setStyleSheet("color: #FFFFFF;")  # 无变化或无数据时设置为白色
+        """更新价格和变化率显示；只修改发生变化的标签，返回实际更新的控件属性数"""
+        # 如果价格是"加载中..."或"获取失败"等特殊状态，则不显示变化率
+        if price is None:
+            price, change = "$--.--", ""  # 如果价格为空，显示默认值
+        elif price in ["Loading...", "Fetch Failed", "$--.--"]: # Changed to English
+            change = ""
+
+        # 设置颜色: 上涨绿色、下跌红色、无变化或无数据白色，不显示变化率时使用默认颜色
+        if not change:
+            color = None
+        elif change.startswith("+"):
+            color = "#00FF7F"
+        elif change.startswith("-"):
+            color = "#FF4500"
         else:
-            self.price.setText("$--.--")  # 如果价格为空，显示默认值
-            self.change.setText("")  # 如果变化率为空，不显示
-            self.change.setStyleSheet("")  # 重置样式
+            color = "#FFFFFF"
 
-class BeraHelperApp(QMainWindow):
-    """主应用窗口，显示加密货币价格和恐惧贪婪指数"""
+        updates = 0
+        if price != self._price_text:
+            self.price.setText(price)  # 更新价格标签文本
+            self._price_text = price
+            updates += 1
+        if change != self._change_text:
+            self.change.setText(change)  # 更新变化率标签文本
+            self._change_text = change
+            updates += 1
+        if color != self._change_color:
+            self.change.setPalette(text_palette(color))
+            self._change_color = color
+            updates += 1
+        return updates
+
+class TokenCatalogModel(QAbstractListModel):
+    """代币目录的列表模型：只保存过滤后各行对应的目录下标，显示文本在视图请求时才生成
+
+    过滤直接使用 TokenSearchIndex 的查询结果，并排除已选中的代币，
+    避免对 1.7 万行逐行回调 filterAcceptsRow。
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.search_index = None
+        self._rows = array('I')  # 可见行 -> 目录下标
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._rows):
+            return None
+        token = self.search_index.tokens[self._rows[index.row()]]
+        if role == Qt.DisplayRole:
+            return f"{token['name']} ({token['symbol'].upper()})"
+        if role == Qt.UserRole:
+            return token
+        return None
+
+    def set_filter(self, search_index, search_text, excluded_ids):
+        """按搜索文本重新计算可见行 (excluded_ids 中的代币不显示)"""
+        self.beginResetModel()
+        self.search_index = search_index
+        if search_index is None:
+            self._rows = array('I')
+            self.endResetModel()
+            return
+        excluded_rows = {search_index.position_of(token_id) for token_id in excluded_ids}
+        self._rows = array('I', (i for i in search_index.search(search_text) if i not in excluded_rows))
+        self.endResetModel()
+
+    def remove_row(self, row):
+        """移除单行 (添加代币后调用，不重建整个列表)"""
+        if 0 <= row < len(self._rows):
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self._rows[row]
+            self.endRemoveRows()
+
+
+class TokenManagerDialog(QDialog):
+    """代币管理对话框 (所有代币都可切换显示模式，操作副本保证取消有效)
+
+    对话框只创建一次并在每次打开时复用；可用代币列表是基于 TokenCatalogModel 的虚拟化视图，
+    只有可见行才会生成显示内容。
+    """
+
+    def __init__(self, parent=None, default_base=("berachain-bera", "BERA")):
+        super().__init__(parent)
+        self.setWindowTitle("Token Management") # Changed to English
+        self.setMinimumSize(400, 500)
+
+        self.default_base_id, self.default_base_symbol = default_base  # 比率模式的默认基准代币
+        self.search_index = None
+        self.dialog_user_tokens = []  # 用户代币列表的副本
+        self.selected_tokens_dict = {}  # 副本中的代币 id -> 代币
+
+        layout = QVBoxLayout(self)
+        # --- UI 元素定义 ---
+        search_layout = QHBoxLayout(); search_label = QLabel("Search Coin:"); self.search_input = QLineEdit(); self.search_input.setPlaceholderText("Enter coin name or symbol..."); search_layout.addWidget(search_label); search_layout.addWidget(self.search_input) # Changed placeholder
+        self.available_label = QLabel("Available Tokens: (Double-click to add)") # Changed label
+        self.catalog_model = TokenCatalogModel(self)
+        self.available_list = QListView(); self.available_list.setModel(self.catalog_model); self.available_list.setSelectionMode(QListView.SingleSelection)
+        self.available_list.setUniformItemSizes(True) # 行高一致，视图只需布局可见行
+        self.available_list.setEditTriggers(QListView.NoEditTriggers)
+        selected_label = QLabel("Selected Tokens: (Double-click to remove)"); selected_label.setToolTip(f"Check the box next to a token name to display its value as a ratio (%) to {self.default_base_symbol}. Right-click to choose another base token"); self.selected_list = QListWidget() # Changed label and tooltip
+        self.selected_list.setContextMenuPolicy(Qt.CustomContextMenu)
+        button_layout = QHBoxLayout(); add_button = QPushButton("Add ➡"); remove_button = QPushButton("⬅ Remove"); move_up_button = QPushButton("⬆ Move Up"); move_down_button = QPushButton("⬇ Move Down"); button_layout.addWidget(add_button); button_layout.addWidget(remove_button); button_layout.addWidget(move_up_button); button_layout.addWidget(move_down_button) # Changed button text
+        dialog_buttons = QHBoxLayout(); ok_button = QPushButton("OK"); cancel_button = QPushButton("Cancel"); dialog_buttons.addStretch(); dialog_buttons.addWidget(ok_button); dialog_buttons.addWidget(cancel_button) # Changed button text
+        layout.addLayout(search_layout); layout.addWidget(self.available_label); layout.addWidget(self.available_list); layout.addLayout(button_layout); layout.addWidget(selected_label); layout.addWidget(self.selected_list); layout.addLayout(dialog_buttons)
+
+        # --- 连接信号 ---
+        self.search_input.textChanged.connect(self.fill_available_list) # 索引查询足够快，无需防抖
+        add_button.clicked.connect(self.add_token)
+        remove_button.clicked.connect(self.remove_token)
+        move_up_button.clicked.connect(self.move_up)
+        move_down_button.clicked.connect(self.move_down)
+        ok_button.clicked.connect(self.on_ok)
+        cancel_button.clicked.connect(self.on_cancel)
+        self.available_list.doubleClicked.connect(self.add_token_at)
+        self.selected_list.itemDoubleClicked.connect(self.selected_double_clicked)
+        self.selected_list.customContextMenuRequested.connect(self.show_quote_base_menu)
+
+    def load(self, user_tokens, search_index):
+        """打开前载入用户代币列表的副本；目录版本变化时才更换搜索索引"""
+        try:
+            self.dialog_user_tokens = copy.deepcopy(user_tokens)
+            logging.debug("Successfully created dialog_user_tokens copy") # Changed log
+        except Exception as copy_err:
+            logging.error(f"Failed to create copy of user token list: {copy_err}") # Changed log
+            QMessageBox.critical(self.parentWidget(), "Error", "Cannot open token manager: Failed to create data copy.") # Changed message
+            return False
+        self.selected_tokens_dict = {token["id"]: token for token in self.dialog_user_tokens}
+        self.set_search_index(search_index)
+        self.fill_selected_list()
+        return True
+
+    def set_search_index(self, search_index):
+        """设置目录搜索索引；为 None 时表示目录仍在后台加载，显示“加载中”状态"""
+        self.search_index = search_index
+        loading = search_index is None
+        self.search_input.setEnabled(not loading)
+        self.available_list.setEnabled(not loading)
+        self.available_label.setText("Available Tokens: Loading token catalog..." if loading
+                                     else "Available Tokens: (Double-click to add)") # Changed label
+        self.fill_available_list()
+
+    def selected_tokens(self):
+        """返回确认后的用户代币列表"""
+        return self.dialog_user_tokens
+
+    def fill_available_list(self):
+        """按搜索文本刷新可用代币视图 (只重算可见行映射，不创建列表项)"""
+        search_text = self.search_input.text()
+        logging.debug("fill_available_list: Search text='%s'", search_text) # Changed to English
+        self.catalog_model.set_filter(self.search_index, search_text, self.selected_tokens_dict)
+        logging.debug('fill_available_list completed, %s matching rows', self.catalog_model.rowCount()) # Changed to English
+
+    def fill_selected_list(self):
+        """填充已选代币列表 (使用 dialog_user_tokens)"""
+        self.selected_list.clear()
+        logging.debug("fill_selected_list: Populating list using dialog_user_tokens") # Changed to English
+        for token_data in self.dialog_user_tokens:
+            item_text = f"{token_data['name']} ({token_data['symbol'].upper()})"
+            if token_data.get("quote_base"):
+                item_text += f" / {token_data.get('quote_base_symbol', token_data['quote_base']).upper()}"
+            item = QListWidgetItem(item_text)
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            initial_state = token_data.get("display_as_bera_ratio", False)
+            item.setCheckState(Qt.Checked if initial_state else Qt.Unchecked)
+            item.setData(Qt.UserRole, token_data)
+            self.selected_list.addItem(item)
+        logging.debug('fill_selected_list completed, added %s items', self.selected_list.count()) # Changed to English
+
+    def update_model_from_list_state(self):
+        """将列表状态同步到 dialog_user_tokens 副本"""
+        logging.debug("Syncing list checkbox states to dialog_user_tokens copy...") # Changed to English
+        token_map = {token['id']: token for token in self.dialog_user_tokens}
+        for i in range(self.selected_list.count()):
+            item = self.selected_list.item(i)
+            linked_token_data = item.data(Qt.UserRole)
+            if linked_token_data and isinstance(linked_token_data, dict) and 'id' in linked_token_data:
+                token_id = linked_token_data['id']
+                if token_id in token_map:
+                    if item.flags() & Qt.ItemIsUserCheckable:
+                        current_check_state = (item.checkState() == Qt.Checked)
+                        token_map[token_id]['display_as_bera_ratio'] = current_check_state
+                else: logging.warning(f"Could not find ID in copy when syncing state: {token_id}") # Changed to English
+            else: logging.warning(f"List item {i} has no valid data") # Changed to English
+
+    def show_quote_base_menu(self, pos):
+        """右键菜单：为选中的代币选择比率模式的基准代币 (默认基准或列表中的任一其他代币)"""
+        item = self.selected_list.itemAt(pos)
+        token_data = item.data(Qt.UserRole) if item else None
+        if not token_data:
+            return
+        self.update_model_from_list_state()
+        token = self.selected_tokens_dict[token_data["id"]]
+        menu = QMenu(self)
+        menu.addAction("Show USD price").setData(None)
+        menu.addSeparator()
+        menu.addAction(f"Quote in {self.default_base_symbol} (default)").setData((self.default_base_id, self.default_base_symbol))
+        for other in self.dialog_user_tokens:
+            if other["id"] not in (token["id"], self.default_base_id):
+                menu.addAction(f"Quote in {other['symbol'].upper()}").setData((other["id"], other["symbol"].upper()))
+        action = menu.exec(self.selected_list.viewport().mapToGlobal(pos))
+        if action is None:
+            return
+        base = action.data()
+        token.pop("quote_base", None)
+        token.pop("quote_base_symbol", None)
+        token["display_as_bera_ratio"] = base is not None
+        if base is not None and base[0] != self.default_base_id:
+            token["quote_base"], token["quote_base_symbol"] = base
+        row = self.selected_list.row(item)
+        self.fill_selected_list()
+        self.selected_list.setCurrentRow(row)
+
+    def add_token_at(self, index):
+        """添加可用列表中指定行的代币，只从视图中移除该行"""
+        token_data = self.catalog_model.data(index, Qt.UserRole)
+        if isinstance(token_data, dict) and token_data["id"] not in self.selected_tokens_dict:
+            self.update_model_from_list_state()
+            token_data = copy.deepcopy(token_data)
+            token_data["display_as_bera_ratio"] = False
+            self.dialog_user_tokens.append(token_data)
+            self.selected_tokens_dict[token_data["id"]] = token_data
+            self.catalog_model.remove_row(index.row())
+            self.fill_selected_list()
+
+    def add_token(self):
+        current_index = self.available_list.currentIndex()
+        if current_index.isValid(): self.add_token_at(current_index)
+
+    def selected_double_clicked(self, item):
+        token_data = item.data(Qt.UserRole)
+        if token_data: self.remove_token_by_data(token_data)
+
+    def remove_token_by_data(self, token_data):
+        self.update_model_from_list_state()
+        token_id_to_remove = token_data["id"]
+        self.dialog_user_tokens = [t for t in self.dialog_user_tokens if t["id"] != token_id_to_remove]
+        self.selected_tokens_dict.pop(token_id_to_remove, None)
+        self.fill_selected_list()
+        self.fill_available_list() # 被移除的代币重新出现在可用列表的正确位置
+
+    def remove_token(self):
+        current_item = self.selected_list.currentItem()
+        if current_item:
+            token_data = current_item.data(Qt.UserRole)
+            if token_data: self.remove_token_by_data(token_data)
+
+    def move_up(self):
+        current_row = self.selected_list.currentRow()
+        if current_row > 0:
+            self.update_model_from_list_state()
+            self.dialog_user_tokens[current_row], self.dialog_user_tokens[current_row-1] = \
+                self.dialog_user_tokens[current_row-1], self.dialog_user_tokens[current_row]
+            self.fill_selected_list()
+            self.selected_list.setCurrentRow(current_row-1)
+
+    def move_down(self):
+        current_row = self.selected_list.currentRow()
+        if 0 <= current_row < len(self.dialog_user_tokens) - 1:
+            self.update_model_from_list_state()
+            self.dialog_user_tokens[current_row], self.dialog_user_tokens[current_row+1] = \
+                self.dialog_user_tokens[current_row+1], self.dialog_user_tokens[current_row]
+            self.fill_selected_list()
+            self.selected_list.setCurrentRow(current_row+1)
+
+    def on_cancel(self):
+        logging.debug("User clicked Cancel, discarding changes") # Changed log
+        self.reject()
+
+    def on_ok(self):
+        logging.debug("User clicked OK") # Changed log
+        self.update_model_from_list_state()
+        self.accept()
+
+class BeraHelperApp(QMainWindow, PriceFeedCore):
+    """主应用窗口，显示加密货币价格和恐惧贪婪指数 (数据获取与缓存见 PriceFeedCore)"""
     
-    data_updated = Signal()  # 定义数据更新信号，用于通知UI更新
+    prices_updated = Signal()  # 价格数据更新信号 (只刷新价格区域)
+    fear_greed_updated = Signal()  # 恐惧贪婪指数更新信号 (只刷新 F&G 区域)
     initial_data_ready = Signal(object, object, str) # 新增信号，用于传递首次获取的数据
+    fetch_finished = Signal(str, object) # 抓取引擎任务完成信号 (任务名, 结果)
+    catalog_ready = Signal(object) # 后台代币目录加载完成信号
+
+    COIN_LIST_API_URL = "https://api.coingecko.com/api/v3/coins/list"  # CoinGecko 代币列表接口
+    CATALOG_HISTORY_LIMIT = 20  # 保留的代币目录同步记录条数
+    CATALOG_HISTORY_SAMPLE = 10  # 每条同步记录中保存的新增/移除 ID 示例数
+    STATS_OVERLAY_REFRESH_MS = 2000  # 运行统计浮层的刷新间隔
     
     def __init__(self):
         super().__init__(None, Qt.FramelessWindowHint)
@@ -271,14 +3450,19 @@ class BeraHelperApp(QMainWindow):
         # 加载配置文件
         self.load_config()
         logging.info("load_config completed.") # <--- Checkpoint after
+        STARTUP_TIMELINE.mark('config')
 
         # 创建UI
         self.setup_ui()
         logging.info("setup_ui completed.") # <--- Checkpoint after
+        STARTUP_TIMELINE.mark('ui')
         
         # 连接信号
-        self.data_updated.connect(self.update_ui)  # 将数据更新信号连接到更新UI的槽函数
+        self.prices_updated.connect(self.update_price_display)  # 价格和 F&G 分别刷新
+        self.fear_greed_updated.connect(self.update_fear_greed_display)
         self.initial_data_ready.connect(self.handle_initial_data) # 连接新信号
+        self.fetch_finished.connect(self.handle_fetch_finished) # 抓取引擎结果回到主线程
+        self.catalog_ready.connect(self.handle_catalog_ready) # 代币目录加载完成
         
         # 创建更新定时器 (先创建，但不在这里启动)
         self.timer = QTimer(self) # 主定时器 (价格)
@@ -286,79 +3470,123 @@ class BeraHelperApp(QMainWindow):
         # --- 新增：恐惧贪婪指数定时器 ---
         self.fear_greed_timer = QTimer(self) # F&G 定时器
         self.fear_greed_timer.timeout.connect(self.fetch_fear_greed_data) # 连接到 F&G 获取
+        # 离线时按探测间隔提前重试价格获取 (不必等到下一次价格定时器)
+        self.offline_probe_timer = QTimer(self)
+        self.offline_probe_timer.setSingleShot(True)
+        self.offline_probe_timer.timeout.connect(self.fetch_data)
         
         # 设置窗口置顶
         self.setWindowFlag(Qt.WindowStaysOnTopHint, True)  # 设置窗口置顶标志
         self.is_topmost = True  # 设置置顶状态变量为True
         self.update_pin_button_status()  # 更新置顶按钮状态
         
-        # --- 修改：立即显示加载中，并在后台启动首次获取 ---
+        # --- 立即显示上次保存的数据 (标记为过期) 或加载中，并在后台启动首次获取 ---
         logging.info("UI initialized, preparing to fetch initial data in the background") # Changed to English
-        for token_id, widget in self.token_widgets.items():
-            widget.update_price("Loading...", "") # 立即显示加载状态
-
-        # 启动后台线程执行首次数据获取
-        # 使用 QTimer 稍微延迟启动线程，确保主窗口已显示
-        QTimer.singleShot(500, self.start_initial_fetch_thread) # 延迟 500ms
+        self.show_cached_data()
+
+        # 首次绘制后再启动首次数据获取和代币目录加载 (见 paintEvent)；
+        # 万一窗口迟迟没有绘制 (例如最小化启动)，500ms 后兜底启动
+        QTimer.singleShot(500, self.on_first_paint)
+
+    def show_cached_data(self):
+        """窗口打开时立即显示上次保存的价格和恐惧贪婪指数，价格时间标签标记为过期并显示数据年龄；没有快照时显示加载中"""
+        # 先应用窗口样式表：否则 show() 时的样式初始化会覆盖这里设置的标签调色板 (涨跌和过期颜色)
+        self.ensurePolished()
+        self.fear_greed_data = self.fear_greed_cache.data
+        if self.fear_greed_data is not None:
+            self.update_fear_greed_display()
+        if not self.price_snapshot.data:
+            for token_id, widget in self.token_widgets.items():
+                widget.update_price("Loading...", "") # 立即显示加载状态
+            return
+        self.price_data = self.price_snapshot.data
+        self.prices_updated_at = self.price_snapshot.fetched_at
+        self.current_time = datetime.fromtimestamp(self.prices_updated_at).strftime("%H:%M:%S")
+        self.prices_stale = True
+        self.update_price_display()
+        logging.info(f"Showing last-known prices from {self.current_time} until the first fetch completes") # Changed to English
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.first_paint_done:
+            # 让本次绘制先完成，再在下一轮事件循环中启动后台任务
+            QTimer.singleShot(0, self.on_first_paint)
+
+    def on_first_paint(self):
+        """窗口首次绘制后执行：启动首次数据获取，然后在后台加载代币目录"""
+        if self.first_paint_done:
+            return
+        self.first_paint_done = True
+        STARTUP_TIMELINE.mark('first_paint')
+        logging.info("First paint done, starting deferred startup work") # Changed to English
+        self.start_initial_fetch()
+        # 价格源站的连接由首次获取建立；其余源站在后台预连接 (不再与 setup_ui 争抢 CPU)
+        if self.network_warm_up:
+            self.http_client.warm_up([self.fear_greed_url])
+        self.load_available_tokens()
     
-    def start_initial_fetch_thread(self):
-        """启动一个后台线程来执行首次数据获取"""
-        logging.info("Starting initial data fetch thread...") # Changed to English
-        initial_fetch_thread = Thread(target=self._initial_fetch_thread, daemon=True)
-        initial_fetch_thread.start()
-
-    def _initial_fetch_thread(self):
-        """在后台线程中执行首次数据获取 (价格和F&G并行)"""
-        logging.info("Initial data fetch thread started execution...") # Changed to English
-        price_data = None
-        fear_greed_data = None
-        current_time = datetime.now().strftime("%H:%M:%S") # 初始时间戳
-
-        price_queue = Queue()
-        fg_queue = Queue()
-
-        # 创建并启动获取价格的线程
-        price_thread = Thread(target=lambda q: q.put(self.get_prices()), args=(price_queue,), daemon=True)
-        price_thread.start()
-        logging.debug("Initial price fetch thread started.")
-
-        # 创建并启动获取F&G的线程
-        fg_thread = Thread(target=lambda q: q.put(self.get_fear_greed_index()), args=(fg_queue,), daemon=True)
-        fg_thread.start()
-        logging.debug("Initial F&G fetch thread started.")
-
-        # 等待两个线程完成（设置超时）
-        price_thread.join(timeout=25) # 增加超时
-        fg_thread.join(timeout=25) # 增加超时
-        logging.debug("Initial fetch threads join finished or timed out.")
-
-        # 从队列获取结果
-        try:
-            price_data = price_queue.get_nowait() if not price_queue.empty() else None
-            logging.info(f"Initial price fetch result: {'Success' if price_data is not None else 'Failure/Timeout'}")
-        except Exception as e:
-            logging.error(f"Error getting price data from queue: {e}")
-            price_data = None
-
-        try:
-            fear_greed_data = fg_queue.get_nowait() if not fg_queue.empty() else None
-            logging.info(f"Initial F&G fetch result: {'Success' if fear_greed_data is not None else 'Failure/Timeout'}")
-        except Exception as e:
-            logging.error(f"Error getting F&G data from queue: {e}")
-            fear_greed_data = None
-
-        finally:
-            # 使用信号将结果传递回主线程
-            logging.debug("Emitting initial_data_ready signal.")
-            self.initial_data_ready.emit(price_data, fear_greed_data, current_time)
+    def start_initial_fetch(self):
+        """向抓取引擎提交首次价格获取；恐惧贪婪指数先显示缓存值，由 handle_initial_data 按需在后台刷新"""
+        logging.info("Submitting initial price fetch...") # Changed to English
+        self.initial_fetch_time = datetime.now().strftime("%H:%M:%S") # 初始时间戳
+        self.fetch_engine.submit('initial_prices', self._fetch_prices_job, self.PRICE_FETCH_TIMEOUT, key='prices')
+
+    @Slot(str, object)
+    def handle_fetch_finished(self, name, result):
+        """主线程：接收抓取引擎的任务结果并更新状态"""
+        if name == 'initial_prices':
+            logging.info(f"Initial price fetch result: {'Success' if result else 'Failure'}")
+            self.initial_data_ready.emit(result, self.fear_greed_cache.data, self.initial_fetch_time)
+        elif name == 'prices':
+            if result: # 只有成功获取才更新
+                self.set_live_prices(result)
+                self.prices_updated.emit() # 触发UI更新 (只更新价格和时间)
+            else:
+                if not self.connectivity.offline:
+                    logging.warning("Price data fetch failed, UI will not be updated for prices.")
+        elif name == 'fear_greed':
+            if result is not None:
+                # 注意：不在这里更新 self.current_time，因为它反映的是价格更新时间
+                self.fear_greed_data = result
+                self.fear_greed_updated.emit() # 触发UI更新 (只更新 F&G)
+        if self.first_data_shown:
+            # 任一任务都可能改变离线状态：刷新过期标记和数据年龄，离线时安排下次探测
+            self.update_price_time_label()
+            self.schedule_offline_probe()
+
+    def set_live_prices(self, price_data, current_time=None):
+        """主线程：用本次运行成功获取的价格替换当前数据 (清除过期标记)"""
+        self.price_data = price_data
+        self.prices_updated_at = time.time()
+        self.current_time = current_time or datetime.now().strftime("%H:%M:%S") # 更新价格的时间戳
+        if self.prices_stale:
+            self.prices_stale = False
+            # 从过期快照或离线状态恢复：恐惧贪婪指数也可能已过期，按需在后台重新抓取
+            if self.first_data_shown and not self.fear_greed_cache.is_fresh():
+                self.fetch_fear_greed_data()
+
+    def schedule_offline_probe(self):
+        """离线时在下次探测时间提前重试价格获取；在线时取消"""
+        if not self.connectivity.offline:
+            self.offline_probe_timer.stop()
+            return
+        delay = self.connectivity.seconds_until_probe()
+        # 价格定时器会更早触发时无需额外重试
+        if not self.timer.isActive() or delay * 1000 < self.timer.remainingTime():
+            self.offline_probe_timer.start(int(delay * 1000) + 100)
 
     @Slot(object, object, str)
     def handle_initial_data(self, price_data, fear_greed_data, current_time):
-        """处理后台线程返回的首次数据，更新UI并启动定时器"""
+        """处理后台线程返回的首次数据，更新UI并启动定时器；首次获取失败时继续显示上次保存的价格"""
         logging.info("Received initial data, preparing to update UI and start timers") # Changed log
-        self.price_data = price_data
+        if price_data:
+            self.set_live_prices(price_data, current_time) # 使用初始获取时的时间戳
+        elif self.prices_stale:
+            logging.warning("Initial price fetch failed, keeping last-known prices marked as stale") # Changed to English
+        else:
+            self.price_data = price_data
+            self.current_time = current_time
         self.fear_greed_data = fear_greed_data
-        self.current_time = current_time # 使用初始获取时的时间戳
 
         # 检查获取的数据是否有效
         if self.price_data is None or not self.price_data:
@@ -369,11 +3597,14 @@ class BeraHelperApp(QMainWindow):
                       widget.update_price("Fetch Failed", "--.--%")
 
         if self.fear_greed_data is None:
-             logging.warning("Initial Fear & Greed index data is invalid") # Changed to English
+             logging.info("No cached Fear & Greed index yet, fetching in background") # Changed to English
              # UI 更新时会自动处理 None 的情况
 
         # 更新 UI (会使用 self.price_data 和 self.fear_greed_data)
         self.update_ui()
+        self.first_data_shown = True
+        STARTUP_TIMELINE.mark('first_data')
+        logging.info(f"Startup timeline: {STARTUP_TIMELINE.summary()}")
 
         # --- 在首次数据获取完成后再启动定时器 --- 
         self.timer.start(self.update_interval * 1000) # 启动主价格定时器
@@ -381,19 +3612,35 @@ class BeraHelperApp(QMainWindow):
         # --- 启动 F&G 定时器 --- 
         self.fear_greed_timer.start(self.fear_greed_update_interval * 1000)
         logging.info(f"Fear & Greed update timer started, interval: {self.fear_greed_update_interval} seconds")
+        # 缓存缺失或已过期：先显示缓存值，同时在后台重新抓取 (stale-while-revalidate)
+        if not self.fear_greed_cache.is_fresh():
+            self.fetch_fear_greed_data()
+        self.schedule_offline_probe()
 
     def init_variables(self):
         """初始化变量和状态"""
-        # 加载环境变量（API密钥）
-        load_dotenv(resource_path('.env'))  # 从.env文件加载环境变量
+        # 加载环境变量（API密钥）；.env 已不是必需的，只有文件存在时才导入 python-dotenv
+        env_path = resource_path('.env')
+        if os.path.exists(env_path):
+            from dotenv import load_dotenv
+            load_dotenv(env_path)  # 从.env文件加载环境变量
 
         # 初始化恐惧指数缓存和数据缓存
-        # self.fear_greed_cache = None  # 不再需要缓存
-        # self.fear_greed_last_update = None  # 不再需要缓存时间戳
-        self.fear_greed_lock = Lock()  # 创建线程锁，用于保护恐惧贪婪指数抓取过程
+        self.init_feed_state()
+        self.show_sparkline = False  # 是否在每个代币旁显示价格走势迷你图
+        self.ui_update_stats = {'price_ticks': 0, 'widget_updates': 0, 'last_tick_updates': 0}  # 价格刷新更新的控件属性数
+        self._fear_greed_view = None  # 当前显示的恐惧贪婪指数内容，用于跳过未变化的更新
+        self.sparkline_points = 60  # 走势图显示的最近数据点数
         self.fear_greed_data = None  # 恐惧贪婪指数数据 (用于UI显示)
         self.price_data = None  # 价格数据
         self.current_time = None  # 当前时间
+        self.prices_stale = False  # 当前价格是否来自上次保存的快照 (本次运行尚未成功获取)
+        self.first_data_shown = False  # 首次获取的结果是否已显示 (定时器已启动)
+        self._price_time_view = None  # 当前显示的价格时间标签内容，用于跳过未变化的更新
+        self.show_stats_overlay = False  # 是否显示运行统计浮层 (Ctrl+Shift+S 切换)
+        self.profile_session = None  # 进行中的性能剖析 (ProfileSession，--profile 或 Ctrl+Shift+P 启动)
+        self.profile_config = {}  # 性能剖析配置 (profiling.duration/top/tracemalloc_frames)
+        self.initial_fetch_time = None  # 首次价格获取的提交时间 (显示用)
         
         # 窗口拖动相关
         self.dragging = False  # 是否正在拖动窗口
@@ -403,8 +3650,15 @@ class BeraHelperApp(QMainWindow):
         self.is_topmost = True  # 窗口是否置顶
         
         # 用户自定义代币列表
-        self.user_tokens = []  # 用户选择显示的代币列表
         self.available_tokens = []  # 可用代币列表
+        self.catalog_loaded = False  # available_tokens 是否来自 coingecko.list (而非回退的用户列表)
+        self.catalog_last_checked = None  # 本次运行中最后一次检查代币目录更新的时间
+        self.catalog_version = 0  # 代币目录版本号，每次替换 available_tokens 时递增
+        self.token_search_index = None  # 代币搜索索引 (目录加载线程中构建，目录变化后按版本懒构建)
+        self.token_manager_dialog = None  # 复用的代币管理对话框
+        self.compact_catalog = None  # 当前打开的内存映射代币目录
+        self.catalog_available = False  # 后台目录加载是否已完成 (完成前代币管理器显示“加载中”)
+        self.first_paint_done = False  # 窗口是否已完成首次绘制
         self.token_widgets = {}  # 代币显示组件字典
         
         # 添加自启动操作锁
@@ -420,174 +3674,23 @@ class BeraHelperApp(QMainWindow):
     def load_config(self):
         """加载配置文件，设置应用参数 (所有代币均可切换显示模式)"""
         try:
-            config_path = resource_path('bera_helper_config.json')
-            logging.info(f'Loading configuration file: {config_path}') # Changed to English
-            config = {} # 初始化为空字典
-            if not os.path.exists(config_path):
-                 logging.warning(f"Configuration file not found: {config_path}. Will use and create default configuration.") # Changed to English
-                 # 定义基础的默认配置结构
-                 config = {
-                     # tokens部分会在后面填充默认值
-                     "tokens": {},
-                     
-                     # 样式配置
-                     "styles": {
-                         "FONT_NORMAL": ["Arial", 11],
-                         "UP_COLOR": "#00FF7F",      # 上涨颜色
-                         "DOWN_COLOR": "#FF4500",    # 下跌颜色
-                         "TEXT_COLOR": "#FFD700",    # 文本颜色
-                         "EXTREME_FEAR_COLOR": "#FF0000",  # 极度恐惧颜色
-                         "FEAR_COLOR": "#FF7F00",         # 恐惧颜色
-                         "NEUTRAL_COLOR": "#FFFF00",      # 中性颜色
-                         "GREED_COLOR": "#7FFF00",        # 贪婪颜色
-                         "EXTREME_GREED_COLOR": "#00FF00" # 极度贪婪颜色
-                     },
-                     
-                     # 窗口配置
-                     "window": {
-                         "update_interval": 60  # 更新间隔(秒)
-                     },
-                     
-                     # API配置
-                     "api": {
-                         "coinmarketcap": {
-                             "enabled": True,
-                             "base_url": "https://pro-api.coinmarketcap.com/v3",
-                             "endpoints": {
-                                 "fear_greed": "/fear-and-greed/historical"
-                             },
-                             "params": {
-                                 "fear_greed": {
-                                     "start": 1,
-                                     "limit": 1
-                                 }
-                             },
-                             "update_interval": 3600  # API更新间隔(秒)
-                         }
-                     }
-                 }
-                 # 尝试保存一次初始配置，但不强制要求成功
-                 try:
-                     with open(config_path, 'w', encoding='utf-8') as f_default:
-                         json.dump(config, f_default, indent=2)
-                     logging.info(f"Created basic configuration file: {config_path}") # Changed to English
-                 except Exception as create_err:
-                     logging.error(f"Failed to create default configuration file: {create_err}, will continue using default configuration in memory.") # Changed to English
-            else:
-                 # 文件存在，正常加载
-                 try:
-                     with open(config_path, 'r', encoding='utf-8') as f:
-                        config = json.load(f)
-                 except json.JSONDecodeError as e:
-                     logging.error(f"Configuration file {config_path} format error: {e}. Will use default configuration.") # Changed to English
-                     # 保留上面定义的默认 config 结构
-                 except Exception as load_err:
-                     logging.error(f"Error loading configuration file: {load_err}. Will use default configuration.") # Changed to English
-                     # 保留上面定义的默认 config 结构
+            config = self.read_config_file()
 
             # --- 字体设置 --- 
             styles_config = config.get('styles', {})
             font_config = styles_config.get('FONT_NORMAL', ['Arial', 11])
             self.app_font = QFont(font_config[0], font_config[1])
-            logging.debug(f'Configured font: {font_config[0]}, size: {font_config[1]}') # Changed to English
-
-            # --- 代币ID配置 (从配置文件加载，提供默认值) --- 
-            tokens_config = config.get('tokens', {})
-            self.BERA_ID = tokens_config.get('BERA_ID', "berachain-bera")
-            self.IBGT_ID = tokens_config.get('IBGT_ID', "infrafred-bgt")
-            self.BTC_ID = tokens_config.get('BTC_ID', "bitcoin")
-            self.ETH_ID = tokens_config.get('ETH_ID', "ethereum")
-            # XBERA_ID, XBGT_ID 不再是特殊变量，用户需要在 user_tokens.json 中添加它们
-
-            # --- 提前读取窗口和 F&G 更新间隔配置 --- 
-            self.update_interval = config.get('window', {}).get('update_interval', 60)
-            fg_config = config.get('fear_greed_source', {})
-            self.fear_greed_url = fg_config.get('url', "https://coinmarketcap.com/charts/fear-and-greed-index/")
-            self.fear_greed_update_interval = fg_config.get('update_interval', 900)
-            logging.info(f"Price update interval: {self.update_interval} seconds")
-            logging.info(f"Fear & Greed source URL: {self.fear_greed_url}")
-            logging.info(f"Fear & Greed update interval: {self.fear_greed_update_interval} seconds")
-            
-            # --- 不再需要 RELEVANT_BERA_TOKENS 集合 ---
-            # self.RELEVANT_BERA_TOKENS = {...} # 删除或注释掉这部分
-
-            # --- 准备基础的默认代币列表 (无特殊标志) ---
-            # 这些是程序首次运行时或者加载用户配置失败时使用的
-            base_default_tokens = [
-                {"id": self.BTC_ID, "symbol": "BTC", "name": "Bitcoin"},
-                {"id": self.ETH_ID, "symbol": "ETH", "name": "Ethereum"},
-                {"id": self.BERA_ID, "symbol": "BERA", "name": "Berachain"},
-                {"id": self.IBGT_ID, "symbol": "IBGT", "name": "Infrafred"},
-            ]
-            # 为默认列表添加 display_as_bera_ratio=False 标志
-            default_tokens_with_flags = []
-            for token in base_default_tokens:
-                 token["display_as_bera_ratio"] = False # 所有代币默认显示价格
-                 default_tokens_with_flags.append(token)
-
-            # --- 加载用户代币设置 ---
-            user_tokens_loaded = False
-            user_tokens_path = ""
-            try:
-                user_data_dir = self.get_user_data_dir()
-                user_tokens_path = os.path.join(user_data_dir, 'user_tokens.json')
-                logging.info(f'Attempting to load user token settings: {user_tokens_path}')
+            logging.debug('Configured font: %s, size: %s', font_config[0], font_config[1]) # Changed to English
 
-                if os.path.exists(user_tokens_path):
-                    with open(user_tokens_path, 'r', encoding='utf-8') as f:
-                        loaded_data = json.load(f)
-
-                    loaded_tokens = []
-                    if isinstance(loaded_data, dict) and "tokens" in loaded_data:
-                        if isinstance(loaded_data["tokens"], list): loaded_tokens = loaded_data["tokens"]
-                        else: logging.warning("user_tokens.json 'tokens' key is not a list.")
-                    elif isinstance(loaded_data, list): # 兼容旧格式
-                        loaded_tokens = loaded_data
-                    else: logging.error(f"Invalid format in user_tokens.json: {type(loaded_data)}.")
-
-                    if loaded_tokens:
-                        self.user_tokens = []
-                        processed_ids = set()
-                        for token_data in loaded_tokens:
-                            if isinstance(token_data, dict) and "id" in token_data and token_data["id"] not in processed_ids:
-                                # **确保所有加载的代币都有标志，默认为 False**
-                                if "display_as_bera_ratio" not in token_data:
-                                    token_data["display_as_bera_ratio"] = False
-                                self.user_tokens.append(token_data)
-                                processed_ids.add(token_data["id"])
-                            else: logging.warning(f"Skipping invalid/duplicate token data: {token_data}") # Changed to English
-
-                        if self.user_tokens:
-                             logging.info(f'Loaded user token settings: {len(self.user_tokens)} tokens') # Changed to English
-                             user_tokens_loaded = True
-                             for token in self.user_tokens: logging.debug(f'  Loaded: {token.get("symbol", "?")} ({token.get("id", "?ID")}), Ratio: {token.get("display_as_bera_ratio")}') # Changed to English
-                        else: logging.warning("User token list is empty after processing.") # Changed to English
-                else:
-                    logging.warning(f'User token configuration file not found: {user_tokens_path}. Will use default tokens for the first time.') # Changed to English
+            # --- 代币、更新间隔、缓存、网络和用户代币列表 (与无界面模式共用) ---
+            self.load_feed_config(config, self.fetch_finished.emit)
+
+            # --- 窗口配置 ---
+            self.show_sparkline = config.get('window', {}).get('show_sparkline', False)
+            self.sparkline_points = max(2, int(config.get('window', {}).get('sparkline_points', 60)))
+            self.show_stats_overlay = bool(config.get('metrics', {}).get('show_overlay', False))
+            self.profile_config = config.get('profiling', {})
 
-            except json.JSONDecodeError as e: logging.error(f'Failed to parse user_tokens.json: {e}.') # Changed to English
-            except Exception as e:
-                logging.error(f'Error loading user token settings: {e}.') # Changed to English
-                import traceback; logging.error(traceback.format_exc())
-
-            if not user_tokens_loaded:
-                logging.info('Using default token list.') # Changed to English
-                self.user_tokens = default_tokens_with_flags # 使用带 False 标志的默认列表
-                if user_tokens_path and not os.path.exists(user_tokens_path):
-                    try: self.save_user_tokens()
-                    except Exception as save_e: logging.error(f"Failed to save default token list for the first time: {save_e}") # Changed to English
-
-            # --- 加载其他配置 (部分已提前) --- 
-            self.load_available_tokens()
-            # self.update_interval = config.get('window', {}).get('update_interval', 60) # 已提前
-            # self.api_config = config.get('api', {}) # 不再需要API配置
-            # --- 新增：读取 F&G 配置 --- 
-            # fg_config = config.get('fear_greed_source', {}) # 已提前
-            # self.fear_greed_url = fg_config.get('url', "https://coinmarketcap.com/charts/fear-and-greed-index/") # 提供默认URL # 已提前
-            # self.fear_greed_update_interval = fg_config.get('update_interval', 900) # 提供默认间隔 # 已提前
-            # logging.info(f"Fear & Greed source URL: {self.fear_greed_url}") # 已提前
-            # logging.info(f"Fear & Greed update interval: {self.fear_greed_update_interval} seconds") # 已提前
-            
             self.up_color = QColor(styles_config.get('UP_COLOR', "#00FF7F"))
             self.down_color = QColor(styles_config.get('DOWN_COLOR', "#FF4500"))
             self.text_color = QColor(styles_config.get('TEXT_COLOR', "#FFD700"))
@@ -609,97 +3712,116 @@ class BeraHelperApp(QMainWindow):
             # 极端默认列表，全都不显示比率
             self.user_tokens = [ {"id": self.BTC_ID, "symbol": "BTC", "name": "Bitcoin", "display_as_bera_ratio": False}, {"id": self.ETH_ID, "symbol": "ETH", "name": "Ethereum", "display_as_bera_ratio": False}, {"id": self.BERA_ID, "symbol": "BERA", "name": "Berachain", "display_as_bera_ratio": False}, {"id": self.IBGT_ID, "symbol": "IBGT", "name": "Infrafred", "display_as_bera_ratio": False}, ]
             self.available_tokens = []
-            try: self.load_available_tokens()
-            except Exception as load_list_e: logging.error(f"Failed to load available token list under emergency default settings: {load_list_e}") # Changed to English
+            # 与正常路径相同地创建核心组件 (已创建的保持不变)，保证后续显示缓存数据和抓取时所需的属性都存在
+            if not hasattr(self, 'fear_greed_url'): self.fear_greed_url = "https://coinmarketcap.com/charts/fear-and-greed-index/"
+            if not hasattr(self, 'fear_greed_update_interval'): self.fear_greed_update_interval = 900
+            if self.fear_greed_cache is None: self.setup_fear_greed_cache(3600)
+            if self.price_snapshot is None: self.setup_price_snapshot()
+            if self.price_store is None: self.setup_price_history({})
+            if self.http_client is None: self.setup_network({}, self.fetch_finished.emit)
 
     def load_available_tokens(self):
-        """加载可用的代币列表，并检查是否需要更新"""
+        """在后台线程中加载可用的代币目录，完成后通过 catalog_ready 信号交给主线程"""
+        logging.info("Starting background token catalog load...")
+        Thread(target=self._load_catalog_thread, daemon=True, name='catalog-loader').start()
+
+    def _load_catalog_thread(self):
+        """后台线程：读取紧凑目录 (缺失或过期时回退到 JSON 并重新生成) 并构建搜索索引，不触碰任何 UI"""
+        tokens_path = resource_path('coingecko.list')
+        result = {'path': tokens_path, 'exists': False, 'tokens': None, 'compact': None, 'search_index': None,
+                  'days_since_update': 0}
         try:
-            # 获取代币列表文件路径
-            tokens_path = resource_path('coingecko.list')
             logging.info(f'Attempting to load token list file: {tokens_path}') # Changed to English
-
-            # 检查文件是否存在
-            if os.path.exists(tokens_path):
-                try:
-                    # 检查文件修改时间，决定是否需要提示用户更新
-                    file_mod_time = datetime.fromtimestamp(os.path.getmtime(tokens_path))
-                    now = datetime.now()
-                    days_since_update = (now - file_mod_time).days
-
+            result['exists'] = os.path.exists(tokens_path)
+            if result['exists']:
+                # 检查最后一次确认目录为最新的时间，决定是否需要提示用户更新
+                last_checked = self._catalog_last_checked(tokens_path, self._load_catalog_sync_state())
+                result['days_since_update'] = (datetime.now() - last_checked).days
+
+                # 优先使用内存映射的紧凑目录，缺失或过期时回退到 JSON 并重新生成
+                catalog_path = self._compact_catalog_path()
+                catalog = CompactCoinCatalog.open(catalog_path, tokens_path)
+                if catalog is not None:
+                    logging.info(f'Loaded compact token catalog: {len(catalog)} tokens') # Changed to English
+                    result['tokens'] = result['compact'] = catalog
+                else:
                     with open(tokens_path, 'r', encoding='utf-8') as f:
-                        self.available_tokens = json.load(f)
-
-                    logging.info(f'Loaded available token list: {len(self.available_tokens)} tokens') # Changed to English
-
-                    # 如果列表文件超过30天未更新，弹出提示
-                    if days_since_update > 30:
-                        from PySide6.QtWidgets import QMessageBox
-                        update_msg = QMessageBox(self)
-                        update_msg.setIcon(QMessageBox.Information)
-                        update_msg.setText(f"Token list hasn't been updated for {days_since_update} days.\nUpdate now?") # Changed to English
-                        update_msg.setWindowTitle("Token List Update") # Changed to English
-                        update_msg.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
-                        if update_msg.exec() == QMessageBox.Yes:
-                            QTimer.singleShot(1000, self.check_token_list_updates)
+                        tokens = json.load(f)
+                    logging.info(f'Loaded available token list: {len(tokens)} tokens') # Changed to English
+                    result['tokens'] = tokens
+                    try:
+                        result['tokens'] = result['compact'] = CompactCoinCatalog.rebuild(tokens, catalog_path, tokens_path)
+                        logging.info(f'Generated compact token catalog: {catalog_path}')
+                    except Exception as e:
+                        logging.error(f'Failed to generate compact token catalog: {e}')
 
-                except Exception as e:
-                    logging.error(f'Error reading token list file: {e}') # Changed to English
-                    self.available_tokens = self.user_tokens.copy()
-            else:
-                # 文件不存在，直接触发下载
-                logging.warning(f'Token list file does not exist: {tokens_path}') # Changed to English
-                QTimer.singleShot(1000, self.check_token_list_updates)
-                self.available_tokens = self.user_tokens.copy()
+                # 同时构建搜索索引 (约 1.7 万个代币需要数百毫秒)，首次打开代币管理器时无需在主线程中构建
+                start = time.perf_counter()
+                result['search_index'] = TokenSearchIndex(result['tokens'])
+                logging.info('Built token search index in %.0f ms', (time.perf_counter() - start) * 1000)
         except Exception as e:
-            logging.error(f'Failed to load token list: {e}') # Changed to English
+            logging.error(f'Error reading token list file: {e}') # Changed to English
+        finally:
+            self.catalog_ready.emit(result)
+
+    @Slot(object)
+    def handle_catalog_ready(self, result):
+        """主线程：接收后台加载的代币目录，通知代币管理器，并以非阻塞方式提示目录过期"""
+        if result['tokens'] is not None:
+            self.available_tokens = result['tokens']
+            self.compact_catalog = result['compact']
+            self.catalog_loaded = True
+            self.catalog_version += 1
+            self.missing_token_resolver.set_catalog(self.available_tokens)
+            if result['search_index'] is not None:
+                self.token_search_index = result['search_index']
+                self.token_search_index.version = self.catalog_version
+        else:
             self.available_tokens = self.user_tokens.copy()
+            if not result['exists']:
+                # 文件不存在，直接触发下载
+                logging.warning(f"Token list file does not exist: {result['path']}") # Changed to English
+                QTimer.singleShot(1000, self.check_token_list_updates)
+        self.catalog_available = True
+        self.update_tokens_button.setEnabled(True)
+        self.update_tokens_button.setToolTip("Update token list")
+        logging.info(f'Token catalog ready: {len(self.available_tokens)} tokens')
+
+        # 代币管理器正在显示“加载中”时，刷新为完整目录
+        if self.token_manager_dialog is not None and self.token_manager_dialog.isVisible():
+            self.token_manager_dialog.set_search_index(self.get_token_search_index())
+
+        # 如果列表文件超过30天未更新，以提示气泡代替模态对话框
+        days_since_update = result['days_since_update']
+        if result['tokens'] is not None and days_since_update > 30:
+            notice = f"Token list hasn't been updated for {days_since_update} days.\nClick 🔄 to update." # Changed to English
+            self.update_tokens_button.setToolTip(f"Update token list (last updated {days_since_update} days ago)")
+            QToolTip.showText(self.update_tokens_button.mapToGlobal(self.update_tokens_button.rect().bottomLeft()),
+                              notice, self.update_tokens_button, self.update_tokens_button.rect(), 8000)
     
-    def save_user_tokens(self):
-        """保存用户的代币设置"""
+    def _compact_catalog_path(self):
+        """紧凑目录保存在用户数据目录 (单文件打包版的 coingecko.list 位于每次启动都会删除的临时目录)"""
+        return os.path.join(self.get_user_data_dir(), 'coingecko.catalog')
+
+    def _write_compact_catalog(self, tokens, tokens_path):
+        """由代币列表重新生成紧凑目录并打开它；失败时返回 None (继续使用 JSON 列表)"""
+        catalog_path = self._compact_catalog_path()
         try:
-            # 获取用户数据目录
-            user_data_dir = self.get_user_data_dir()
-            
-            # 确保目录存在
-            if not os.path.exists(user_data_dir):
-                os.makedirs(user_data_dir)
-            
-            # 设置代币配置文件路径
-            user_tokens_path = os.path.join(user_data_dir, 'user_tokens.json')
-            
-            # 保存代币设置
-            with open(user_tokens_path, 'w', encoding='utf-8') as f:
-                json.dump(self.user_tokens, f, ensure_ascii=False, indent=2)
-            
-            logging.info(f'Saved user token settings to: {user_tokens_path}') # Changed to English
-            logging.debug(f'Number of tokens saved: {len(self.user_tokens)}') # Changed to English
-            
-            # 验证保存结果
-            if os.path.exists(user_tokens_path):
-                try:
-                    with open(user_tokens_path, 'r', encoding='utf-8') as f:
-                        saved_data = json.load(f)
-                    logging.debug(f'Verification: Number of tokens in file {len(saved_data)}') # Changed to English
-                except Exception as e:
-                    logging.error(f'Verification failed: {e}') # Changed to English
-            else:
-                logging.error(f'Save failed: File does not exist {user_tokens_path}') # Changed to English
-                
+            previous, self.compact_catalog = self.compact_catalog, None
+            self.compact_catalog = CompactCoinCatalog.rebuild(tokens, catalog_path, tokens_path, previous=previous)
+            logging.info(f'Generated compact token catalog: {catalog_path}')
+            return self.compact_catalog
         except Exception as e:
-            logging.error(f'Failed to save user token settings: {e}') # Changed to English
-    
-    def get_user_data_dir(self):
-        """获取用户数据目录，确保所有相关函数使用相同的路径"""
-        if sys.platform == 'win32':
-            # Windows: 使用 %APPDATA%\BeraHelper
-            appdata = os.getenv('APPDATA')
-            if appdata:
-                return os.path.join(appdata, 'BeraHelper')
-        
-        # 其他系统或未找到 APPDATA: 使用程序所在目录
-        return os.path.dirname(os.path.abspath(sys.argv[0]))
-    
+            logging.error(f'Failed to generate compact token catalog: {e}')
+            return None
+
+    def get_token_search_index(self):
+        """获取当前目录版本的搜索索引 (通常已由目录加载线程构建)；目录变化后才在主线程中重新构建"""
+        if self.token_search_index is None or self.token_search_index.version != self.catalog_version \
+                or self.token_search_index.tokens is not self.available_tokens:
+            self.token_search_index = TokenSearchIndex(self.available_tokens, version=self.catalog_version)
+        return self.token_search_index
+
     def setup_ui(self):
         """设置用户界面，创建和布局UI组件"""
         # 主容器
@@ -734,7 +3856,9 @@ class BeraHelperApp(QMainWindow):
         # 添加代币列表更新按钮
         self.update_tokens_button = QPushButton("🔄")  # 创建更新按钮，使用循环箭头emoji
         self.update_tokens_button.setFont(self.app_font)  # 设置按钮字体
-        self.update_tokens_button.setToolTip("Update token list")  # 设置工具提示 # Changed to English
+        # 后台目录加载完成前禁用：否则同步会与空目录比较，且之后到达的旧目录会覆盖同步结果
+        self.update_tokens_button.setEnabled(False)
+        self.update_tokens_button.setToolTip("Loading token list...")  # 设置工具提示 # Changed to English
         self.update_tokens_button.clicked.connect(self.check_token_list_updates)  # 连接按钮点击信号
         self.update_tokens_button.setStyleSheet("""
             QPushButton {
@@ -799,7 +3923,7 @@ class BeraHelperApp(QMainWindow):
         # 2. 恐惧贪婪指数时间
         self.fear_greed_time = QLabel()  # 创建恐惧贪婪指数时间标签
         self.fear_greed_time.setFont(self.app_font)  # 设置标签字体
-        self.fear_greed_time.setStyleSheet("color: #FFFFFF;")  # 设置标签文本颜色为白色
+        self.fear_greed_time.setPalette(text_palette("#FFFFFF"))  # 设置标签文本颜色为白色 (用调色板，过期时切换颜色无需重算样式)
         self.fear_greed_time.setAlignment(Qt.AlignCenter)  # 设置标签文本居中对齐
         
         # 3. 恐惧贪婪指数
@@ -826,7 +3950,7 @@ class BeraHelperApp(QMainWindow):
         # 4. 最后更新时间
         self.time_label = QLabel()  # 创建最后更新时间标签
         self.time_label.setFont(self.app_font)  # 设置标签字体
-        self.time_label.setStyleSheet("color: #FFFFFF;")  # 设置标签文本颜色为白色
+        self.time_label.setPalette(text_palette("#FFFFFF"))  # 设置标签文本颜色为白色 (用调色板，过期时切换颜色无需重算样式)
         self.time_label.setAlignment(Qt.AlignCenter)  # 设置标签文本居中对齐
         
         # 5. 创建价格显示容器
@@ -844,6 +3968,28 @@ class BeraHelperApp(QMainWindow):
         main_layout.addWidget(fear_greed_frame)  # 将恐惧贪婪指数框架添加到主布局
         main_layout.addWidget(self.time_label)  # 将最后更新时间标签添加到主布局
         main_layout.addWidget(self.price_container)  # 将价格容器添加到主布局
+
+        # 6. 运行统计浮层 (默认隐藏，Ctrl+Shift+S 切换；显示时每 2 秒刷新)
+        self.stats_overlay = QLabel()
+        self.stats_overlay.setFont(QFont('Consolas', 7))
+        self.stats_overlay.setPalette(text_palette("#A0A0A0"))
+        self.stats_overlay.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        self.stats_overlay.setVisible(self.show_stats_overlay)
+        main_layout.addWidget(self.stats_overlay)
+        self.stats_overlay_timer = QTimer(self)
+        self.stats_overlay_timer.timeout.connect(self.refresh_stats_overlay)
+        self.stats_shortcut = QShortcut(QKeySequence("Ctrl+Shift+S"), self)
+        self.stats_shortcut.activated.connect(self.toggle_stats_overlay)
+        # 隐藏的性能剖析快捷键 (在代币管理器等对话框中同样有效)
+        self.profile_timer = QTimer(self)
+        self.profile_timer.setSingleShot(True)
+        self.profile_timer.timeout.connect(self.stop_profiling)
+        self.profile_shortcut = QShortcut(QKeySequence("Ctrl+Shift+P"), self)
+        self.profile_shortcut.setContext(Qt.ApplicationShortcut)
+        self.profile_shortcut.activated.connect(self.toggle_profiling)
+        if self.show_stats_overlay:
+            self.refresh_stats_overlay()
+            self.stats_overlay_timer.start(self.STATS_OVERLAY_REFRESH_MS)
         
         # 设置固定宽度，高度将根据代币数量动态调整
         self.set_dynamic_window_size()
@@ -876,10 +4022,15 @@ class BeraHelperApp(QMainWindow):
         elif total_height > max_height:
             total_height = max_height
             
-        # 固定宽度，动态高度
-        self.setFixedSize(260, total_height)
+        # 运行统计浮层显示时额外增加其高度 (不受最大高度限制)
+        if self.show_stats_overlay:
+            total_height += self.stats_overlay.sizeHint().height() + 4
+
+        # 固定宽度 (显示走势图时加宽)，动态高度
+        width = 260 + (SparklineWidget.WIDTH + 8 if self.show_sparkline else 0)
+        self.setFixedSize(width, total_height)
         
-        logging.debug(f'Window size adjusted: Width=260, Height={total_height} (Token count: {len(self.user_tokens)})') # Changed to English
+        logging.debug('Window size adjusted: Width=%s, Height=%s (Token count: %s)', width, total_height, len(self.user_tokens)) # Changed to English
     
     def create_token_widgets(self):
         """创建代币价格显示组件，并根据设置调整标签"""
@@ -890,32 +4041,129 @@ class BeraHelperApp(QMainWindow):
             widget.deleteLater()
         self.token_widgets.clear()
 
+        self.update_cross_rate_watchlist()
+
         # 根据用户代币列表创建组件
         for token in self.user_tokens:
             token_id = token["id"]
             token_symbol = token["symbol"].upper()
 
-            # 检查是否需要显示为 BERA 比率
-            display_ratio = token.get("display_as_bera_ratio", False)
+            # 检查是否需要显示为比率，以及以哪个代币为基准
+            base_id = self.cross_rates.base_of(token_id)
             # --- Add Logging Here ---
-            logging.debug(f"  Creating widget for {token_symbol}: display_as_bera_ratio = {display_ratio}") # Changed to English
+            logging.debug('  Creating widget for %s: quote base = %s', token_symbol, base_id) # Changed to English
             # --- End Add Logging ---
 
             # 设置标签文本
-            if display_ratio:
-                label_text = f"{token_symbol}/BERA:" # 比率模式标签
+            if base_id is not None:
+                label_text = f"{token_symbol}/{self.quote_base_symbols[token_id]}:" # 比率模式标签
             else:
                 label_text = f"{token_symbol}:" # 正常美元价格标签
 
-            widget = CryptoPriceWidget(label_text, self.app_font)
+            widget = CryptoPriceWidget(label_text, self.app_font, sparkline=self.show_sparkline)
             self.token_widgets[token_id] = widget
             self.price_layout.addWidget(widget)
 
         self.set_dynamic_window_size()
-    
+
+    def toggle_stats_overlay(self):
+        """切换运行统计浮层 (请求延迟、错误数、接收字节数、线程数、界面刷新耗时、数据年龄)"""
+        self.show_stats_overlay = not self.show_stats_overlay
+        if self.show_stats_overlay:
+            self.refresh_stats_overlay()
+            self.stats_overlay_timer.start(self.STATS_OVERLAY_REFRESH_MS)
+        else:
+            self.stats_overlay_timer.stop()
+        self.stats_overlay.setVisible(self.show_stats_overlay)
+        self.set_dynamic_window_size()
+        logging.info(f"Stats overlay {'shown' if self.show_stats_overlay else 'hidden'}")
+
+    @Slot()
+    def refresh_stats_overlay(self):
+        """用 METRICS 的当前快照刷新统计浮层文本"""
+        self.stats_overlay.setText(self.format_stats_overlay(METRICS.snapshot()))
+        if self.show_stats_overlay and self.height() < self.stats_overlay.sizeHint().height():
+            self.set_dynamic_window_size()
+
+    @staticmethod
+    def format_stats_overlay(snapshot):
+        """把指标快照格式化为浮层的多行文本"""
+        def series(name):
+            return snapshot.get(name, [])
+
+        def total(name, **match):
+            return sum(entry['value'] for entry in series(name)
+                       if all(entry['labels'].get(k) == v for k, v in match.items()))
+
+        def ms(seconds):
+            return f"{seconds * 1000:.0f}" if seconds is not None else "-"
+
+        lines = []
+        for entry in series('bera_http_request_duration_seconds'):
+            endpoint = entry['labels'].get('endpoint', '?')
+            counts = {result: total('bera_http_requests_total', endpoint=endpoint, result=result)
+                      for result in ('success', 'http_error', 'rate_limited', 'network_error')}
+            path = endpoint[endpoint.find('/'):] if '/' in endpoint else endpoint  # 端点标签为 主机+路径，浮层只显示路径
+            lines.append(f"{path[-28:]:<28} p50 {ms(entry['p50']):>4} p95 {ms(entry['p95']):>4} ms")
+            lines.append(f"  ok {counts['success']:.0f}  err {counts['http_error']:.0f}  "
+                         f"429 {counts['rate_limited']:.0f}  net {counts['network_error']:.0f}")
+        if not lines:
+            lines.append("No HTTP requests yet")
+        rx_kib = total('bera_http_response_bytes_total') / 1024
+        lines.append(f"Rx {rx_kib:.1f} KiB  in-flight {total('bera_http_requests_in_flight'):.0f}  "
+                     f"jobs {total('bera_fetch_jobs_active'):.0f}  threads {total('bera_threads'):.0f}")
+        ui = {entry['labels'].get('section'): entry for entry in series('bera_ui_update_duration_seconds')}
+        if 'prices' in ui:
+            lines.append(f"UI p50 {ui['prices']['p50'] * 1000:.1f} p95 {ui['prices']['p95'] * 1000:.1f} ms  "
+                         f"({ui['prices']['count']} refreshes)")
+        ages = [f"{label} {format_age(series(name)[0]['value'])}"
+                for label, name in (('prices', 'bera_price_data_age_seconds'), ('F&G', 'bera_fear_greed_age_seconds'))
+                if series(name)]
+        state = "offline" if total('bera_offline') else "online"
+        lines.append(f"Age: {', '.join(ages) or '-'}  ({state})")
+        return "\n".join(lines)
+
+    def toggle_profiling(self):
+        """开始性能剖析；剖析进行中时提前结束并写出结果"""
+        if self.profile_session is not None:
+            self.stop_profiling()
+        else:
+            self.start_profiling()
+
+    def start_profiling(self, duration=None):
+        """在 duration 秒 (默认 profiling.duration) 内采集 cProfile 和 tracemalloc 数据，结束后写入日志目录"""
+        if self.profile_session is not None:
+            return
+        duration = duration or self.profile_config.get('duration', 60)
+        output_dir = os.path.join(LOG_DIR or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs'), 'profiles')
+        self.profile_session = ProfileSession(output_dir, top=self.profile_config.get('top', 30),
+                                              frames=self.profile_config.get('tracemalloc_frames', 1))
+        self.profile_session.start()
+        self.profile_timer.start(int(duration * 1000))
+        self.show_profiling_notice(f"Profiling for {duration:g}s (Ctrl+Shift+P to stop early)")
+
+    @Slot()
+    def stop_profiling(self):
+        """结束性能剖析并写出报告"""
+        self.profile_timer.stop()
+        session, self.profile_session = self.profile_session, None
+        if session is None:
+            return
+        try:
+            report_path = session.stop()
+        except Exception as e:
+            logging.error(f"Failed to write profile: {e}")
+            self.show_profiling_notice(f"Failed to write profile: {e}")
+            return
+        self.show_profiling_notice(f"Profile written to:\n{report_path}")
+
+    def show_profiling_notice(self, text):
+        if self.isVisible():
+            QToolTip.showText(self.mapToGlobal(self.rect().center()), text, self, self.rect(), 5000)
+
     def update_pin_button_status(self):
         """更新置顶按钮显示状态，根据当前置顶状态设置按钮样式"""
-        logging.debug(f'Updating pin button status: is_topmost={self.is_topmost}')  # Changed to English
+        logging.debug('Updating pin button status: is_topmost=%s', self.is_topmost)  # Changed to English
         
         if self.is_topmost:
             # 置顶状态 - 明亮金色，正常大小
@@ -952,7 +4200,7 @@ class BeraHelperApp(QMainWindow):
         
         self.pin_button.setStyleSheet(style)
         self.pin_button.update()  # 强制更新按钮外观
-        logging.debug(f'Button style updated: is_topmost={self.is_topmost}') # Changed to English
+        logging.debug('Button style updated: is_topmost=%s', self.is_topmost) # Changed to English
     
     # 窗口拖动相关方法
     def mousePressEvent(self, event: QMouseEvent):
@@ -1041,273 +4289,38 @@ class BeraHelperApp(QMainWindow):
         self.move(current_pos)
         self.show()
 
-    def get_prices(self):
-        """从 CoinGecko API 获取所有代币的价格数据"""
-        try:
-            # 检查代币列表是否为空
-            if not self.user_tokens:
-                logging.warning("User token list is empty") # Changed to English
-                return {}
-            
-            # 获取所有代币ID
-            token_ids = [token["id"] for token in self.user_tokens]
-            token_ids_str = ",".join(token_ids)
-            
-            url = "https://api.coingecko.com/api/v3/simple/price"
-            params = {
-                "ids": token_ids_str,
-                "vs_currencies": "usd",
-                "include_24hr_change": "true"
-            }
-            
-            logging.debug(f'Requesting price data: {url}') # Changed to English
-            logging.debug(f'Request parameters: {params}') # Changed to English
-            
-            try:
-                response = requests.get(url, params=params, timeout=10)  # 添加超时
-                
-                if response.status_code != 200:
-                    logging.error(f'Price data request failed: HTTP {response.status_code}') # Changed to English
-                    logging.debug(f'Error response: {response.text}')
-                    return {}
-                    
-                data = response.json()
-                logging.debug(f'Received price data: {json.dumps(data, indent=2)}') # Changed to English
-                
-                # 验证数据有效性
-                if not isinstance(data, dict):
-                    logging.error(f'Invalid price data format: {type(data)}') # Changed to English
-                    return {}
-                
-                # 记录哪些代币获取到了数据，哪些没有
-                for token in self.user_tokens:
-                    token_id = token["id"]
-                    if token_id in data:
-                        logging.debug(f'Successfully fetched {token["symbol"]} price data') # Changed to English
-                    else:
-                        logging.warning(f'Failed to get {token["symbol"]} price data') # Changed to English
-                        
-                # 尝试单独获取缺失的代币
-                missing_tokens = [token for token in self.user_tokens if token["id"] not in data]
-                if missing_tokens:
-                    logging.info(f'Attempting to fetch {len(missing_tokens)} missing tokens\' prices')
-                    for token in missing_tokens:
-                        try:
-                            single_params = {
-                                "ids": token["id"],
-                                "vs_currencies": "usd",
-                                "include_24hr_change": "true"
-                            }
-                            single_response = requests.get(url, params=single_params, timeout=5)
-                            if single_response.status_code == 200:
-                                single_data = single_response.json()
-                                if token["id"] in single_data:
-                                    data[token["id"]] = single_data[token["id"]]
-                                    logging.info(f'Successfully fetched {token["symbol"]} price')
-                                else:
-                                    logging.warning(f'Fetching {token["symbol"]} price returned empty data')
-                            else:
-                                logging.warning(f'Failed to fetch {token["symbol"]} price: HTTP {single_response.status_code}')
-                        except Exception as e:
-                            logging.error(f'Error fetching {token["symbol"]} price: {e}')
-                
-                return data
-                
-            except requests.RequestException as e:
-                logging.error(f'Network error while requesting price data: {e}')
-                return {}
-                
-        except Exception as e:
-            logging.error(f'Error fetching price data: {e}')
-            import traceback
-            logging.error(traceback.format_exc())
-            return {}
-
-    def get_fear_greed_index(self): # 移除 force_update 参数
-        """从 CoinMarketCap 网页抓取恐惧和贪婪指数 (无缓存)"""
-        with self.fear_greed_lock: # 锁保护抓取过程
-            now = datetime.now()
-            # --- 移除缓存检查逻辑 ---
-            # should_fetch = False
-            # reason = ""
-            # ... (移除 should_fetch 计算逻辑) ...
-            # logging.debug(f'Checking if new index is needed: {should_fetch}. Reason: {reason}')
-            # if not should_fetch:
-            #     logging.debug('Using cached Fear & Greed index data')
-            #     return self.fear_greed_cache
-
-            # --- 总是尝试获取 --- 
-            logging.info('Attempting to fetch new Fear & Greed index data via scraping...') # Restored log message
-            url = "https://coinmarketcap.com/charts/fear-and-greed-index/"
-            headers = {
-                # 模拟浏览器访问，否则可能被阻止
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-
-            try:
-                response = requests.get(url, headers=headers, timeout=15) # Increased timeout slightly
-                response.raise_for_status() # 如果请求失败则抛出异常
-
-                soup = BeautifulSoup(response.text, 'html.parser')
-
-                # --- Log HTML for debugging ---
-                logging.debug(f"--- Start HTML Snippet for Debugging ---")
-                # Log a portion of the HTML (e.g., first 2000 chars)
-                html_snippet = response.text[:2000]
-                logging.debug(html_snippet)
-                logging.debug(f"--- End HTML Snippet ---")
-
-                # --- 定位元素 ---
-                # !!! 注意：网页结构可能会改变，下面的 CSS 选择器需要根据实际情况调整 !!!
-                index_selector = "span[data-test='fear-greed-index-num']" # 更新的选择器
-                # classification_selector = "div[class*='classification']" # 不再需要抓取分类
-
-                logging.debug(f"Attempting to select index element with selector: '{index_selector}'")
-                index_element = soup.select_one(index_selector) # 使用存储的选择器
-
-                # logging.debug(f"Attempting to select classification element with selector: '{classification_selector}'") # 不再需要
-                # classification_element = soup.select_one(classification_selector) # 不再需要
-
-                if index_element:
-                    index_text = index_element.get_text(strip=True)
-                    # 提取数字部分
-                    match = re.search(r'(\d+)', index_text)
-                    if match:
-                        index_value = int(match.group(1))
-                        classification_text = "Unknown" # Default value
-
-                        # --- 手动根据数值划分分类 ---
-                        if 0 <= index_value <= 24:
-                            classification_text = "Extreme Fear"
-                        elif 25 <= index_value <= 49:
-                            classification_text = "Fear"
-                        elif 50 <= index_value <= 54:
-                            classification_text = "Neutral"
-                        elif 55 <= index_value <= 74:
-                            classification_text = "Greed"
-                        elif 75 <= index_value <= 100:
-                            classification_text = "Extreme Greed"
-                        else:
-                             logging.warning(f"Scraped index value {index_value} is outside the expected 0-100 range.")
-
-                        # # Check if classification element was found *before* trying to use it # 不再需要
-                        # if classification_element:
-                        #     classification_text = classification_element.get_text(strip=True)
-                        # else:
-                        #     logging.warning(f"Scraping Warning: Found index value but NOT classification element (selector: '{classification_selector}'). Setting classification to 'Unknown'.")
-                        #     classification_text = "Unknown"
-
-                        # 创建符合缓存格式的数据
-                        new_data = {
-                            'value': index_value,
-                            'value_classification': classification_text, # 使用手动确定的分类
-                            'timestamp': now.isoformat() # 使用当前时间作为时间戳
-                        }
-                        # self.fear_greed_cache = new_data # 不再更新缓存
-                        # self.fear_greed_last_update = now # 不再更新时间戳
-                        logging.info(f'Fear & Greed index scraped successfully: {index_value} ({classification_text})')
-                        return new_data # 直接返回新数据
-                    else:
-                        logging.error(f"Scraping Error: Could not extract number from text '{index_text}'. Index element found with selector '{index_selector}'") # Changed to English
-                        return None # 返回 None 表示失败
-                else:
-                    # --- 更详细的错误日志 ---
-                    logging.error(f"Scraping Error: Could not find fear & greed index element using selector '{index_selector}'. CSS selector might need update.") # Changed to English
-                    # if not classification_element: # 不再需要检查分类元素
-                    #      logging.error(f"Scraping Error: Also could not find classification element using selector '{classification_selector}'.")
-                    # 可以取消注释下面这行来帮助调试
-                    # logging.debug(f"HTML sample: {soup.prettify()[:2000]}") # Using prettify for better readability
-                    return None # 返回 None 表示失败
-
-            except requests.exceptions.RequestException as e:
-                 logging.error(f'Scraping Error: Request failed - {e}')
-                 return None # 返回 None 表示失败
-            except Exception as e:
-                logging.error(f'Scraping Error: Parsing process failed - {e}')
-                import traceback
-                logging.error(traceback.format_exc())
-                return None # 返回 None 表示失败
-
     @Slot()
     def fetch_data(self):
-        """获取价格数据（在单独线程中执行）"""
-        Thread(target=self._fetch_data_thread, daemon=True).start()
+        """获取价格数据（提交到抓取引擎执行）"""
+        self.fetch_engine.submit('prices', self._fetch_prices_job, self.PRICE_FETCH_TIMEOUT)
 
     # --- 新增：获取恐惧贪婪指数的槽函数 ---
     @Slot()
     def fetch_fear_greed_data(self):
-        """获取恐惧贪婪指数数据（在单独线程中执行）"""
-        Thread(target=self._fetch_fear_greed_thread, daemon=True).start()
+        """获取恐惧贪婪指数数据（提交到抓取引擎执行）"""
+        self.fetch_engine.submit('fear_greed', self._fetch_fear_greed_job, self.FEAR_GREED_FETCH_TIMEOUT)
     
-    def _fetch_data_thread(self):
-        """在线程中获取价格数据"""
-        try:
-            logging.debug('Starting price data fetch...') # Changed log
-
-            # 获取价格数据
-            price_data = self.get_prices()
-
-            # --- 不再在此获取 F&G 数据 ---
-            # fear_greed_data = self.get_fear_greed_index()
-
-            # 存储数据以供UI更新
-            if price_data: # 只有成功获取才更新
-                self.price_data = price_data
-                self.current_time = datetime.now().strftime("%H:%M:%S") # 更新价格的时间戳
-                # 触发UI更新信号 (只更新价格和时间)
-                logging.debug('Emitting UI update signal (price data updated)') # Changed log
-                self.data_updated.emit() # 触发UI更新
-            else:
-                logging.warning("Price data fetch failed, UI will not be updated for prices.")
-
-        except Exception as e:
-            logging.error(f"Price data fetch error: {e}") # Changed log
-            import traceback
-            logging.error(traceback.format_exc())
-
-    # --- 新增：获取恐惧贪婪指数的线程函数 ---
-    def _fetch_fear_greed_thread(self):
-        """在线程中获取恐惧贪婪指数数据"""
-        try:
-            logging.debug('Starting Fear & Greed data fetch...')
-            fear_greed_data = self.get_fear_greed_index()
-
-            if fear_greed_data is not None:
-                # 更新 F&G 数据
-                self.fear_greed_data = fear_greed_data
-                # 注意：不在这里更新 self.current_time，因为它反映的是价格更新时间
-
-                # 触发UI更新信号 (只更新 F&G)
-                logging.debug('Emitting UI update signal (F&G data updated)')
-                self.data_updated.emit() # 触发UI更新
-            else:
-                logging.warning("Fear & Greed data fetch failed, UI will not be updated for F&G.")
-
-        except Exception as e:
-            logging.error(f"Fear & Greed data fetch error: {e}")
-            import traceback
-            logging.error(traceback.format_exc())
-
     @Slot()
     def update_ui(self):
-        """更新UI显示 (支持美元价格和BERA比率模式)"""
+        """更新全部UI显示 (价格和恐惧贪婪指数)"""
+        self.update_price_display()
+        self.update_fear_greed_display()
+
+    @Slot()
+    @timed_ui_update('prices')
+    def update_price_display(self):
+        """更新价格显示 (支持美元价格和任意基准代币的比率模式)；只修改内容发生变化的标签，并统计每次刷新更新的控件属性数"""
+        updates = 0
         try:
             # --- 更新时间标签（显示价格的最后更新时间）---
-            if hasattr(self, 'current_time') and self.current_time:
-                self.time_label.setText(f"Last Updated: {self.current_time}")
-            # else: # Optional: Handle case where time is not yet set
-            #     self.time_label.setText("Last Updated: --:--:--")
+            updates += self.update_price_time_label()
 
             logging.debug("Executing update_ui") # Changed to English
 
             # --- 更新价格显示 (逻辑不变，但数据来源是 self.price_data) ---
             if hasattr(self, 'price_data') and self.price_data:
-                bera_price_usd = None
-                if self.BERA_ID in self.price_data and "usd" in self.price_data[self.BERA_ID]:
-                    bera_price_usd = self.price_data[self.BERA_ID]["usd"]
-                    if bera_price_usd is None or bera_price_usd <= 0:
-                        logging.warning(f"BERA price is invalid ({bera_price_usd}), cannot calculate ratios.") # Changed to English
-                        bera_price_usd = None
+                # 一次遍历算出全部代币对各自基准代币的比率
+                self.cross_rates.update(self.price_data)
 
                 for token in self.user_tokens:
                     try:
@@ -1315,13 +4328,13 @@ class BeraHelperApp(QMainWindow):
                         token_symbol = token["symbol"].upper()
 
                         if token_id not in self.token_widgets:
-                            logging.warning(f"update_ui: Widget not found for {token_id}") # Changed to English
+                            logging.warning('update_ui: Widget not found for %s', token_id) # Changed to English
                             continue
 
                         widget = self.token_widgets[token_id]
-                        display_ratio = token.get("display_as_bera_ratio", False)
+                        base_id = self.cross_rates.base_of(token_id)
                         # --- Add Logging Here ---
-                        logging.debug(f"  Updating {token_symbol}: display_as_bera_ratio = {display_ratio}") # Changed to English
+                        logging.debug('  Updating %s: quote base = %s', token_symbol, base_id) # Changed to English
                         # --- End Add Logging ---
 
                         # 获取当前代币的美元价格和变化率 (保持不变)
@@ -1333,24 +4346,21 @@ class BeraHelperApp(QMainWindow):
                             token_price_usd = token_price_data["usd"]
                             change_usd = token_price_data.get("usd_24h_change")
                             if change_usd is not None: change_text = f"{change_usd:+.2f}%"
-                            else: logging.debug(f"{token_symbol} change is null") # Changed to English
+                            else: logging.debug('%s change is null', token_symbol) # Changed to English
 
                         # --- 开始判断显示模式 ---
-                        if display_ratio:
-                            # --- 比率显示模式 ---
-                            # ... (ratio calculation logic remains the same) ...
-                            if token_price_usd is not None and bera_price_usd is not None:
-                                try:
-                                    ratio = (token_price_usd / bera_price_usd) * 100
-                                    if ratio < 1: ratio_text = f" {ratio:.4f}%"
-                                    elif ratio < 10: ratio_text = f" {ratio:.2f}%"
-                                    else: ratio_text = f" {ratio:.1f}%"
-                                    widget.update_price(ratio_text, change_text)
-                                    # logging.debug(f"    更新 {token_symbol} 比率: {ratio_text}") # Keep or remove this inner log
-                                except ZeroDivisionError: widget.update_price("Error", "--.--%"); logging.error(f"Zero division error calculating {token_symbol}/BERA ratio.") # Changed to English
-                                except Exception as e: widget.update_price("Error", "--.--%"); logging.error(f"Error calculating {token_symbol}/BERA ratio: {e}") # Changed to English
-                            elif bera_price_usd is None: widget.update_price("No BERA", change_text); logging.debug(f"Cannot calculate {token_symbol}/BERA ratio, BERA price unavailable") # Changed to English
-                            else: widget.update_price("N/A", "--.--%"); logging.debug(f"Cannot calculate {token_symbol}/BERA ratio, {token_symbol} price unavailable") # Changed to English
+                        if base_id is not None:
+                            # --- 比率显示模式 (比率已由交叉汇率引擎算好) ---
+                            ratio = self.cross_rates.ratio(token_id)
+                            base_symbol = self.quote_base_symbols.get(token_id, "?")
+                            if ratio is not None:
+                                ratio *= 100
+                                if ratio < 1: ratio_text = f" {ratio:.4f}%"
+                                elif ratio < 10: ratio_text = f" {ratio:.2f}%"
+                                else: ratio_text = f" {ratio:.1f}%"
+                                updates += widget.update_price(ratio_text, change_text)
+                            elif not self.cross_rates.base_available(token_id): updates += widget.update_price(f"No {base_symbol}", change_text); logging.debug('Cannot calculate %s/%s ratio, %s price unavailable', token_symbol, base_symbol, base_symbol) # Changed to English
+                            else: updates += widget.update_price("N/A", "--.--%"); logging.debug('Cannot calculate %s/%s ratio, %s price unavailable', token_symbol, base_symbol, token_symbol) # Changed to English
                         else:
                             # --- 美元价格显示模式 ---
                             # ... (USD price display logic remains the same) ...
@@ -1364,41 +4374,73 @@ class BeraHelperApp(QMainWindow):
                                         elif token_price_usd < 1: price_text = f" ${token_price_usd:.3f}"
                                         elif token_price_usd < 1000: price_text = f" ${token_price_usd:.2f}"
                                         else: price_text = f" ${token_price_usd:,.2f}"
-                                    widget.update_price(price_text, change_text)
+                                    updates += widget.update_price(price_text, change_text)
                                     # logging.debug(f"    更新 {token_symbol} 价格: {price_text}") # Keep or remove
-                                except Exception as e: widget.update_price("$--.--", "--.--%"); logging.error(f"Error formatting price for {token_symbol}: {e}") # Changed to English
-                            else: widget.update_price("$--.--", "--.--%"); logging.debug(f"No price data found for {token_symbol}") # Changed to English
+                                except Exception as e: updates += widget.update_price("$--.--", "--.--%"); logging.error('Error formatting price for %s: %s', token_symbol, e) # Changed to English
+                            else: updates += widget.update_price("$--.--", "--.--%"); logging.debug('No price data found for %s', token_symbol) # Changed to English
+
+                        if widget.sparkline is not None:
+                            with self.price_history.lock:
+                                widget.sparkline.set_history(self.price_history.get(token_id), self.sparkline_points)
 
                     except Exception as token_error:
-                        logging.error(f"Error handling token {token.get('symbol', 'Unknown')}: {token_error}")
+                        logging.error('Error handling token %s: %s', token.get('symbol', 'Unknown'), token_error)
                         try:
-                            if token_id in self.token_widgets: self.token_widgets[token_id].update_price("$Error$", "--.--%")
+                            if token_id in self.token_widgets: updates += self.token_widgets[token_id].update_price("$Error$", "--.--%")
                         except Exception: pass
             else:
                 # 如果没有价格数据，也显示默认值
-                for token_id, widget in self.token_widgets.items(): widget.update_price("$--.--", "--.--%")
+                for token_id, widget in self.token_widgets.items(): updates += widget.update_price("$--.--", "--.--%")
                 # logging.warning("update_ui: No price data available") # Keep or remove this log
 
-            # --- 更新恐惧贪婪指数显示 (逻辑不变，但数据来源是 self.fear_greed_data) ---
-            self.update_fear_greed_display()
-
         except Exception as e:
-            logging.error(f"Error updating UI: {e}")
+            logging.error('Error updating UI: %s', e)
+
+        self.ui_update_stats['price_ticks'] += 1
+        self.ui_update_stats['widget_updates'] += updates
+        self.ui_update_stats['last_tick_updates'] = updates
+        METRICS.inc('bera_ui_widget_updates_total', updates)
+        logging.debug('Price display refreshed: %s widget properties updated', updates)
+
+    def update_price_time_label(self):
+        """更新价格时间标签；价格来自上次保存的快照或处于离线模式时标记为过期并显示数据年龄，返回实际更新的控件属性数"""
+        if not self.current_time:
+            return 0
+        time_text = f"Last Updated: {self.current_time}"
+        offline = self.connectivity.offline
+        stale = self.prices_stale or offline
+        if stale and self.prices_updated_at:
+            age = format_age(time.time() - self.prices_updated_at)
+            time_text = f"{time_text} ({'offline, ' if offline else 'cached, '}{age} ago)"
+        previous = self._price_time_view or (None, None, None)
+        updates = 0
+        if time_text != previous[0]:
+            self.time_label.setText(time_text)
+            updates += 1
+        if stale != previous[1]:
+            self.time_label.setPalette(text_palette("#A0A0A0" if stale else "#FFFFFF"))
+            updates += 1
+        if (stale, offline) != previous[1:]:
+            if offline:
+                self.time_label.setToolTip("No network connectivity, showing the last-known prices")
+            else:
+                self.time_label.setToolTip("Showing prices saved by the previous session" if stale else "")
+        self._price_time_view = (time_text, stale, offline)
+        return updates
 
+    @timed_ui_update('fear_greed')
     def update_fear_greed_display(self):
         """更新恐惧和贪婪指数显示"""
         # --- ADD LOGGING ---
         fg_data_for_update = getattr(self, 'fear_greed_data', 'Attribute not set')
-        logging.debug(f"update_fear_greed_display called. Current self.fear_greed_data: {fg_data_for_update}")
+        logging.debug('update_fear_greed_display called. Current self.fear_greed_data: %s', fg_data_for_update)
         # --- END LOGGING ---
 
         if not hasattr(self, 'fear_greed_data') or not self.fear_greed_data:
             # --- ADD LOGGING ---
             logging.warning("update_fear_greed_display: self.fear_greed_data is missing or falsy. Displaying 'Unknown'.")
             # --- END LOGGING ---
-            self.fear_greed_value.setText(" --")
-            self.fear_greed_class.setText("(Unknown)")
-            self.fear_greed_time.setText("")
+            self._apply_fear_greed_view((" --", "(Unknown)", None, "", False))
             return
         
         try:
@@ -1469,7 +4511,8 @@ class BeraHelperApp(QMainWindow):
                         except ValueError:
                             # 尝试使用更灵活的parser解析
                             try:
-                                dt = parser.parse(ts_str)
+                                from dateutil import parser as date_parser  # 只在非 ISO 格式时才导入
+                                dt = date_parser.parse(ts_str)
                                 local_dt = dt.astimezone()
                                 time_str = local_dt.strftime("%m-%d %H:%M")
                             except Exception:
@@ -1477,13 +4520,14 @@ class BeraHelperApp(QMainWindow):
                     else:
                         # 尝试使用dateutil解析任意格式的日期字符串
                         try:
-                            dt = parser.parse(str(timestamp))
+                            from dateutil import parser as date_parser  # 只在非 ISO 格式时才导入
+                            dt = date_parser.parse(str(timestamp))
                             local_dt = dt.astimezone()
                             time_str = local_dt.strftime("%m-%d %H:%M")
                         except Exception:
                             time_str = f"Date: {timestamp}"
             except Exception as e:
-                logging.error(f"Error handling timestamp: {e}") # Changed to English
+                logging.error('Error handling timestamp: %s', e) # Changed to English
                 time_str = f"Date: {timestamp}"
                 tz_display = ""
 
@@ -1501,24 +4545,43 @@ class BeraHelperApp(QMainWindow):
             else: # Unknown
                 color = "#FFFFFF"
 
-            # 更新UI显示 (Using translated classification)
-            self.fear_greed_value.setText(f" {value}")
-            self.fear_greed_class.setText(f"({classification})")
-            self.fear_greed_class.setStyleSheet(f"color: {color};")
-
             # 显示时间和时区偏移
             if tz_display:
-                self.fear_greed_time.setText(f"Last Updated: {time_str} {tz_display}")
+                time_text = f"Last Updated: {time_str} {tz_display}"
             else:
-                self.fear_greed_time.setText(f"Last Updated: {time_str}")
+                time_text = f"Last Updated: {time_str}"
+            # 抓取失败时显示的是缓存值，标记为过期
+            stale = bool(fear_greed_data.get('stale'))
+            if stale:
+                time_text = f"{time_text} (stale)"
+
+            # 更新UI显示 (Using translated classification)
+            self._apply_fear_greed_view((f" {value}", f"({classification})", color, time_text, stale))
 
         except Exception as e:
-            logging.error(f"Error updating Fear & Greed index display: {e}")
+            logging.error('Error updating Fear & Greed index display: %s', e)
             import traceback
             logging.error(traceback.format_exc())
-            self.fear_greed_value.setText(" --")
-            self.fear_greed_class.setText("(Unknown)")
-            self.fear_greed_time.setText("")
+            self._apply_fear_greed_view((" --", "(Unknown)", None, "", False))
+
+    def _apply_fear_greed_view(self, view):
+        """把 (数值, 分类, 分类颜色, 时间文本, 是否过期) 应用到 F&G 标签，只修改发生变化的部分"""
+        previous = self._fear_greed_view or (None, None, object(), None, None)
+        if view == previous:
+            return
+        value_text, class_text, color, time_text, stale = view
+        if value_text != previous[0]:
+            self.fear_greed_value.setText(value_text)
+        if class_text != previous[1]:
+            self.fear_greed_class.setText(class_text)
+        if color != previous[2]:
+            self.fear_greed_class.setPalette(text_palette(color))
+        if time_text != previous[3]:
+            self.fear_greed_time.setText(time_text)
+        if stale != previous[4]:
+            self.fear_greed_time.setPalette(text_palette("#A0A0A0" if stale else "#FFFFFF"))
+            self.fear_greed_time.setToolTip("Refresh failed, showing the last cached Fear & Greed value" if stale else "")
+        self._fear_greed_view = view
 
     def _write_autostart_registry(self, enable: bool):
         """Helper function to write or delete the registry key. Returns True on success."""
@@ -1546,7 +4609,7 @@ class BeraHelperApp(QMainWindow):
                 else:
                     registry_value = f'"{app_path_raw}" --minimized --no-splash --no-log'
 
-                logging.debug(f"写入注册表的值: {registry_value}")
+                logging.debug('写入注册表的值: %s', registry_value)
                 reg_key = reg.OpenKey(key, key_path, 0, reg.KEY_WRITE)
                 try:
                     reg.SetValueEx(reg_key, app_name, 0, reg.REG_SZ, registry_value)
@@ -1606,7 +4669,7 @@ class BeraHelperApp(QMainWindow):
             # Determine the state to display
             actual_state = self.is_autostart_enabled() # Check actual registry state
             display_state = self.pending_autostart_state if self.pending_autostart_state is not None else actual_state
-            logging.debug(f'Updating autostart button status: Actual={actual_state}, Pending={self.pending_autostart_state}, Display={display_state}') # Changed to English
+            logging.debug('Updating autostart button status: Actual=%s, Pending=%s, Display=%s', actual_state, self.pending_autostart_state, display_state) # Changed to English
 
             if display_state:
                 # Style for ENABLED (or pending enable)
@@ -1669,10 +4732,10 @@ class BeraHelperApp(QMainWindow):
             try:
                 # 尝试查询名为 app_name 的值
                 reg.QueryValueEx(key, app_name)
-                logging.debug(f"Registry autostart entry \'{app_name}\' exists.") # Changed to English
+                logging.debug("Registry autostart entry '%s' exists.", app_name) # Changed to English
                 return True # 如果查询成功，说明已存在
             except FileNotFoundError:
-                logging.debug(f"Registry autostart entry \'{app_name}\' does not exist.") # Changed to English
+                logging.debug("Registry autostart entry '%s' does not exist.", app_name) # Changed to English
                 return False # 如果查询时找不到值，说明不存在
             finally:
                 reg.CloseKey(key) # 确保关闭注册表项
@@ -1754,198 +4817,45 @@ class BeraHelperApp(QMainWindow):
         # Apply pending setting if exists
         self._apply_pending_autostart_setting()
 
+        # 释放紧凑目录的内存映射
+        if self.compact_catalog is not None:
+            self.compact_catalog.close()
+            self.compact_catalog = None
+
+        # 关闭窗口时剖析仍在进行则提前结束并写出结果
+        self.stop_profiling()
+
+        self.close_feed()
+
         logging.info("Allowing window to close.") # Changed to English
         event.accept() # Allow the window to close
 
     def show_token_manager(self):
-        """显示代币管理对话框 (所有代币都可切换显示模式，操作副本保证取消有效)"""
-        from PySide6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout,
-                                      QListWidget, QPushButton, QLineEdit,
-                                      QLabel, QListWidgetItem)
-        from PySide6.QtCore import QTimer, Qt
-
-        dialog = QDialog(self)
-        dialog.setWindowTitle("Token Management") # Changed to English
-        dialog.setMinimumSize(400, 500)
-
-        layout = QVBoxLayout(dialog)
-        # --- UI 元素定义 (保持不变) ---
-        search_layout = QHBoxLayout(); search_label = QLabel("Search Coin:"); search_input = QLineEdit(); search_input.setPlaceholderText("Enter coin name or symbol..."); search_layout.addWidget(search_label); search_layout.addWidget(search_input) # Changed placeholder
-        available_label = QLabel("Available Tokens: (Double-click to add)"); available_list = QListWidget(); available_list.setSelectionMode(QListWidget.SingleSelection) # Changed label
-        selected_label = QLabel("Selected Tokens: (Double-click to remove)"); selected_label.setToolTip("Check the box next to a token name to display its value as a ratio (%) to BERA"); selected_list = QListWidget() # Changed label and tooltip
-        button_layout = QHBoxLayout(); add_button = QPushButton("Add ➡"); remove_button = QPushButton("⬅ Remove"); move_up_button = QPushButton("⬆ Move Up"); move_down_button = QPushButton("⬇ Move Down"); button_layout.addWidget(add_button); button_layout.addWidget(remove_button); button_layout.addWidget(move_up_button); button_layout.addWidget(move_down_button) # Changed button text
-        dialog_buttons = QHBoxLayout(); ok_button = QPushButton("OK"); cancel_button = QPushButton("Cancel"); dialog_buttons.addStretch(); dialog_buttons.addWidget(ok_button); dialog_buttons.addWidget(cancel_button) # Changed button text
-        layout.addLayout(search_layout); layout.addWidget(available_label); layout.addWidget(available_list); layout.addLayout(button_layout); layout.addWidget(selected_label); layout.addWidget(selected_list); layout.addLayout(dialog_buttons)
+        """显示代币管理对话框 (对话框只创建一次，之后每次打开时复用)"""
+        if self.token_manager_dialog is None:
+            self.token_manager_dialog = TokenManagerDialog(self, default_base=(self.BERA_ID, "BERA"))
+        dialog = self.token_manager_dialog
 
+        search_index = self.get_token_search_index() if self.catalog_available else None
+        if not dialog.load(self.user_tokens, search_index):
+            return
 
-        # --- 1. 创建副本和本地字典 (保持不变) ---
-        try:
-             dialog_user_tokens = copy.deepcopy(self.user_tokens)
-             logging.debug("Successfully created dialog_user_tokens copy") # Changed log
-        except Exception as copy_err:
-             logging.error(f"Failed to create copy of user token list: {copy_err}") # Changed log
-             QMessageBox.critical(self, "Error", "Cannot open token manager: Failed to create data copy.") # Changed message
-             return
-        selected_tokens_dict = {token["id"]: token for token in dialog_user_tokens}
-
-
-        # --- 2. 定义核心辅助函数 (调整顺序) ---
-        search_timer = QTimer(); search_timer.setSingleShot(True); search_timer.setInterval(500)
-
-        def fill_available_list(): # <--- 定义移到前面
-            """填充可用代币列表 (使用 self.available_tokens)"""
-            available_list.clear(); search_text = search_input.text().lower()
-            logging.debug(f"fill_available_list: Search text='{search_text}'") # Changed to English
-            count = 0
-            for token in self.available_tokens:
-                if token["id"] in selected_tokens_dict: continue
-                token_id_lower = token["id"].lower()
-                token_symbol_lower = token["symbol"].lower()
-                token_name_lower = token["name"].lower()
-                if search_text and not (
-                    search_text in token_id_lower or
-                    search_text in token_symbol_lower or
-                    search_text in token_name_lower):
-                    continue
-                item = QListWidgetItem(f"{token['name']} ({token['symbol'].upper()})")
-                item.setData(Qt.UserRole, token)
-                available_list.addItem(item)
-                count += 1
-            logging.debug(f"fill_available_list completed, added {count} items") # Changed to English
-
-        def fill_selected_list(): # <--- 定义移到前面
-            """填充已选代币列表 (使用 dialog_user_tokens)"""
-            selected_list.clear()
-            logging.debug("fill_selected_list: Populating list using dialog_user_tokens") # Changed to English
-            for token_data in dialog_user_tokens:
-                item_text = f"{token_data['name']} ({token_data['symbol'].upper()})"
-                item = QListWidgetItem(item_text)
-                item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
-                initial_state = token_data.get("display_as_bera_ratio", False)
-                item.setCheckState(Qt.Checked if initial_state else Qt.Unchecked)
-                item.setData(Qt.UserRole, token_data)
-                selected_list.addItem(item)
-            logging.debug(f"fill_selected_list completed, added {selected_list.count()} items") # Changed to English
-
-        def delayed_search(): # <--- 定义移到前面
-            """延迟执行搜索"""
-            logging.debug("delayed_search: Triggering search timer") # Changed to English
-            search_timer.start()
-
-        def update_model_from_list_state(): # <--- 定义移到前面
-            """将列表状态同步到 dialog_user_tokens 副本"""
-            logging.debug("Syncing list checkbox states to dialog_user_tokens copy...") # Changed to English
-            token_map = {token['id']: token for token in dialog_user_tokens}
-            for i in range(selected_list.count()):
-                item = selected_list.item(i)
-                linked_token_data = item.data(Qt.UserRole)
-                if linked_token_data and isinstance(linked_token_data, dict) and 'id' in linked_token_data:
-                    token_id = linked_token_data['id']
-                    if token_id in token_map:
-                        if item.flags() & Qt.ItemIsUserCheckable:
-                            current_check_state = (item.checkState() == Qt.Checked)
-                            token_map[token_id]['display_as_bera_ratio'] = current_check_state
-                    else: logging.warning(f"Could not find ID in copy when syncing state: {token_id}") # Changed to English
-                else: logging.warning(f"List item {i} has no valid data") # Changed to English
-
-
-        # --- 3. 定义动作/事件处理函数 (现在可以安全调用上面的辅助函数了) ---
-        def available_double_clicked(item):
-            token_data = item.data(Qt.UserRole)
-            add_token_by_data(copy.deepcopy(token_data))
-
-        def selected_double_clicked(item):
-            token_data = item.data(Qt.UserRole)
-            if token_data: remove_token_by_data(token_data)
-
-        def add_token_by_data(token_data):
-            nonlocal dialog_user_tokens # 声明要修改外部作用域变量
-            if isinstance(token_data, dict) and token_data["id"] not in selected_tokens_dict:
-                token_data["display_as_bera_ratio"] = False
-                dialog_user_tokens.append(token_data)
-                selected_tokens_dict[token_data["id"]] = token_data
-                fill_selected_list() # 调用辅助函数
-                fill_available_list() # 调用辅助函数
-
-        def add_token():
-            current_item = available_list.currentItem()
-            if current_item: add_token_by_data(copy.deepcopy(current_item.data(Qt.UserRole)))
-
-        def remove_token_by_data(token_data):
-            nonlocal dialog_user_tokens
-            token_id_to_remove = token_data["id"]
-            dialog_user_tokens = [t for t in dialog_user_tokens if t["id"] != token_id_to_remove]
-            selected_tokens_dict.pop(token_id_to_remove, None)
-            fill_selected_list() # 调用辅助函数
-            fill_available_list() # 调用辅助函数
-
-        def remove_token():
-            current_item = selected_list.currentItem()
-            if current_item:
-                token_data = current_item.data(Qt.UserRole)
-                if token_data: remove_token_by_data(token_data)
-
-        def move_up():
-            nonlocal dialog_user_tokens
-            current_row = selected_list.currentRow()
-            if current_row > 0:
-                update_model_from_list_state() # 调用辅助函数
-                dialog_user_tokens[current_row], dialog_user_tokens[current_row-1] = \
-                    dialog_user_tokens[current_row-1], dialog_user_tokens[current_row]
-                fill_selected_list() # 调用辅助函数
-                selected_list.setCurrentRow(current_row-1)
-
-        def move_down():
-            nonlocal dialog_user_tokens
-            current_row = selected_list.currentRow()
-            if current_row < len(dialog_user_tokens) - 1:
-                update_model_from_list_state() # 调用辅助函数
-                dialog_user_tokens[current_row], dialog_user_tokens[current_row+1] = \
-                    dialog_user_tokens[current_row+1], dialog_user_tokens[current_row]
-                fill_selected_list() # 调用辅助函数
-                selected_list.setCurrentRow(current_row+1)
-
-        def on_cancel():
-            logging.debug("User clicked Cancel, discarding changes") # Changed log
-            dialog.reject()
-
-        def on_ok():
-            logging.debug("User clicked OK") # Changed log
-            update_model_from_list_state() # 调用辅助函数
-            self.user_tokens = dialog_user_tokens
+        if dialog.exec() == QDialog.Accepted:
+            self.user_tokens = dialog.selected_tokens()
             logging.debug("on_ok: Token list state to be saved:") # Changed log
-            for tkn in self.user_tokens: logging.debug(f"  - {tkn.get('symbol', '?')}: display_as_bera_ratio = {tkn.get('display_as_bera_ratio', 'Not Set')}")
+            for tkn in self.user_tokens: logging.debug('  - %s: display_as_bera_ratio = %s', tkn.get('symbol', '?'), tkn.get('display_as_bera_ratio', 'Not Set'))
             self.save_user_tokens()
             self.create_token_widgets()
+            self.price_history.discard({token['id'] for token in self.user_tokens} | set(self.cross_rates.ids) | {self.BERA_ID})
             self.set_dynamic_window_size()
             self.fetch_data()
-            dialog.accept()
-
-        # --- 4. 首次填充列表 ---
-        fill_available_list(); fill_selected_list() # 调用现在肯定已定义的函数
-
-        # --- 5. 连接信号 ---
-        search_input.textChanged.connect(delayed_search)
-        search_timer.timeout.connect(fill_available_list) # 连接到已定义的函数
-        add_button.clicked.connect(add_token)
-        remove_button.clicked.connect(remove_token)
-        move_up_button.clicked.connect(move_up)
-        move_down_button.clicked.connect(move_down)
-        ok_button.clicked.connect(on_ok)
-        cancel_button.clicked.connect(on_cancel)
-        available_list.itemDoubleClicked.connect(available_double_clicked)
-        selected_list.itemDoubleClicked.connect(selected_double_clicked)
-
-        # --- 6. 显示对话框 ---
-        dialog.exec()
 
     def check_token_list_updates(self):
-        """检查CoinGecko代币列表是否有更新，并在需要时更新"""
+        """检查CoinGecko代币列表是否有更新 (条件请求 + 增量合并)，并在需要时更新"""
+        if not self.catalog_available:
+            logging.info('Token catalog is still loading, skipping token list update check')
+            return
         try:
-            from datetime import datetime, timedelta
-            import requests
-            import json
-            import os
             from PySide6.QtWidgets import QMessageBox
             
             # 获取代币列表文件路径
@@ -1960,62 +4870,105 @@ class BeraHelperApp(QMainWindow):
             msg.setStandardButtons(QMessageBox.NoButton)
             msg.show()
             QApplication.processEvents()  # 强制更新UI
+
+            sync_state = self._load_catalog_sync_state()
             
-            needs_update = True
-            
-            # 检查文件是否存在且是否需要更新
+            # 检查文件是否存在且是否需要更新 (以文件修改时间和上次成功检查时间中较晚者为准)
             if os.path.exists(tokens_path):
-                file_mod_time = datetime.fromtimestamp(os.path.getmtime(tokens_path))
+                last_checked = self._catalog_last_checked(tokens_path, sync_state)
                 now = datetime.now()
-                # 如果文件在24小时内更新过，则不需要再次更新
-                if (now - file_mod_time) < timedelta(days=1):
-                    logging.info(f'Token list updated at {file_mod_time}, no update needed') # Changed log
-                    msg.setText("Token list is up to date!\nLast updated: " + 
-                               file_mod_time.strftime("%Y-%m-%d %H:%M:%S"))
+                # 如果24小时内检查过，则不需要再次更新
+                if (now - last_checked) < timedelta(days=1):
+                    logging.info(f'Token list checked at {last_checked}, no update needed') # Changed log
+                    msg.setText("Token list is up to date!\nLast checked: " + 
+                               last_checked.strftime("%Y-%m-%d %H:%M:%S"))
                     msg.setStandardButtons(QMessageBox.Ok)
                     msg.exec()
                     return
+
+            # 有缓存的校验值且本地文件存在时，发送条件请求；未变化时服务器只返回 304
+            headers = {}
+            if os.path.exists(tokens_path):
+                if sync_state.get('etag'):
+                    headers['If-None-Match'] = sync_state['etag']
+                if sync_state.get('last_modified'):
+                    headers['If-Modified-Since'] = sync_state['last_modified']
             
             # 发送请求获取代币列表
             try:
-                logging.info("Fetching token list from CoinGecko API...") # Changed log
-                response = requests.get("https://api.coingecko.com/api/v3/coins/list", 
-                                       timeout=30)  # 增加超时时间
-                
-                if response.status_code == 200:
+                logging.info(f"Fetching token list from CoinGecko API (conditional: {bool(headers)})...") # Changed log
+                # 在主线程中执行，被限流时立即失败而不是阻塞等待令牌
+                response = self.http_client.get(self.COIN_LIST_API_URL, headers=headers or None, timeout=30, max_wait=0)  # 增加超时时间
+                self.catalog_last_checked = datetime.now()
+
+                if response.status_code == 304:
+                    # 未变化：不下载、不写盘
+                    logging.info('Token list not modified since last sync (HTTP 304)')
+                    self._record_catalog_check(sync_state)
+                    msg.setText("Token list is up to date!\n\nNo changes since the last sync.")
+                    msg.setStandardButtons(QMessageBox.Ok)
+                    msg.exec()
+                elif response.status_code == 200:
                     tokens_data = response.json()
-                    
-                    # 计算新旧列表的差异
-                    old_tokens = []
-                    if os.path.exists(tokens_path):
-                        try:
-                            with open(tokens_path, 'r', encoding='utf-8') as f:
-                                old_tokens = json.load(f)
-                        except Exception as e:
-                            logging.error(f'Failed to read old token list: {e}') # Changed log
-
-                    new_tokens_count = len(tokens_data)
-                    old_tokens_count = len(old_tokens)
-                    delta = new_tokens_count - old_tokens_count
-                    
-                    # 保存到文件
+                    if not isinstance(tokens_data, list):
+                        raise ValueError(f"Unexpected token list format: {type(tokens_data)}")
+
+                    # 与内存中的目录做键控差异比较 (无需重新读取旧文件)；没有已加载的目录时视为首次下载
+                    baseline = self.catalog_loaded
+                    old_tokens = self.available_tokens if baseline else []
+                    diff = diff_coin_lists(old_tokens, tokens_data)
+                    validators = {'etag': response.headers.get('ETag'),
+                                  'last_modified': response.headers.get('Last-Modified')}
+                    changed = any(diff[key] for key in ('added', 'removed', 'renamed')) or not os.path.exists(tokens_path)
+
                     try:
-                        with open(tokens_path, 'w', encoding='utf-8') as f:
-                            json.dump(tokens_data, f, ensure_ascii=False)
-                        logging.info(f'Downloaded and saved token list: {new_tokens_count} tokens') # Changed log
-
-                        # 更新内存中的代币列表
-                        self.available_tokens = tokens_data
-                        
-                        # 显示成功消息
-                        delta_text = ""
-                        if delta > 0:
-                            delta_text = f"\n\nAdded {delta} new tokens!" # Changed message
-                        elif delta < 0:
-                            delta_text = f"\n\nRemoved {abs(delta)} tokens." # Changed message
-                        
-                        msg.setText(f"Successfully fetched and updated token list!\n\n" # Changed message
-                                   f"Total {new_tokens_count} tokens{delta_text}")
+                        if changed:
+                            # 将差异应用到现有目录，并以原子替换的方式写回文件
+                            merged_tokens = apply_coin_list_diff(old_tokens, diff)
+                            tmp_path = tokens_path + '.tmp'
+                            with open(tmp_path, 'w', encoding='utf-8') as f:
+                                json.dump(merged_tokens, f, ensure_ascii=False)
+                            os.replace(tmp_path, tokens_path)
+                            logging.info(f"Token list synced: {len(merged_tokens)} tokens, "
+                                         f"+{len(diff['added'])} -{len(diff['removed'])} ~{len(diff['renamed'])}") # Changed log
+
+                            # 更新内存中的代币列表，并重新生成紧凑目录
+                            self.available_tokens = merged_tokens
+                            self.missing_token_resolver.set_catalog(self.available_tokens)
+                            catalog = self._write_compact_catalog(merged_tokens, tokens_path)
+                            if catalog is not None:
+                                self.available_tokens = catalog
+                                self.missing_token_resolver.set_catalog(self.available_tokens)
+                            self.catalog_loaded = True
+                            self.catalog_version += 1
+
+                        if changed and baseline:
+                            # 只记录与已有目录比较得到的变化 (首次下载的“新增”就是整个目录，没有意义)
+                            sync_state.setdefault('history', []).append({
+                                'time': self.catalog_last_checked.isoformat(timespec='seconds'),
+                                'total': len(merged_tokens),
+                                'added': len(diff['added']),
+                                'removed': len(diff['removed']),
+                                'renamed': len(diff['renamed']),
+                                'added_ids': [t['id'] for t in diff['added'][:self.CATALOG_HISTORY_SAMPLE]],
+                                'removed_ids': diff['removed'][:self.CATALOG_HISTORY_SAMPLE]
+                            })
+                            sync_state['history'] = sync_state['history'][-self.CATALOG_HISTORY_LIMIT:]
+                        elif not changed:
+                            logging.info('Token list content unchanged, skipping write') # Changed log
+
+                        # 保存校验值和本次成功检查的时间 (重启后仍据此跳过检查和过期提示)
+                        sync_state.update(validators)
+                        self._record_catalog_check(sync_state)
+
+                        # 显示结果
+                        if changed:
+                            msg.setText(f"Successfully fetched and updated token list!\n\n" # Changed message
+                                        f"Total {len(self.available_tokens)} tokens\n"
+                                        f"Added {len(diff['added'])}, removed {len(diff['removed'])}, "
+                                        f"renamed {len(diff['renamed'])}.")
+                        else:
+                            msg.setText("Token list is up to date!\n\nNo changes since the last sync.")
                         msg.setStandardButtons(QMessageBox.Ok)
                         msg.exec()
                     except Exception as save_err:
@@ -2044,6 +4997,59 @@ class BeraHelperApp(QMainWindow):
             logging.error(traceback.format_exc())
             QMessageBox.critical(self, "错误", f"检查代币列表更新时出错: {e}")
 
+    def _catalog_last_checked(self, tokens_path, sync_state):
+        """返回代币目录最后一次确认为最新的时间：文件修改时间、同步状态中的上次成功检查时间和本次运行中的检查时间取最晚者"""
+        last_checked = datetime.fromtimestamp(os.path.getmtime(tokens_path))
+        try:
+            if sync_state.get('last_checked'):
+                last_checked = max(last_checked, datetime.fromisoformat(sync_state['last_checked']))
+        except (TypeError, ValueError):
+            pass
+        if self.catalog_last_checked and self.catalog_last_checked > last_checked:
+            last_checked = self.catalog_last_checked
+        return last_checked
+
+    def _record_catalog_check(self, sync_state):
+        """记录一次成功的目录检查 (304 或已获取完整列表)，并清除过期提示"""
+        sync_state['last_checked'] = self.catalog_last_checked.isoformat(timespec='seconds')
+        self._save_catalog_sync_state(sync_state)
+        self.update_tokens_button.setToolTip("Update token list")
+
+    def _catalog_sync_state_path(self):
+        return os.path.join(self.get_user_data_dir(), 'coingecko_sync.json')
+
+    def _load_catalog_sync_state(self):
+        """读取代币目录同步状态 (ETag/Last-Modified、上次成功检查时间和同步记录)"""
+        try:
+            with open(self._catalog_sync_state_path(), 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            return state if isinstance(state, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logging.warning(f'Failed to read token list sync state: {e}')
+            return {}
+
+    def _save_catalog_sync_state(self, state):
+        """保存代币目录同步状态"""
+        try:
+            state_path = self._catalog_sync_state_path()
+            os.makedirs(os.path.dirname(state_path), exist_ok=True)
+            with open(state_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logging.error(f'Failed to save token list sync state: {e}')
+
+def apply_metrics_port(feed, port):
+    """--metrics-port 覆盖配置中的 metrics.exporter_port：正数时 (重新) 启动导出，0 时关闭"""
+    if port is None:
+        return
+    if port > 0:
+        feed.start_metrics_exporter(port=port)
+    else:
+        feed.stop_metrics_exporter()
+
+
 def main():
     """主程序入口"""
 
@@ -2056,17 +5062,24 @@ def main():
         choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
         help='Set the logging level (default: INFO)'
     )
+    parser.add_argument('--log-format', choices=['text', 'jsonl'], help='Log file format (default: logging.format from the config, text)')
     # 添加其他可能需要的参数...
     parser.add_argument('--minimized', action='store_true', help='Start minimized (intended for autostart)')
     parser.add_argument('--no-splash', action='store_true', help='Disable splash screen (if implemented)')
     parser.add_argument('--no-log', action='store_true', help='Placeholder for compatibility with autostart entry, does nothing currently.')
+    parser.add_argument('--headless', action='store_true', help='Run only the fetch/cache core without a window and serve data as JSON')
+    parser.add_argument('--listen', metavar='HOST:PORT', help='Address for --headless mode (default: daemon.host/daemon.port from the config, 127.0.0.1:8765)')
+    parser.add_argument('--unix-socket', metavar='PATH', help='Serve --headless mode on a Unix socket instead of a TCP port')
+    parser.add_argument('--profile', nargs='?', type=float, const=0, metavar='SECONDS',
+                        help='Profile the window (cProfile + tracemalloc) for SECONDS (default: profiling.duration from the config, 60) and write the report to the logs directory')
+    parser.add_argument('--metrics-port', type=int, metavar='PORT', help='Serve Prometheus metrics on this port (overrides metrics.exporter_port; 0 disables)')
 
 
     args = parser.parse_args()
 
     # --- 2. 初始化日志系统，传入日志级别 --- 
     # 注意：日志系统现在依赖于命令行参数，必须在解析后初始化
-    setup_logger(args.log_level)
+    setup_logger(args.log_level, args.log_format)
 
     # --- 后续代码保持不变 --- 
 
@@ -2079,8 +5092,21 @@ def main():
         logging.info(f"Working directory: {os.getcwd()}") # Changed log
         logging.info(f"Command line arguments: {sys.argv}") # Changed log
     
+    if args.headless:
+        host, port = None, None
+        if args.listen:
+            host, _, port = args.listen.rpartition(':')
+            host, port = host or None, int(port)
+        if args.profile is not None:
+            logging.warning("--profile is only supported in window mode, ignoring it in --headless mode")
+        daemon = PriceDaemon(host=host, port=port, unix_socket=args.unix_socket)
+        apply_metrics_port(daemon, args.metrics_port)
+        daemon.run()
+        return
+
     logging.info("Starting PySide6 version application") # Changed log
     app = QApplication(sys.argv)
+    STARTUP_TIMELINE.mark('qt_init')
     
     # 设置应用图标
     icon_path = resource_path('bera.ico')
@@ -2100,6 +5126,9 @@ def main():
         logging.warning(f'Global icon file does not exist: {icon_path}') # Changed log
     
     window = BeraHelperApp()
+    apply_metrics_port(window, args.metrics_port)
+    if args.profile is not None:
+        window.start_profiling(args.profile)  # 0 表示使用配置中的时长
     
     # 设置位置（右上角）
     screen = app.primaryScreen().geometry()
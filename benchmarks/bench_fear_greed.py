@@ -0,0 +1,104 @@
+"""
+恐惧贪婪指数提取基准测试: 对比完整 BeautifulSoup 解析与流式 FearGreedExtractor 的 CPU 时间和峰值内存
+
+用法:
+    python benchmarks/bench_fear_greed.py                    # 使用 benchmarks/fixtures 中保存的页面
+    python benchmarks/bench_fear_greed.py --iterations 50
+    python benchmarks/bench_fear_greed.py --html saved_page.html --expected 62
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from BeraHelper import FearGreedExtractor  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# 夹具文件 -> 期望的指数值 (None 表示页面中没有指数)
+FIXTURES = {
+    'fear_greed_span.html': 62,
+    'fear_greed_next_data.html': 37,
+    'fear_greed_missing.html': None,
+}
+
+
+def iter_chunks(data, chunk_size=FearGreedExtractor.CHUNK_SIZE):
+    """模拟 response.iter_content 按块返回响应体"""
+    for offset in range(0, len(data), chunk_size):
+        yield data[offset:offset + chunk_size]
+
+
+def extract_streaming(data):
+    result = FearGreedExtractor.extract(iter_chunks(data))
+    return result[0] if result else None
+
+
+def extract_bs4(data):
+    """原实现：解码整个页面并构建完整的 html.parser 树"""
+    import re
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(data.decode('utf-8'), 'html.parser')
+    element = soup.select_one("span[data-test='fear-greed-index-num']")
+    if element is None:
+        return None
+    match = re.search(r'(\d+)', element.get_text(strip=True))
+    return int(match.group(1)) if match else None
+
+
+def measure(extract, data, iterations):
+    """返回 (结果, 平均 CPU 毫秒, 峰值内存 KiB)；峰值内存单独测量一次，避免 tracemalloc 影响计时"""
+    samples = []
+    for _ in range(iterations):
+        start = time.process_time()
+        result = extract(data)
+        samples.append((time.process_time() - start) * 1000)
+    tracemalloc.start()
+    extract(data)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, statistics.mean(samples), peak / 1024
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Benchmark BeautifulSoup against the streaming Fear & Greed extractor')
+    arg_parser.add_argument('--html', help='Saved HTML page to benchmark (default: bundled fixtures)')
+    arg_parser.add_argument('--expected', type=int, help='Expected index value for --html')
+    arg_parser.add_argument('--iterations', type=int, default=20, help='Iterations per variant (default: 20)')
+    args = arg_parser.parse_args()
+
+    if args.html:
+        cases = {args.html: args.expected}
+    else:
+        cases = {os.path.join(FIXTURES_DIR, name): expected for name, expected in FIXTURES.items()}
+
+    try:
+        import bs4  # noqa: F401
+        variants = [('BeautifulSoup', extract_bs4), ('streaming', extract_streaming)]
+    except ImportError:
+        print("beautifulsoup4 is not installed, only the streaming extractor is measured")
+        variants = [('streaming', extract_streaming)]
+
+    failed = False
+    for path, expected in cases.items():
+        with open(path, 'rb') as f:
+            data = f.read()
+        print(f"{os.path.basename(path)} ({len(data) / 1024:.0f} KiB, expected={expected})")
+        for name, extract in variants:
+            result, cpu_ms, peak_kib = measure(extract, data, args.iterations)
+            status = ''
+            if extract is extract_streaming and (expected is not None or not args.html):
+                # 只校验流式提取器；原实现没有 JSON 回退，结果仅供对照
+                status = 'ok' if result == expected else 'MISMATCH'
+                failed = failed or result != expected
+            print(f"  {name:<14} result={str(result):<5} cpu={cpu_ms:8.3f} ms  peak={peak_kib:9.1f} KiB  {status}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
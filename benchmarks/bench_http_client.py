@@ -0,0 +1,96 @@
+"""
+HTTP 客户端基准测试: 对比每次新建连接的 requests.get 与共享连接池 HttpClient 的单次请求延迟
+
+用法:
+    python benchmarks/bench_http_client.py                 # 使用本地桩服务器
+    python benchmarks/bench_http_client.py --requests 200
+    python benchmarks/bench_http_client.py --url https://api.coingecko.com/api/v3/ping
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests  # noqa: E402
+
+from BeraHelper import HttpClient  # noqa: E402
+
+STUB_BODY = json.dumps({"bitcoin": {"usd": 65000.0, "usd_24h_change": 1.23}}).encode('utf-8')
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """模拟 CoinGecko simple/price 的本地桩服务器，支持 keep-alive"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # 避免 Nagle + 延迟 ACK 给 keep-alive 连接带来 40ms 的人为延迟
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(STUB_BODY)))
+        self.end_headers()
+        self.wfile.write(STUB_BODY)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/api/v3/simple/price"
+
+
+def measure(fetch, url, count):
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = fetch(url)
+        response.content  # 读完响应体，连接才会归还连接池
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def summarize(name, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{name:<24} mean={statistics.mean(samples):8.3f} ms  "
+          f"median={statistics.median(samples):8.3f} ms  p95={p95:8.3f} ms")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Benchmark bare requests.get against the pooled HttpClient')
+    arg_parser.add_argument('--url', help='Target URL (default: local stub server)')
+    arg_parser.add_argument('--requests', type=int, default=100, help='Requests per variant (default: 100)')
+    args = arg_parser.parse_args()
+
+    server = None
+    url = args.url
+    if not url:
+        server, url = start_stub_server()
+    print(f"Target: {url}  ({args.requests} requests per variant)")
+
+    summarize("requests.get (no pool)", measure(lambda u: requests.get(u, timeout=10), url, args.requests))
+
+    client = HttpClient(pool_size=4)
+    client.warm_up([url])
+    time.sleep(0.5)  # 等待预连接完成
+    summarize("HttpClient (pooled)", measure(lambda u: client.get(u, timeout=10), url, args.requests))
+    client.close()
+
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
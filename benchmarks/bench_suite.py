@@ -0,0 +1,397 @@
+"""
+热点路径基准测试套件: 价格响应处理、价格刷新、代币搜索、恐惧贪婪指数提取和启动加载
+
+全部离线运行：价格请求发往本地桩服务器，Qt 使用 offscreen 平台，用户数据和代币目录写入临时目录。
+结果保存为 JSON (每项记录 mean/median/p95/min，单位毫秒)，可与其他版本的结果比较。
+
+用法:
+    python benchmarks/bench_suite.py                              # 运行全部，结果写入 benchmarks/results/
+    python benchmarks/bench_suite.py --only update_ui --iterations 50
+    python benchmarks/bench_suite.py --output new.json --compare old.json
+    python benchmarks/bench_suite.py --list
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')  # 无显示环境下也能创建控件
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import BeraHelper  # noqa: E402
+from BeraHelper import (CompactCoinCatalog, FearGreedExtractor, PriceFeedCore,  # noqa: E402
+                        QApplication, TokenManagerDialog, TokenSearchIndex)
+from bench_fear_greed import FIXTURES, FIXTURES_DIR, iter_chunks  # noqa: E402
+
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+COIN_LIST_PATH = os.path.join(REPO_DIR, 'coingecko.list')
+SEARCH_QUERIES = ['b', 'be', 'bera', 'bit', 'bitcoin', 'eth', 'usd', 'doge', 'wrapped', 'zzzz-no-match']
+
+
+# ===================================
+# 本地桩服务器
+# ===================================
+
+class PriceStubHandler(BaseHTTPRequestHandler):
+    """模拟 CoinGecko simple/price：按请求的 ids 返回价格，相同查询的响应体只生成一次"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # 避免 Nagle + 延迟 ACK 给 keep-alive 连接带来 40ms 的人为延迟
+    bodies = {}
+
+    def do_GET(self):
+        body = self.bodies.get(self.path)
+        if body is None:
+            ids = parse_qs(urlsplit(self.path).query).get('ids', [''])[0].split(',')
+            body = json.dumps({token_id: {'usd': random.uniform(0.0001, 70000), 'usd_24h_change': random.uniform(-20, 20)}
+                               for token_id in ids if token_id}).encode('utf-8')
+            self.bodies[self.path] = body
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PriceStubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# ===================================
+# 测量与环境
+# ===================================
+
+def measure(func, iterations, setup=None, warmup=1):
+    """运行 func 若干次，返回耗时统计 (毫秒)；setup 在每次运行前调用，不计入耗时"""
+    samples = []
+    for i in range(warmup + iterations):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - start) * 1000
+        if i >= warmup:
+            samples.append(elapsed)
+    ordered = sorted(samples)
+    return {
+        'unit': 'ms',
+        'iterations': len(samples),
+        'mean': round(statistics.mean(samples), 4),
+        'median': round(statistics.median(samples), 4),
+        'p95': round(ordered[max(0, int(len(ordered) * 0.95) - 1)], 4),
+        'min': round(ordered[0], 4),
+        'stdev': round(statistics.stdev(samples), 4) if len(samples) > 1 else 0.0,
+    }
+
+
+def make_tokens(count, ratio_every=5):
+    """从 coingecko.list 中取前 count 个代币作为监控列表，每 ratio_every 个中有一个以 BERA 计价"""
+    with open(COIN_LIST_PATH, 'r', encoding='utf-8') as f:
+        catalog = json.load(f)
+    tokens = [{'id': 'berachain-bera', 'symbol': 'bera', 'name': 'Berachain', 'display_as_bera_ratio': False}]
+    for token in catalog:
+        if len(tokens) >= count:
+            break
+        if token['id'] != 'berachain-bera':
+            tokens.append({'id': token['id'], 'symbol': token['symbol'], 'name': token['name'],
+                           'display_as_bera_ratio': len(tokens) % ratio_every == 0})
+    return tokens
+
+
+class BenchFeed(PriceFeedCore):
+    """只含行情核心的测量对象：用户数据写入临时目录，价格请求发往桩服务器，不启用限流"""
+
+    def __init__(self, data_dir, price_url):
+        self.data_dir = data_dir
+        self.init_feed_state()
+        self.BERA_ID = 'berachain-bera'
+        self.PRICE_API_URL = price_url
+        self.setup_network({'rate_limit_per_minute': 0, 'warm_up': False}, lambda name, result: None)
+
+    def get_user_data_dir(self):
+        return self.data_dir
+
+
+class BenchApp(BeraHelper.BeraHelperApp):
+    """不显示、不启动后台获取的主窗口：用户数据写入临时目录"""
+
+    data_dir = None
+
+    def get_user_data_dir(self):
+        return self.data_dir
+
+
+class Environment:
+    """一次运行共用的临时目录、桩服务器、QApplication 和主窗口"""
+
+    def __init__(self):
+        self.tmp = tempfile.mkdtemp(prefix='bera-bench-')
+        self.server, base_url = start_stub_server()
+        self.price_url = base_url + '/api/v3/simple/price'
+        self.qt_app = QApplication.instance() or QApplication([])
+        self._window = None
+
+    @property
+    def window(self):
+        if self._window is None:
+            BenchApp.data_dir = self.tmp
+            BenchApp.PRICE_API_URL = self.price_url
+            self._window = BenchApp()
+            self._window.first_paint_done = True  # 不启动首次获取和目录加载
+            self._window.fear_greed_url = self.price_url
+        return self._window
+
+    def close(self):
+        if self._window is not None:
+            self._window.close_feed()
+            # 在解释器退出前销毁窗口，避免 Qt 对象在模块清理阶段才被释放
+            self._window.deleteLater()
+            self.qt_app.sendPostedEvents(None, 0)
+            self._window = None
+        self.server.shutdown()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+
+# ===================================
+# 基准项
+# ===================================
+
+def bench_get_prices(env, iterations):
+    """get_prices：分块请求、合并响应和缺失代币检查 (本地桩服务器，keep-alive)"""
+    results = {}
+    for count in (10, 100, 500):
+        feed = BenchFeed(env.tmp, env.price_url)
+        feed.user_tokens = make_tokens(count)
+        feed.update_cross_rate_watchlist()
+        results[f'get_prices[{count}]'] = measure(feed.get_prices, iterations)
+        feed.close_feed()
+    return results
+
+
+def bench_update_ui(env, iterations):
+    """update_price_display：格式化并更新 10/100/1000 个代币控件 (每次价格都变化，以及价格不变两种情况)"""
+    window = env.window
+    results = {}
+    for count in (10, 100, 1000):
+        window.user_tokens = make_tokens(count)
+        window.create_token_widgets()
+        base_prices = {token['id']: {'usd': random.uniform(0.0001, 70000), 'usd_24h_change': random.uniform(-20, 20)}
+                       for token in window.user_tokens}
+        ticks = []
+        for i in range(2):
+            scale = 1.01 if i else 0.99
+            ticks.append({token_id: {'usd': quote['usd'] * scale, 'usd_24h_change': quote['usd_24h_change'] * scale}
+                          for token_id, quote in base_prices.items()})
+        state = {'tick': 0}
+
+        def next_tick():
+            state['tick'] += 1
+            window.price_data = ticks[state['tick'] % 2]
+
+        results[f'update_ui[{count}]'] = measure(window.update_price_display, iterations, setup=next_tick)
+        window.price_data = ticks[0]
+        results[f'update_ui_unchanged[{count}]'] = measure(window.update_price_display, iterations)
+    return results
+
+
+def bench_search(env, iterations):
+    """代币管理器搜索：在完整 coingecko.list 上构建索引，并按不同查询刷新可用代币列表"""
+    catalog_path = os.path.join(env.tmp, 'coingecko.catalog')
+    with open(COIN_LIST_PATH, 'r', encoding='utf-8') as f:
+        tokens = json.load(f)
+    os.replace(CompactCoinCatalog.write(tokens, catalog_path, COIN_LIST_PATH), catalog_path)
+    catalog = CompactCoinCatalog.open(catalog_path, COIN_LIST_PATH)
+
+    results = {'search_index_build': measure(lambda: TokenSearchIndex(catalog, 1), max(3, iterations // 5), warmup=0)}
+    dialog = TokenManagerDialog()
+    dialog.load(make_tokens(10), TokenSearchIndex(catalog, 1))
+    dialog.search_input.blockSignals(True)  # 直接测量 fill_available_list，不经过 textChanged
+    for query in SEARCH_QUERIES:
+        dialog.search_input.setText(query)
+        results[f'fill_available_list[{query}]'] = measure(dialog.fill_available_list, iterations)
+    dialog.deleteLater()
+    catalog.close()
+    return results
+
+
+def bench_fear_greed(env, iterations):
+    """恐惧贪婪指数：对保存的页面夹具执行流式提取"""
+    results = {}
+    for name, expected in FIXTURES.items():
+        with open(os.path.join(FIXTURES_DIR, name), 'rb') as f:
+            data = f.read()
+        result = FearGreedExtractor.extract(iter_chunks(data))
+        if (result[0] if result else None) != expected:
+            raise RuntimeError(f"{name}: expected {expected}, extracted {result}")
+        results[f'fear_greed_extract[{name}]'] = measure(lambda: FearGreedExtractor.extract(iter_chunks(data)), iterations)
+    return results
+
+
+def bench_startup(env, iterations):
+    """启动加载：load_config，以及 load_available_tokens 的后台加载 (冷启动生成紧凑目录 / 内存映射已有目录)"""
+    window = env.window
+    iterations = max(3, iterations // 5)
+    results = {'load_config': measure(window.load_config, iterations, setup=window.close_feed)}
+
+    # 目录加载使用临时目录中的 coingecko.list 副本，紧凑目录也生成在临时目录，不写入用户数据目录
+    tokens_path = os.path.join(env.tmp, 'catalog', 'coingecko.list')
+    os.makedirs(os.path.dirname(tokens_path), exist_ok=True)
+    shutil.copy(COIN_LIST_PATH, tokens_path)
+    catalog_path = os.path.join(os.path.dirname(tokens_path), 'coingecko.catalog')
+    window._compact_catalog_path = lambda: catalog_path
+    original_resource_path = BeraHelper.resource_path
+    BeraHelper.resource_path = lambda relative_path: (tokens_path if relative_path == 'coingecko.list'
+                                                      else original_resource_path(relative_path))
+    loaded = []
+    window.catalog_ready.disconnect(window.handle_catalog_ready)
+    window.catalog_ready.connect(loaded.append)
+
+    def release():
+        while loaded:
+            compact = loaded.pop()['compact']
+            if compact is not None:
+                compact.close()
+
+    def cold_setup():
+        release()
+        if os.path.exists(catalog_path):
+            os.remove(catalog_path)
+
+    try:
+        results['load_available_tokens_cold'] = measure(window._load_catalog_thread, iterations, setup=cold_setup)
+        release()
+        results['load_available_tokens_warm'] = measure(window._load_catalog_thread, iterations, setup=release)
+        release()
+    finally:
+        BeraHelper.resource_path = original_resource_path
+        del window._compact_catalog_path
+        window.catalog_ready.disconnect(loaded.append)
+        window.catalog_ready.connect(window.handle_catalog_ready)
+    return results
+
+
+BENCHMARKS = {
+    'get_prices': bench_get_prices,
+    'update_ui': bench_update_ui,
+    'search': bench_search,
+    'fear_greed': bench_fear_greed,
+    'startup': bench_startup,
+}
+
+
+# ===================================
+# 结果保存与比较
+# ===================================
+
+def run_metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    import PySide6
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'pyside6': PySide6.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+    }
+
+
+def compare(results, baseline_path, threshold):
+    """按中位数与基线结果比较，打印变化百分比；返回超过阈值的回退项"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    old_results = baseline.get('results', {})
+    print(f"\nComparison against {baseline_path} (commit {baseline.get('meta', {}).get('commit')}), median ms:")
+    regressions = []
+    for name, current in results.items():
+        previous = old_results.get(name)
+        if previous is None:
+            print(f"  {name:<44} {'-':>10} {current['median']:10.3f}   (new)")
+            continue
+        change = (current['median'] - previous['median']) / previous['median'] * 100 if previous['median'] else 0.0
+        flag = ''
+        if change > threshold:
+            flag = 'REGRESSION'
+            regressions.append(name)
+        elif change < -threshold:
+            flag = 'improved'
+        print(f"  {name:<44} {previous['median']:10.3f} {current['median']:10.3f} {change:+8.1f}%  {flag}")
+    return regressions
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Run the BeraHelper hot-path benchmark suite offline')
+    arg_parser.add_argument('--only', action='append', choices=sorted(BENCHMARKS),
+                            help='Run only the given benchmark group (repeatable)')
+    arg_parser.add_argument('--iterations', type=int, default=20, help='Iterations per benchmark (default: 20)')
+    arg_parser.add_argument('--output', help='JSON result path (default: benchmarks/results/bench-<time>.json)')
+    arg_parser.add_argument('--compare', metavar='BASELINE', help='Compare medians against an earlier result file')
+    arg_parser.add_argument('--threshold', type=float, default=10.0,
+                            help='Percent change reported as a regression/improvement (default: 10)')
+    arg_parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                            help='Application log level while measuring; output is discarded (default: INFO, as in production)')
+    arg_parser.add_argument('--list', action='store_true', help='List benchmark groups and exit')
+    args = arg_parser.parse_args()
+
+    if args.list:
+        for name, func in BENCHMARKS.items():
+            print(f"{name:<12} {func.__doc__}")
+        return
+
+    # 按生产环境的日志级别运行 (日志调用的开销计入结果)，但不输出
+    root_logger = logging.getLogger()
+    root_logger.handlers[:] = [logging.NullHandler()]
+    root_logger.setLevel(args.log_level)
+    random.seed(0)
+
+    env = Environment()
+    results = {}
+    try:
+        for name in args.only or BENCHMARKS:
+            print(f"[{name}]")
+            group = BENCHMARKS[name](env, args.iterations)
+            for key, stats in group.items():
+                print(f"  {key:<44} median={stats['median']:9.3f} ms  p95={stats['p95']:9.3f} ms  min={stats['min']:9.3f} ms")
+            results.update(group)
+    finally:
+        env.close()
+
+    output = args.output or os.path.join(RESULTS_DIR, f"bench-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'meta': dict(run_metadata(), iterations=args.iterations, log_level=args.log_level),
+                   'results': results}, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0f}%")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
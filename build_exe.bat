@@ -99,6 +99,7 @@ if not exist %PYTHON_EXE% ( echo ERROR: Python executable not found at %PYTHON_E
 if not exist "%SCRIPT_FILE%" ( echo ERROR: Script file not found: %SCRIPT_FILE% & goto :error )
 if not exist "%ICON_FILE%" ( echo WARNING: Icon file not found: %ICON_FILE%. Building without icon. & set ICON_OPTION= ) else ( echo Icon found. & set ICON_OPTION=--icon="%ICON_FILE%" )
 
+rem requests/asyncio are imported lazily via importlib, so PyInstaller cannot detect them
 echo Running PyInstaller...
 %PYTHON_EXE% -m PyInstaller ^
     --name %OUTPUT_NAME% ^
@@ -108,6 +109,8 @@ echo Running PyInstaller...
     --add-data "%ICON_FILE%";"." ^
     --add-data "%CONFIG_FILE%";"." ^
     --add-data "%TOKEN_LIST_FILE%";"." ^
+    --hidden-import requests ^
+    --hidden-import asyncio ^
     %UPX_OPTION% ^
     --clean ^
     --log-level=INFO ^
@@ -0,0 +1,32 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from BeraHelper import PriceDaemon  # noqa: E402
+
+
+class PollTimeoutTest(unittest.TestCase):
+    """守护进程 /poll 的 timeout 参数解析"""
+
+    def test_default(self):
+        self.assertEqual(PriceDaemon.poll_timeout(None), PriceDaemon.POLL_TIMEOUT)
+
+    def test_clamped(self):
+        self.assertEqual(PriceDaemon.poll_timeout('2.5'), 2.5)
+        self.assertEqual(PriceDaemon.poll_timeout('-5'), 0.0)
+        self.assertEqual(PriceDaemon.poll_timeout('1e9'), PriceDaemon.MAX_POLL_TIMEOUT)
+
+    def test_rejects_non_finite(self):
+        for value in ('nan', 'NaN', 'inf', '-inf', 'Infinity'):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                PriceDaemon.poll_timeout(value)
+
+    def test_rejects_garbage(self):
+        with self.assertRaises(ValueError):
+            PriceDaemon.poll_timeout('soon')
+
+
+if __name__ == '__main__':
+    unittest.main()